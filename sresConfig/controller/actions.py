@@ -6,7 +6,7 @@ from sres.base.util.logging import lgm, exception_handled, log_timing
 from sres.data.inference import save_inference_results, load_inference_results
 from sres.base.gpu import save_memory_snapshot
 from sres.controller.config import TSet, ResultStructure
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Tuple, Optional
 from sres.view.plot.tiles  import ResultTilePlot
 from sres.view.plot.images import ResultImagePlot
 from sres.view.plot.training import TrainingPlot
@@ -35,14 +35,15 @@ class ActionController(object):
 									   epochs=self.epochs)
 		self.controller.train( models, **ccustom )
 	
-	def infer(self, model: str, time_index_bounds: List[int], **ccustom):
+	def infer(self, model: str, time_index_bounds: List[int], compiled: Optional[bool] = None, **ccustom):
 		controller = WorkflowController( self.cname, self.configuration, structure=self.data_structure,
 								  interp_loss=self.interp_loss )
 		data_structure = self.data_structure
 		controller.initialize( self.cname, model, **ccustom )
 
 		for timestep in list(range(*time_index_bounds)):
-			inference_data, eval_losses = controller.inference( timestep, data_structure, save=True )
+			ikwargs: Dict[str,Any] = {} if (compiled is None) else dict( compiled=compiled )
+			inference_data, eval_losses = controller.inference( timestep, data_structure, save=True, **ikwargs )
 
 			print( f"Inference results for {self.configuration['dataset']}:{self.configuration['task']} timestep={timestep}, format={data_structure.value}:")
 			for vname in inference_data.keys():
@@ -2,12 +2,14 @@ from sres.base.util.config import cfg
 from sres.base.util.logging import lgm, exception_handled, log_timing
 from torch import cuda
 import torch, os, time
+from typing import Optional
 
 def set_device() -> torch.device:
 	gpu_index = cfg().pipeline.gpu
 	device = torch.device(f'cuda:{gpu_index}' if cuda.is_available() else 'cpu')
 	if cuda.is_available():
 		cuda.set_device(device.index)
+		torch.backends.cudnn.benchmark = cfg().task.get( 'cudnn_benchmark', cfg().task.get('channels_last', False) )
 		if cfg().pipeline.memory_debug:
 			cuda.memory._record_memory_history()
 	else:
@@ -20,6 +22,12 @@ def get_device() -> torch.device:
 	device = torch.device(f'cuda:{gpu_index}' if torch.cuda.is_available() else 'cpu')
 	return device
 
+def memory_format() -> torch.memory_format:
+	return torch.channels_last if cfg().task.get('channels_last', False) else torch.contiguous_format
+
+def to_memory_format( tensor: torch.Tensor ) -> torch.Tensor:
+	return tensor.contiguous( memory_format=memory_format() ) if (tensor.dim() == 4) else tensor
+
 def memory_snapshot_path( ) -> str:
 	cpath = f"{cfg().platform.results}/memory/snapshot.{cfg().task.training_version}.pkl"
 	os.makedirs(os.path.dirname(cpath), 0o777, exist_ok=True)
@@ -31,3 +39,35 @@ def save_memory_snapshot():
 		mspath = memory_snapshot_path()
 		cuda.memory._dump_snapshot( mspath )
 		lgm().log(f" *** SAVE memory snapshot to {mspath}, dt={time.time()-t0:.4f} sec", display=True)
+
+def autocast_dtype( device: torch.device, precision: str ) -> Optional[torch.dtype]:
+	if precision == 'fp32': return None
+	if device.type == 'cuda':
+		if precision == 'fp16': return torch.float16
+		if precision in ['bf16','auto']: return torch.bfloat16 if cuda.is_bf16_supported() else torch.float16
+	elif precision in ['bf16','fp16','auto']:
+		return torch.bfloat16
+	raise Exception( f"Unknown precision mode: {precision}, must be one of fp32, bf16, fp16, auto" )
+
+class MixedPrecision(object):
+
+	def __init__(self, device: torch.device, precision: str = 'fp32' ):
+		self.device: torch.device = device
+		self.precision: str = precision
+		self.dtype: Optional[torch.dtype] = autocast_dtype( device, precision )
+		self.scaler = torch.amp.GradScaler( device.type, enabled=(self.dtype == torch.float16) )
+		lgm().log( f" *** MixedPrecision[{precision}]: device={device}, autocast dtype={self.dtype}, grad scaling={self.scaler.is_enabled()}" )
+
+	@property
+	def enabled(self) -> bool:
+		return self.dtype is not None
+
+	def autocast(self) -> torch.autocast:
+		return torch.autocast( self.device.type, dtype=self.dtype, enabled=self.enabled )
+
+	def backward(self, loss: torch.Tensor ):
+		self.scaler.scale( loss ).backward()
+
+	def step(self, optimizer: torch.optim.Optimizer ):
+		self.scaler.step( optimizer )
+		self.scaler.update()
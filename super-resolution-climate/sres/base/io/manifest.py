@@ -0,0 +1,95 @@
+import os, json, hashlib, time
+from glob import glob
+from parse import parse
+from typing import Any, Dict, List, Optional, Tuple
+from omegaconf import DictConfig, OmegaConf
+from sres.base.util.config import cfg, config
+from sres.base.util.logging import lgm
+
+_path_templates: Dict[Tuple[str,...],Tuple[DictConfig,str]] = {}
+
+def dataset_path( **params ) -> str:
+	# The file path template is resolved once per configuration (with '{param}' placeholders) and then formatted with params.
+	key: Tuple[str,...] = tuple( sorted( params.keys() ) )
+	entry: Optional[Tuple[DictConfig,str]] = _path_templates.get( key )
+	if (entry is None) or (entry[0] is not cfg()):
+		dcfg: DictConfig = OmegaConf.merge( cfg(), dict( dataset={ pname: f"{{{pname}}}" for pname in key } ) )
+		entry = _path_templates[key] = ( cfg(), f"{dcfg.dataset.dataset_root}/{dcfg.dataset.dataset_files}" )
+	return entry[1].format( **params )
+
+class DatasetManifest(object):
+	"""
+	Persistent listing of the files matching a dataset file glob (wildcard in the filename only),
+	holding the parsed time index, size and mtime of each file.  The manifest is cached under
+	platform.cache and is refreshed incrementally: the directory is only re-listed when its mtime
+	changes, and only new files are stat'ed.
+	"""
+	_manifests: Dict[str,"DatasetManifest"] = {}
+
+	def __init__(self, file_glob: str ):
+		self.file_glob: str = file_glob
+		self.directory, fname = os.path.split( file_glob )
+		self.template: str = fname.replace( "*", "{}" )
+		key: str = hashlib.sha1( file_glob.encode() ).hexdigest()[:16]
+		self.manifest_file: str = f"{cfg().platform.cache}/manifests/manifest.{config().get('dataset','')}.{key}.json"
+		self.dir_mtime: float = -1.0
+		self.entries: Dict[str,Dict[str,Any]] = {}
+		self._read()
+
+	@classmethod
+	def get(cls, file_glob: str ) -> "DatasetManifest":
+		if file_glob not in cls._manifests:
+			cls._manifests[file_glob] = DatasetManifest( file_glob )
+		return cls._manifests[file_glob].refresh()
+
+	def _read(self):
+		if os.path.exists( self.manifest_file ):
+			with open( self.manifest_file ) as f:
+				mdata: Dict[str,Any] = json.load( f )
+			if mdata.get('file_glob') == self.file_glob:
+				self.dir_mtime, self.entries = mdata['dir_mtime'], mdata['entries']
+
+	def _write(self):
+		os.makedirs( os.path.dirname(self.manifest_file), 0o777, exist_ok=True )
+		tmp_path = f"{self.manifest_file}.{os.getpid()}.tmp"
+		with open( tmp_path, 'w' ) as f:
+			json.dump( dict( file_glob=self.file_glob, dir_mtime=self.dir_mtime, entries=self.entries ), f )
+		os.replace( tmp_path, self.manifest_file )
+
+	def _list(self) -> List[str]:
+		if "*" in self.directory:
+			return [ os.path.relpath( fpath, self.directory ) for fpath in glob( self.file_glob ) ]
+		with os.scandir( self.directory ) as entries:
+			return [ entry.name for entry in entries ]
+
+	def refresh(self) -> "DatasetManifest":
+		dir_mtime: float = os.stat( self.directory ).st_mtime if ("*" not in self.directory) else time.time()
+		if dir_mtime != self.dir_mtime:
+			t0, nnew, current = time.time(), 0, {}
+			for fname in self._list():
+				if fname in self.entries:
+					current[fname] = self.entries[fname]
+				else:
+					presult = parse( self.template, fname )
+					if presult is not None:
+						fstat = os.stat( os.path.join( self.directory, fname ) )
+						current[fname] = dict( index=int(presult[0]), size=fstat.st_size, mtime=fstat.st_mtime )
+						nnew += 1
+			nremoved = len( set(self.entries.keys()).difference( current.keys() ) )
+			self.entries, self.dir_mtime = current, dir_mtime
+			self._write()
+			lgm().log( f" *** DatasetManifest[{self.file_glob}]: {len(self.entries)} files ({nnew} new, {nremoved} removed), time={time.time()-t0:.2f} sec" )
+		return self
+
+	@property
+	def indices(self) -> List[int]:
+		return sorted( entry['index'] for entry in self.entries.values() )
+
+	@property
+	def size(self) -> int:
+		return len( self.entries )
+
+	def file_size(self, index: int ) -> int:
+		for entry in self.entries.values():
+			if entry['index'] == index: return entry['size']
+		raise Exception( f"DatasetManifest[{self.file_glob}]: no file with index {index}" )
@@ -277,6 +277,18 @@ class SRBatch:
 	def load_timeslice(self, ctime: Union[datetime, int], **kwargs) -> xa.DataArray:
 		return self.data_loader.load_timeslice(ctime, **kwargs)
 
+	def read_timeslice(self, ctime: Union[datetime, int]) -> xa.DataArray:
+		return self.data_loader.read_timeslice(ctime)
+
+	def read_region(self, ctime: Union[datetime, int]) -> xa.DataArray:
+		return self.data_loader.read_region(ctime)
+
+	def prepare_norms(self):
+		self.data_loader.prepare_norms()
+
+	def norm_arrays(self, scope: str, channels: List[str] ) -> Dict[str,np.ndarray]:
+		return self.data_loader.norm_arrays( scope, channels )
+
 	def load_batch(self, ctile: Dict[str,int], ctime: Union[datetime,int]) -> Optional[xa.DataArray]:
 		if self.batch_domain == batchDomain.Time:
 			if type(ctime) == datetime:
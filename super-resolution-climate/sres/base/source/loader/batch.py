@@ -24,6 +24,18 @@ class SRDataLoader(object):
 	def load_timeslice(self, time_index: int, **kwargs) -> xa.DataArray:
 		raise NotImplementedError("SRDataLoader:load_timeslice")
 
+	def read_timeslice(self, time_index: int) -> xa.DataArray:
+		raise NotImplementedError("SRDataLoader:read_timeslice")
+
+	def read_region(self, time_index: int) -> xa.DataArray:
+		raise NotImplementedError("SRDataLoader:read_region")
+
+	def prepare_norms(self):
+		pass
+
+	def norm_arrays(self, scope: str, channels: List[str] ) -> Dict[str,np.ndarray]:
+		raise NotImplementedError("SRDataLoader:norm_arrays")
+
 	def load_tile_batch(self, tile_range: Tuple[int,int] ) -> Optional[xa.DataArray]:
 		raise NotImplementedError("SRDataLoader:load_tile_batch")
 
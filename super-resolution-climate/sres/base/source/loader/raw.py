@@ -25,6 +25,18 @@ class SRRawDataLoader(object):
 	def load_timeslice(self, **kwargs) -> xa.DataArray:
 		raise NotImplementedError("SRRawDataLoader:load_timeslice")
 
+	def read_timeslice(self, time_index: int) -> xa.DataArray:
+		raise NotImplementedError("SRRawDataLoader:read_timeslice")
+
+	def read_region(self, time_index: int) -> xa.DataArray:
+		raise NotImplementedError("SRRawDataLoader:read_region")
+
+	def prepare_norms(self):
+		pass
+
+	def norm_arrays(self, scope: str, channels: List[str] ) -> Dict[str,np.ndarray]:
+		raise NotImplementedError("SRRawDataLoader:norm_arrays")
+
 	def get_batch_time_indices(self, **kwargs) -> xa.DataArray:
 		raise NotImplementedError("SRRawDataLoader:get_batch_time_indices")
 	@property
@@ -14,6 +14,7 @@ from sres.base.io.loader import data_suffix, path_suffix
 from sres.base.util.logging import lgm, exception_handled, log_timing
 from sres.base.io.loader import srRes, TSet
 from sres.base.source.loader.batch import SRDataLoader, FMDataLoader
+from sres.base.io.manifest import DatasetManifest, dataset_path
 import numpy as np
 
 S = 'x'
@@ -82,18 +83,13 @@ class S3ExportDataLoader(SRDataLoader):
 		return fpath, dindx
 
 	def dataset_glob(self, varname: str) -> str:
-		root: str = cfg().dataset.dataset_root
 		usf: int = math.prod(cfg().model.downscale_factors)
-		dset_params = dict( varname=varname, index=f"*", usf=usf )
-		for k,v in dset_params.items(): cfg().dataset[k] = v
-		subpath: str = cfg().dataset.dataset_files
-		fglob = f"{root}/{subpath}"
-		return fglob
+		return dataset_path( varname=varname, index=f"*", usf=usf )
 
 	def get_dset_size(self) -> int:
 		varname: Tuple[str,str] = list(self.varnames.items())[0]
 		dsglob = self.dataset_glob( varname[0] )
-		dss = len( glob(dsglob) )
+		dss = DatasetManifest.get( dsglob ).size
 		print( f" ************ get_dset_size: glob='{dsglob}', size={dss}")
 		return dss
 
@@ -1,4 +1,4 @@
-import xarray as xa, math, os
+import xarray as xa, math, os, numpy as np
 from sres.base.util.config import cfg
 from omegaconf import DictConfig
 from .raw import SWOTRawDataLoader
@@ -21,10 +21,25 @@ class SWOTDataLoader(SRDataLoader):
 	def load_timeslice(self, time_index: int, **kwargs) -> xa.DataArray:
 		return self.loader.load_timeslice(time_index, **kwargs)
 
+	def read_timeslice(self, time_index: int) -> xa.DataArray:
+		return self.loader.read_timeslice(time_index)
+
+	def read_region(self, time_index: int) -> xa.DataArray:
+		return self.loader.read_region(time_index)
+
 	def load_tile_batch(self, tile_range: Tuple[int,int] ) -> Optional[xa.DataArray]:
 		tile_batch: xa.DataArray = self.loader.select_batch( tile_range )
 		return tile_batch
 
+	def build_tile_cache(self):
+		self.loader.build_tile_cache()
+
+	def prepare_norms(self):
+		self.loader.prepare_norms()
+
+	def norm_arrays(self, scope: str, channels: List[str] ) -> Dict[str,np.ndarray]:
+		return self.loader.norm_arrays( scope, channels )
+
 	def get_batch_time_indices(self):
 		return self.loader.get_batch_time_indices()
 
@@ -1,5 +1,7 @@
 from sres.base.source.loader.raw import SRRawDataLoader
-import xarray as xa, math, os, pickle
+import xarray as xa, math, os, pickle, time, threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from sres.base.util.config import cfg, config
 from sres.base.io.loader import ncFormat
 from ...controller.config import TSet
@@ -7,19 +9,23 @@ from omegaconf import DictConfig, OmegaConf
 from xarray.core.dataset import DataVariables
 from nvidia.dali import fn
 from enum import Enum
-from glob import glob
 from typing import Any, Mapping, Sequence, Tuple, Union, List, Dict, Literal, Optional
 from sres.base.io.loader import data_suffix, path_suffix
 from sres.base.util.logging import lgm, exception_handled, log_timing
-from .util import mds2d
-from glob import glob
-from parse import parse
+from sres.base.io.manifest import DatasetManifest, dataset_path
+from .util import roi_bounds, llc_roi_index, save_index_array
 import numpy as np
 
 STATS = ['mean', 'var', 'max', 'min']
-def xanorm( ndata: Dict[int, np.ndarray] ) -> xa.DataArray:
-	npdata = np.stack( list(ndata.values()), axis=0 )
-	return xa.DataArray( npdata, dims=['tiles','stat'], coords=dict(tiles=list(ndata.keys()), stat=STATS))
+TILE_CACHE_DTYPE = np.float32
+_stats_loader: Optional['SWOTRawDataLoader'] = None
+
+def tile_stats( tiles: np.ndarray ) -> np.ndarray:
+	axes = (2,3)
+	return np.stack( [ tiles.mean(axis=axes, dtype=np.float64), tiles.var(axis=axes, dtype=np.float64), tiles.max(axis=axes), tiles.min(axis=axes) ], axis=-1 )
+
+def timeslice_norm_stats( time_index: int ) -> Tuple[int,np.ndarray]:
+	return time_index, tile_stats( _stats_loader.read_timeslice( time_index ).values )
 
 def globalize_norm( data: xa.DataArray ) -> xa.DataArray:
 	results = []
@@ -30,38 +36,68 @@ def globalize_norm( data: xa.DataArray ) -> xa.DataArray:
 		else:               results.append(dslice.mean())
 	return xa.DataArray( results, dims=['stat'], coords=dict(stat=STATS))
 
-def filepath() -> str:
-	return f"{cfg().dataset.dataset_root}/{cfg().dataset.dataset_files}"
-
 def template() -> str:
 	return f"{cfg().dataset.dataset_root}/{cfg().dataset.template}"
 
-def subset_roi( global_data: np.ndarray ) -> np.ndarray:
-	roi = cfg().dataset.get('roi',None)
-	if roi is None: return global_data
-	x0, xs = roi.get('x0',0), roi.get( 'xs', global_data.shape[-1] )
-	y0, ys = roi.get('y0', 0), roi.get('ys', global_data.shape[-2])
-	result = global_data[..., y0:y0+ys, x0:x0+xs]
-	print( f"subset_roi: {global_data.shape} -> {result.shape}, origin=[{y0:.2f},{x0:.2f}], roi = {roi}")
-	return result
-class NormData:
-
-	def __init__(self, itile: int):
-		self.itile = itile
-		self.means: List[float] = []
-		self.vars: List[float] = []
-		self.max: float = -float("inf")
-		self.min: float = float("inf")
-
-	def add_entry(self, tiles_data: xa.DataArray ):
-		tdata: np.ndarray = tiles_data.isel(tiles=self.itile).values.squeeze()
-		self.means.append(tdata.mean())
-		self.vars.append(tdata.var())
-		self.max = max( self.max, tdata.max() )
-		self.min = min( self.min, tdata.min() )
-
-	def get_norm_stats(self) -> np.ndarray:
-		return  np.array( [ np.array(self.means).mean(), np.array(self.vars).mean(), np.array(self.max).max(), np.array(self.min).min() ] )
+def roi_tag() -> str:
+	bnds = roi_bounds( cfg().dataset.get('roi',None), cfg().dataset.get('nx',4320) )
+	return f"y{bnds['y'][0]}-{bnds['y'][1]}.x{bnds['x'][0]}-{bnds['x'][1]}"
+
+def llc_index_dir() -> str:
+	return f"{cfg().platform.cache}/llc_index/{config()['dataset']}.{roi_tag()}"
+
+def tile_cache_dir( varnames: Sequence[str] ) -> str:
+	tsize, origin, tgrid = cfg().task.tile_size, cfg().task.get('origin',{}), cfg().task.tile_grid
+	usf = math.prod( cfg().model.downscale_factors )
+	ttag = f"t{tsize['y']*usf}x{tsize['x']*usf}.o{origin.get('y',0)}-{origin.get('x',0)}.g{tgrid['y']}-{tgrid['x']}"
+	vtag = f"v{'-'.join(sorted(varnames))}.{np.dtype(TILE_CACHE_DTYPE).name}"
+	return f"{cfg().platform.cache}/tiles/{config()['dataset']}.{roi_tag()}.{ttag}.{vtag}"
+
+class NormAccumulator:
+
+	def __init__(self, channels: List[str] ):
+		self.channels: List[str] = channels
+		self.completed: List[int] = []
+		self.sums: Optional[np.ndarray] = None
+		self.max: Optional[np.ndarray] = None
+		self.min: Optional[np.ndarray] = None
+
+	def add_entry(self, time_index: int, tstats: np.ndarray ):
+		if self.sums is None:
+			self.sums = tstats[...,:2].astype(np.float64)
+			self.max, self.min = tstats[...,2].copy(), tstats[...,3].copy()
+		else:
+			self.sums += tstats[...,:2]
+			self.max = np.maximum( self.max, tstats[...,2] )
+			self.min = np.minimum( self.min, tstats[...,3] )
+		self.completed.append( time_index )
+
+	def save(self, spath: str ):
+		if self.sums is None: return
+		dims = ['tiles','channels']
+		state = xa.Dataset( dict( sums=xa.DataArray( self.sums, dims=dims+['moment'] ), max=xa.DataArray( self.max, dims=dims ), min=xa.DataArray( self.min, dims=dims ),
+		                          completed=xa.DataArray( np.array(self.completed), dims=['time'] ) ), coords=dict( channels=self.channels, moment=STATS[:2] ) )
+		tmp_path = f"{spath}.{os.getpid()}.tmp"
+		state.to_netcdf( tmp_path, format="NETCDF4", mode="w" )
+		os.replace( tmp_path, spath )
+
+	@classmethod
+	def load(cls, spath: str, channels: List[str] ) -> 'NormAccumulator':
+		accum = NormAccumulator( channels )
+		if os.path.exists( spath ):
+			with xa.open_dataset( spath, engine='netcdf4' ) as state:
+				if state.coords['channels'].values.tolist() == channels:
+					accum.sums, accum.max, accum.min = state['sums'].values, state['max'].values, state['min'].values
+					accum.completed = state['completed'].values.tolist()
+					print( f"Resuming norm stats computation from {spath}: {len(accum.completed)} timeslices completed")
+		return accum
+
+	def get_norm_stats(self) -> xa.Dataset:
+		ntiles: int = self.sums.shape[0]
+		means: np.ndarray = self.sums / len(self.completed)
+		stats: np.ndarray = np.stack( [ means[...,0], means[...,1], self.max, self.min ], axis=-1 )
+		coords = dict( tiles=np.arange(ntiles), stat=STATS )
+		return xa.Dataset( { vn: xa.DataArray( stats[:,ic], dims=['tiles','stat'], coords=coords ) for ic, vn in enumerate(self.channels) } )
 
 class SWOTRawDataLoader(SRRawDataLoader):
 
@@ -73,7 +109,12 @@ class SWOTRawDataLoader(SRRawDataLoader):
 		self.time_index: int = -1
 		self.timeslice: Optional[xa.DataArray] = None
 		self.norm_data_file = f"{cfg().platform.cache}/norm_data/norms/norms.{config()['dataset']}.nc"
+		self.norm_partial_file = f"{cfg().platform.cache}/norm_data/norms/norms.{config()['dataset']}.partial.nc"
 		self._norm_stats: Optional[xa.Dataset]  = None
+		self.use_memmap: bool = task_config.get('use_memmap', False)
+		self.tile_cache: bool = task_config.get('tile_cache', False)
+		self._roi_index: Optional[Tuple[np.ndarray,np.ndarray,Tuple[int,int]]] = None
+		self._norm_arrays: Dict[Tuple[str,Tuple[str,...]],Dict[str,np.ndarray]] = {}
 		os.makedirs( os.path.dirname(self.norm_data_file), 0o777, exist_ok=True )
 
 	def _write_norm_stats(self, norm_stats: xa.Dataset ):
@@ -88,29 +129,38 @@ class SWOTRawDataLoader(SRRawDataLoader):
 			return norm_stats
 
 	def _compute_normalization(self) -> xa.Dataset:
+		global _stats_loader
 		time_indices = self.get_batch_time_indices()
-		norm_data: Dict[Tuple[str,int], NormData] = {}
-		print( f"Computing norm stats (no stats file found at {self.norm_data_file})")
-		for tidx in time_indices:
-			vardata: List[np.ndarray] = [ self.load_file( varname, tidx ) for varname in self.varnames ]
-			tiles_data: xa.DataArray = self.get_tiles( vardata )
-			for itile in range(tiles_data.sizes['tiles']):
-				for varname in self.varnames:
-					var_ndata = tiles_data.sel(channels=varname)
-					norm_entry: NormData = norm_data.setdefault((varname,itile), NormData(itile))
-					norm_entry.add_entry( var_ndata )
-		vtstats: Dict[str,Dict[int,np.ndarray]] = {}
-		for (varname,itile), nd in norm_data.items():
-			nstats: np.ndarray = nd.get_norm_stats()
-			ns = vtstats.setdefault(varname,{})
-			ns[itile] = nstats
-		return xa.Dataset( { vn: xanorm(ndata) for vn, ndata in vtstats.items() } )
+		accum = NormAccumulator.load( self.norm_partial_file, list(self.varnames.keys()) )
+		pending: List[int] = sorted( set(time_indices).difference( accum.completed ) )
+		nworkers: int = cfg().task.get( 'norm_workers', 1 )
+		if mp.current_process().daemon: nworkers = 1
+		save_period: int = cfg().task.get( 'norm_save_period', 16 )
+		print( f"Computing norm stats for {len(pending)}/{len(time_indices)} timeslices with {nworkers} workers (no stats file found at {self.norm_data_file})")
+		try:
+			if nworkers > 1:
+				_stats_loader = self
+				with ProcessPoolExecutor( nworkers, mp_context=mp.get_context('fork') ) as executor:
+					futures = [ executor.submit( timeslice_norm_stats, tidx ) for tidx in pending ]
+					for icomplete, future in enumerate( as_completed(futures) ):
+						accum.add_entry( *future.result() )
+						if (icomplete+1) % save_period == 0: accum.save( self.norm_partial_file )
+			else:
+				for icomplete, tidx in enumerate( pending ):
+					accum.add_entry( tidx, tile_stats( self.read_timeslice(tidx).values ) )
+					if (icomplete+1) % save_period == 0: accum.save( self.norm_partial_file )
+		finally:
+			_stats_loader = None
+			accum.save( self.norm_partial_file )
+		return accum.get_norm_stats()
 
 	def _get_norm_stats(self) -> xa.Dataset:
 		norm_stats: xa.Dataset = self._read_norm_stats()
 		if norm_stats is None:
 			norm_stats: xa.Dataset = self._compute_normalization()
 			self._write_norm_stats(norm_stats)
+			if os.path.exists( self.norm_partial_file ):
+				os.remove( self.norm_partial_file )
 		return norm_stats
 
 	@property
@@ -124,32 +174,93 @@ class SWOTRawDataLoader(SRRawDataLoader):
 		return self.norm_stats.map( globalize_norm )
 
 	def get_batch_time_indices(self):
-		cfg().dataset.index = "*"
-		cfg().dataset['varname'] = list(self.varnames.keys())[0]
-		files = [ fpath.split("/")[-1] for fpath in  glob( filepath() ) ]
-		template = filepath().replace("*",'{}').split("/")[-1]
-		indices = [ int(parse(template,f)[0]) for f in files ]
-		return indices
+		fglob: str = dataset_path( varname=list(self.varnames.keys())[0], index="*" )
+		return DatasetManifest.get( fglob ).indices
+
+	@property
+	def roi_index(self) -> Tuple[np.ndarray,np.ndarray,Tuple[int,int]]:
+		if self._roi_index is None:
+			t0, index_dir = time.time(), llc_index_dir()
+			bnds = roi_bounds( cfg().dataset.get('roi',None), cfg().dataset.get('nx',4320) )
+			roi_shape = ( bnds['y'][1]-bnds['y'][0], bnds['x'][1]-bnds['x'][0] )
+			ipaths = { iname: f"{index_dir}/{iname}.npy" for iname in ['offsets','positions'] }
+			if not all( os.path.exists(ipath) for ipath in ipaths.values() ):
+				print( f"Computing llc roi index (no index found at {index_dir})")
+				offsets, positions, roi_shape = llc_roi_index( template(), cfg().dataset.get('roi',None), cfg().dataset.get('nx',4320) )
+				save_index_array( ipaths['offsets'], offsets )
+				save_index_array( ipaths['positions'], positions )
+			offsets, positions = [ np.load( ipaths[iname], mmap_mode='r' ) for iname in ['offsets','positions'] ]
+			self._roi_index = ( offsets, positions, roi_shape )
+			lgm().log( f" *** Loaded llc roi index from {index_dir}: nvalues={offsets.size}, roi_shape={roi_shape}, time={time.time()-t0:.2f} sec", display=True)
+		return self._roi_index
 
 	def load_file( self,  varname: str, time_index: int ) -> np.ndarray:
-		for cparm, value in dict(varname=varname, index=time_index).items():
-			cfg().dataset[cparm] = value
-		var_template: np.ndarray = np.fromfile(template(), '>f4')
-		var_data: np.ndarray = np.fromfile(filepath(), '>f4')
-		mask = (var_template != 0)
-		var_template[mask] = var_data
-		var_template[~mask] = np.nan
-		sss_east, sss_west = mds2d(var_template)
-		result = np.expand_dims( np.c_[sss_east, sss_west.T[::-1, :]], 0)
-		roi_data = subset_roi(result)
-		lgm().log( f" *** load_file: var_template{var_template.shape} var_data{var_data.shape} mask nz={np.count_nonzero(mask)}, result{roi_data.shape}, file={filepath()}", display=True)
-		return roi_data
+		fpath: str = dataset_path( varname=varname, index=time_index )
+		offsets, positions, roi_shape = self.roi_index
+		var_data: np.ndarray = np.memmap( fpath, dtype='>f4', mode='r' ) if self.use_memmap else np.fromfile( fpath, '>f4' )
+		roi_data: np.ndarray = np.full( roi_shape, np.nan, dtype=np.float32 )
+		roi_data.flat[positions] = var_data[offsets]
+		lgm().log( f" *** load_file: var_data{var_data.shape} nvalues={offsets.size}, result{roi_data.shape}, file={fpath}", display=True)
+		return np.expand_dims( roi_data, 0 )
+
+	def cached_tiles_paths(self, time_index: int ) -> Dict[str,str]:
+		cache_dir = tile_cache_dir( list(self.varnames) )
+		return dict( tiles=f"{cache_dir}/{time_index}.tiles.npy", meta=f"{cache_dir}/{time_index}.meta.npz" )
+
+	def read_cached_tiles(self, time_index: int ) -> Optional[xa.DataArray]:
+		cpaths = self.cached_tiles_paths( time_index )
+		if os.path.exists( cpaths['tiles'] ):
+			tiles: np.memmap = np.load( cpaths['tiles'], mmap_mode='r' )
+			with np.load( cpaths['meta'] ) as meta:
+				tile_idxs, grid_shape = meta['tile_idxs'], meta['grid_shape']
+			lgm().log( f" *** read_cached_tiles[{time_index}]: tiles{tiles.shape} from {cpaths['tiles']}" )
+			return self.tiles_array( tiles, tile_idxs, dict( y=int(grid_shape[0]), x=int(grid_shape[1]) ) )
+
+	def write_cached_tiles(self, time_index: int, timeslice: xa.DataArray ):
+		cpaths = self.cached_tiles_paths( time_index )
+		grid_shape: Dict[str,int] = timeslice.attrs['grid_shape']
+		os.makedirs( os.path.dirname(cpaths['tiles']), 0o777, exist_ok=True )
+		tmp_path = f"{cpaths['meta']}.{os.getpid()}.{threading.get_ident()}.tmp"
+		with open( tmp_path, 'wb' ) as f:
+			np.savez( f, tile_idxs=timeslice.coords['tiles'].values, grid_shape=np.array( [ grid_shape['y'], grid_shape['x'] ] ) )
+		os.replace( tmp_path, cpaths['meta'] )
+		save_index_array( cpaths['tiles'], np.ascontiguousarray( timeslice.values, dtype=TILE_CACHE_DTYPE ) )
+		lgm().log( f" *** write_cached_tiles[{time_index}]: tiles{timeslice.shape} to {cpaths['tiles']}" )
+
+	def build_tile_cache(self):
+		time_indices = self.get_batch_time_indices()
+		t0, nbuilt = time.time(), 0
+		for tidx in time_indices:
+			if not os.path.exists( self.cached_tiles_paths( tidx )['tiles'] ):
+				vardata: List[np.ndarray] = [ self.load_file( varname, tidx ) for varname in self.varnames ]
+				self.write_cached_tiles( tidx, self.get_tiles( vardata ) )
+				nbuilt += 1
+		lgm().log( f" *** build_tile_cache: wrote {nbuilt}/{len(time_indices)} timeslices to {tile_cache_dir( list(self.varnames) )}, time={time.time()-t0:.2f} sec", display=True )
+
+	def read_timeslice(self, time_index: int) -> xa.DataArray:
+		if self.tile_cache:
+			timeslice: Optional[xa.DataArray] = self.read_cached_tiles( time_index )
+			if timeslice is not None: return timeslice
+		vardata: List[np.ndarray] = [ self.load_file( varname, time_index ) for varname in self.varnames ]
+		timeslice: xa.DataArray = self.get_tiles( vardata )
+		if self.tile_cache:
+			self.write_cached_tiles( time_index, timeslice )
+		return timeslice
+
+	def read_region(self, time_index: int) -> xa.DataArray:
+		raw_data: np.ndarray = np.concatenate( [ self.load_file( varname, time_index ) for varname in self.varnames ], axis=0 )
+		ishape = dict(c=raw_data.shape[0], y=raw_data.shape[1], x=raw_data.shape[2])
+		roi: Dict[str, Tuple[int,int]] = self.tile_grid.get_active_region(image_shape=ishape)
+		region_data: np.ndarray = raw_data[..., roi['y'][0]:roi['y'][1], roi['x'][0]:roi['x'][1]]
+		return xa.DataArray( region_data, dims=["channels", "y", "x"], coords=dict(channels=self.varnames) )
 
 	def load_timeslice(self, time_index: int, **kwargs) -> xa.DataArray:
 		if time_index != self.time_index:
-			vardata: List[np.ndarray] = [ self.load_file( varname, time_index ) for varname in self.varnames ]
-			self.timeslice = self.get_tiles( vardata )
-			lgm().log( f"\nLoaded timeslice{self.timeslice.dims} shape={self.timeslice.shape}, mean={np.nanmean(self.timeslice.values):.2f}, std={np.nanstd(self.timeslice.values):.2f}", display=True)
+			self.timeslice = kwargs.get( 'timeslice', None )
+			if self.timeslice is None:
+				self.timeslice = self.read_timeslice( time_index )
+			tstats = "" if self.tile_cache else f", mean={np.nanmean(self.timeslice.values):.2f}, std={np.nanstd(self.timeslice.values):.2f}"
+			lgm().log( f"\nLoaded timeslice{self.timeslice.dims} shape={self.timeslice.shape}{tstats}", display=True)
 			self.time_index = time_index
 		return self.timeslice
 
@@ -162,50 +273,48 @@ class SWOTRawDataLoader(SRRawDataLoader):
 			result = self.norm( batch, (tile_range[0],slice_end) )
 			return result
 
+	def norm_arrays(self, scope: str, channels: List[str] ) -> Dict[str,np.ndarray]:
+		key = ( scope, tuple(channels) )
+		if key not in self._norm_arrays:
+			nstats: xa.Dataset = self.norm_stats if (scope == 'tiles') else self.global_norm_stats
+			sarray: np.ndarray = np.stack( [ nstats.data_vars[channel].transpose(...,'stat').values for channel in channels ], axis=-2 )
+			narrays = { stat: np.ascontiguousarray( sarray[...,istat], dtype=np.float32 ) for istat, stat in enumerate(STATS) }
+			narrays['std'] = np.sqrt( narrays['var'] )
+			self._norm_arrays[key] = narrays
+		return self._norm_arrays[key]
+
+	def prepare_norms(self):
+		# Computes (or reads) and caches the norm arrays required by task.norm, e.g. before forking DataLoader workers.
+		ntype: str = cfg().task.norm
+		channels: List[str] = list( self.varnames )
+		if ntype in ['gnorm','gscale']:   self.norm_arrays( 'global', channels )
+		elif ntype in ['tnorm','tscale']: self.norm_arrays( 'tiles', channels )
+
 	def norm(self, batch_data: xa.DataArray, tile_range: Tuple[int,int] ) -> xa.DataArray:
-		channel_data = []
 		ntype: str = cfg().task.norm
-		ncstats: Dict[str,List[np.ndarray]] = {}
-		channels: xa.DataArray = batch_data.coords['channels']
-		for channel in channels.values:
-			batch: xa.DataArray = batch_data.sel(channels=channel)
-			bdims = [ batch.shape[0], 1, 1, 1]
-			if ntype == 'lnorm':
-				bmean, bstd = batch.mean(dim=["x", "y"], skipna=True, keep_attrs=True), batch.std(dim=["x", "y"], skipna=True, keep_attrs=True)
-				ncstats.setdefault('mean',[]).append( bmean.values.reshape(bdims) )
-				ncstats.setdefault('std', []).append(  bstd.values.reshape(bdims) )
-				channel_data.append( (batch - bmean) / bstd )
-			elif ntype == 'lscale':
-				bmax, bmin = batch.max(dim=["x", "y"], skipna=True, keep_attrs=True), batch.min(dim=["x", "y"], skipna=True, keep_attrs=True)
-				ncstats.setdefault('max',[]).append( bmax.values.reshape(bdims) )
-				ncstats.setdefault('min',[]).append( bmin.values.reshape(bdims) )
-				channel_data.append(  (batch - bmin) / (bmax-bmin) )
-			elif ntype == 'gnorm':
-				gstats: xa.DataArray = self.global_norm_stats.data_vars[channel]
-				gmean, gstd = gstats.sel(stat='mean'), np.sqrt( gstats.sel(stat='var') )
-				print( f"gnorm: gmean = {gmean.values}, gstd = {gstd.values}, batch mean = {batch.values.mean():.2f}, std = {batch.values.std():.2f}")
-				channel_data.append(  (batch - gmean) / gstd )
-			elif ntype == 'gscale':
-				gstats: xa.DataArray = self.global_norm_stats.data_vars[channel]
-				vmin, vmax = gstats.sel(stat='min'), gstats.sel(stat='max')
-				channel_data.append(  (batch - vmin) / (vmax - vmin) )
-			elif ntype == 'tnorm':
-				tstats: xa.DataArray = self.norm_stats.data_vars[channel]
-				tmean, tstd = tstats.sel(stat='mean').isel( tiles=slice(*tile_range) ), np.sqrt( tstats.sel(stat='var').isel( tiles=slice(*tile_range) ) )
-				cbatch: np.ndarray = batch.values - tmean.values.reshape(-1,1,1)
-				nbatch: np.ndarray = cbatch / tstd.values.reshape(-1,1,1)
-				ncstats.setdefault('mean',[]).append( tmean.values.reshape(bdims) )
-				ncstats.setdefault('std', []).append(  tstd.values.reshape(bdims) )
-				channel_data.append( batch.copy( data=nbatch) )
-			elif ntype == 'tscale':
-				tstats: xa.DataArray = self.norm_stats.data_vars[channel]
-				vmin, vmax = tstats.sel(stat='min'), tstats.sel(stat='max')
-				channel_data.append(  (batch - vmin) / (vmax - vmin) )
-				ncstats.setdefault('max',[]).append(vmax.values.reshape(bdims))
-				ncstats.setdefault('min',[]).append(vmin.values.reshape(bdims))
-			else: raise Exception( f"Unknown norm: {ntype}")
-		result = xa.concat( channel_data, channels ).transpose('tiles', 'channels', 'y', 'x')
-		stats = { sn: np.concatenate( sv, axis=1 ) for sn, sv in ncstats.items() }
+		channels: List[str] = batch_data.coords['channels'].values.tolist()
+		batch: np.ndarray = batch_data.values
+		stats: Dict[str,np.ndarray] = {}
+		if ntype == 'lnorm':
+			stats['mean'], stats['std'] = np.nanmean( batch, axis=(2,3), keepdims=True ), np.nanstd( batch, axis=(2,3), keepdims=True )
+			ndata: np.ndarray = (batch - stats['mean']) / stats['std']
+		elif ntype == 'lscale':
+			stats['max'], stats['min'] = np.nanmax( batch, axis=(2,3), keepdims=True ), np.nanmin( batch, axis=(2,3), keepdims=True )
+			ndata: np.ndarray = (batch - stats['min']) / (stats['max'] - stats['min'])
+		elif ntype in ['gnorm','gscale']:
+			gstats: Dict[str,np.ndarray] = { sn: sv.reshape(1,-1,1,1) for sn, sv in self.norm_arrays( 'global', channels ).items() }
+			if ntype == 'gnorm': ndata: np.ndarray = (batch - gstats['mean']) / gstats['std']
+			else:                ndata: np.ndarray = (batch - gstats['min']) / (gstats['max'] - gstats['min'])
+		elif ntype in ['tnorm','tscale']:
+			tstats: Dict[str,np.ndarray] = { sn: sv[ slice(*tile_range) ].reshape( batch.shape[0],-1,1,1 ) for sn, sv in self.norm_arrays( 'tiles', channels ).items() }
+			if ntype == 'tnorm':
+				stats['mean'], stats['std'] = tstats['mean'], tstats['std']
+				ndata: np.ndarray = (batch - stats['mean']) / stats['std']
+			else:
+				stats['max'], stats['min'] = tstats['max'], tstats['min']
+				ndata: np.ndarray = (batch - stats['min']) / (stats['max'] - stats['min'])
+		else: raise Exception( f"Unknown norm: {ntype}")
+		result: xa.DataArray = batch_data.copy( data=ndata.astype( batch.dtype, copy=False ) )
 		result.attrs.update( stats )
 		return result
 
@@ -224,6 +333,9 @@ class SWOTRawDataLoader(SRRawDataLoader):
 		ctiles: np.ndarray = np.compress( msk, tiles,0)
 		tile_idxs: np.ndarray = np.compress(msk, np.arange(tiles.shape[0]), 0)
 		result: np.ndarray = ctiles.reshape( ctiles.shape[0]//ishape['c'], ishape['c'], tsize['y'], tsize['x'] )
-		attrs = dict( grid_shape=grid_shape )
 		lgm().log(f" ---- tiles{tiles.shape}, tile_idxs{tile_idxs.shape}, ctiles{ctiles.shape} -> result{result.shape}, mean={result.mean()}",display=True)
-		return xa.DataArray(result, dims=["tiles", "channels", "y", "x"], coords=dict(tiles=tile_idxs[0:result.shape[0]], channels=self.varnames), attrs=attrs )
\ No newline at end of file
+		return self.tiles_array( result, tile_idxs[0:result.shape[0]], grid_shape )
+
+	def tiles_array(self, tiles: np.ndarray, tile_idxs: np.ndarray, grid_shape: Dict[str, int] ) -> xa.DataArray:
+		attrs = dict( grid_shape=grid_shape )
+		return xa.DataArray( tiles, dims=["tiles", "channels", "y", "x"], coords=dict(tiles=tile_idxs, channels=self.varnames), attrs=attrs )
\ No newline at end of file
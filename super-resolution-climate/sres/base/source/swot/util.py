@@ -1,10 +1,11 @@
-import numpy as np
+import numpy as np, os, threading
+from typing import Dict, Optional, Tuple
 
 def rearrange(d,nx):
-	deast = np.c_[d[:nx * nx * 3].reshape(3 * nx, nx),
-	d[nx * nx * 3:nx * nx * 6].reshape(3 * nx, nx)]
-	dwest = d[nx * nx * 7:].reshape(nx * 2, nx * 3)
-	return deast, dwest
+    deast = np.c_[d[:nx * nx * 3].reshape(3 * nx, nx),
+    d[nx * nx * 3:nx * nx * 6].reshape(3 * nx, nx)]
+    dwest = d[nx * nx * 7:].reshape(nx * 2, nx * 3)
+    return deast, dwest
 
 def mds2d(dd, nx=4320):
     """
@@ -53,4 +54,61 @@ def mds2d(dd, nx=4320):
             dout.append(rearrange(d,nx))
         return dout
     else:
-        return rearrange(dd,nx)
\ No newline at end of file
+        return rearrange(dd,nx)
+
+def roi_bounds( roi: Optional[Dict[str,int]], nx: int = 4320 ) -> Dict[str,Tuple[int,int]]:
+    gshape = dict( y=3*nx, x=4*nx )
+    roi = {} if roi is None else roi
+    bounds = {}
+    for dim in ['y','x']:
+        c0 = roi.get(f'{dim}0',0)
+        c1 = min( c0 + roi.get(f'{dim}s',gshape[dim]), gshape[dim] )
+        bounds[dim] = (c0, c1)
+    return bounds
+
+def llc_flat_index( y: np.ndarray, x: np.ndarray, nx: int = 4320 ) -> np.ndarray:
+    """
+    Map (y, x) coordinates of the assembled image produced by mds2d (east hemisphere
+    concatenated with the transposed & flipped west hemisphere, shape (3*nx, 4*nx))
+    to flat indices into the raw LLC grid of size 13*nx**2.
+    """
+    east0  = y*nx + x
+    east1  = 3*nx*nx + y*nx + (x-nx)
+    west   = 7*nx*nx + (x-2*nx)*3*nx + (3*nx-1-y)
+    return np.where( x < nx, east0, np.where( x < 2*nx, east1, west ) )
+
+def llc_roi_index( template_path: str, roi: Optional[Dict[str,int]], nx: int = 4320, chunk_size: int = 4320*4320 ) -> Tuple[np.ndarray,np.ndarray,Tuple[int,int]]:
+    """
+    Compute, from the LLC mask template, the offsets (in values) into a packed '.shrunk' file of all
+    wet points that fall inside the roi, together with their flat positions in the roi image.
+    Offsets are returned in ascending order so that reads through the index are sequential.
+
+    Returns:
+    --------
+    (offsets, positions, roi_shape) : tuple
+    """
+    bnds = roi_bounds( roi, nx )
+    roi_shape = ( bnds['y'][1]-bnds['y'][0], bnds['x'][1]-bnds['x'][0] )
+    yc, xc = np.meshgrid( np.arange(*bnds['y']), np.arange(*bnds['x']), indexing='ij' )
+    gidx: np.ndarray = llc_flat_index( yc.ravel(), xc.ravel(), nx )
+    del yc, xc
+    positions: np.ndarray = np.argsort( gidx, kind='stable' )
+    gidx = gidx[positions]
+    template: np.memmap = np.memmap( template_path, dtype='>f4', mode='r' )
+    offsets: np.ndarray = np.empty( gidx.size, dtype=np.int64 )
+    nwet: int = 0
+    for c0 in range( 0, template.size, chunk_size ):
+        c1 = min( c0 + chunk_size, template.size )
+        crank: np.ndarray = np.cumsum( template[c0:c1] != 0 )
+        i0, i1 = np.searchsorted( gidx, [c0, c1] )
+        offsets[i0:i1] = nwet + crank[gidx[i0:i1]-c0] - 1
+        nwet += int(crank[-1])
+    wet: np.ndarray = ( template[gidx] != 0 )
+    return offsets[wet], positions[wet].astype(np.int64), roi_shape
+
+def save_index_array( ipath: str, index: np.ndarray ):
+    os.makedirs( os.path.dirname(ipath), 0o777, exist_ok=True )
+    tmp_path = f"{ipath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open( tmp_path, 'wb' ) as f:
+        np.save( f, index )
+    os.replace( tmp_path, ipath )
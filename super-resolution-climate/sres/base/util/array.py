@@ -3,7 +3,7 @@ import torch, dataclasses
 from sres.base.util.config import cfg2meta, cfg
 from typing import Iterable, List, Tuple, Union, Optional, Dict, Any, Sequence
 from sres.base.util.ops import dataset_to_stacked
-from sres.base.gpu import set_device, get_device
+from sres.base.gpu import set_device, get_device, to_memory_format
 from sres.base.util.ops import format_timedeltas
 
 TimedeltaLike = Any  # Something convertible to pd.Timedelta.
@@ -64,16 +64,19 @@ def ds2array( dset: xa.Dataset, **kwargs ) -> xa.DataArray:
     darray.attrs['channels'] = channels
     return darray.transpose( "tiles", "channels", coords['y'], coords['x'] )
 
-def array2tensor( darray: Union[xa.DataArray,np.ndarray] ) -> Tensor:
+def array2tensor( darray: Union[xa.DataArray,np.ndarray], device: Optional[torch.device] = None ) -> Tensor:
     nparray: np.ndarray = darray.values if type(darray) is xa.DataArray else darray
-    array_data: np.ndarray = np.ravel(nparray).reshape( nparray.shape )
-    return torch.tensor( array_data, device=get_device(), requires_grad=True, dtype=torch.float32 )
+    host_tensor: Tensor = torch.from_numpy( np.ascontiguousarray( nparray, dtype=np.float32 ) )
+    device = get_device() if device is None else device
+    if device.type == "cuda":
+        return to_memory_format( host_tensor.pin_memory().to( device, non_blocking=True ) )
+    return to_memory_format( host_tensor )
 
 def downsample( target_data: Union[xa.DataArray,Tensor], **kwargs) -> Tensor:
     scale_factor = kwargs.get('scale_factor', math.prod(cfg().model.downscale_factors))
     target_tensor: Tensor = array2tensor(target_data) if type(target_data) is xa.DataArray else target_data
     downsampled = torch.nn.functional.interpolate(target_tensor, scale_factor=1.0/scale_factor, mode=torch_interp_mode(True))
-    return downsampled
+    return to_memory_format( downsampled )
 
 def xa_downsample( input_array: xa.DataArray, **kwargs) -> xa.DataArray:
     scale_factor =  kwargs.get('scale_factor', math.prod(cfg().model.downscale_factors) )
@@ -84,7 +87,7 @@ def xa_downsample( input_array: xa.DataArray, **kwargs) -> xa.DataArray:
 def upsample( input_tensor: Tensor ) -> Tensor:
     scale_factor = math.prod(cfg().model.downscale_factors)
     upsampled = torch.nn.functional.interpolate(input_tensor, scale_factor=scale_factor, mode=torch_interp_mode(False))
-    return upsampled
+    return to_memory_format( upsampled )
 
 def xa_upsample(input_array: xa.DataArray, coords: Dict[str,np.ndarray]) -> xa.DataArray:
     csize = { cn:cv.shape for cn,cv in coords.items() }
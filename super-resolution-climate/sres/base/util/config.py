@@ -6,23 +6,40 @@ from hydra.core.global_hydra import GlobalHydra
 from hydra.initialize import initialize
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Type, Optional, Union, Hashable
+from typing import Any, Callable, Dict, List, Tuple, Type, Optional, Union, Hashable
 from dataclasses import dataclass
 from sres.base.util.logging import lgm, exception_handled, log_timing
 from datetime import date, timedelta, datetime
 from xarray.core.coordinates import DataArrayCoordinates, DatasetCoordinates
-import hydra, traceback, os
+import hydra, traceback, os, threading
 import numpy as np
 import pprint
 
 pp = pprint.PrettyPrinter(indent=4)
 DataCoordinates = Union[DataArrayCoordinates,DatasetCoordinates]
 
+class ThreadConfig(threading.local):
+    cfg: Optional[DictConfig] = None
+    configuration: Optional[Dict] = None
+
+thread_config = ThreadConfig()
+
 def cfg() -> DictConfig:
-    return ConfigContext.cfg
+    return ConfigContext.cfg if (thread_config.cfg is None) else thread_config.cfg
 
 def config() -> Dict:
-    return ConfigContext.configuration
+    return ConfigContext.configuration if (thread_config.configuration is None) else thread_config.configuration
+
+def bind_config( fn: Callable ) -> Callable:
+    # Binds the configuration active in the calling thread to fn, which can then run on another (background) thread.
+    bound_cfg, bound_configuration = cfg(), config()
+    def bound_fn( *args, **kwargs ):
+        thread_config.cfg, thread_config.configuration = bound_cfg, bound_configuration
+        try:
+            return fn( *args, **kwargs )
+        finally:
+            thread_config.cfg, thread_config.configuration = None, None
+    return bound_fn
 
 def cid() -> str:
     return '-'.join([ cfg().model.name, cfg().task.dataset, cfg().task.name ])
@@ -0,0 +1,219 @@
+import torch, math, time, copy, importlib, os
+import torch.nn as nn, numpy as np, pandas as pd
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, Sequence
+from sres.base.util.config import cfg
+from sres.base.util.logging import lgm
+from sres.base.gpu import get_device, MixedPrecision
+from sres.controller.stats import l2loss
+from sres.model.engine import InferenceEngine
+
+TensorOrTensors = Union[torch.Tensor, Sequence[torch.Tensor]]
+
+def model_names() -> List[str]:
+	mdir = os.path.join( os.path.dirname( os.path.dirname(__file__) ), "model" )
+	return sorted( [ mname for mname in os.listdir(mdir) if os.path.isfile( os.path.join( mdir, mname, "network.py" ) ) ] )
+
+def get_model( model_name: str, device: torch.device ) -> nn.Module:
+	model_package = importlib.import_module( f"sres.model.{model_name}.network" )
+	return model_package.get_model( nchannels_in=1, nchannels_out=1, device=device ).to(device)
+
+def synthetic_batch( ntiles: int, tile_size: int, device: torch.device, seed: int ) -> Tuple[torch.Tensor,torch.Tensor]:
+	generator = torch.Generator().manual_seed( seed )
+	scale_factor: int = math.prod( cfg().model.downscale_factors )
+	coarse = torch.randn( ntiles, 1, tile_size//8, tile_size//8, generator=generator )
+	target = torch.nn.functional.interpolate( coarse, size=(tile_size,tile_size), mode='bicubic' ).to(device)
+	input = torch.nn.functional.interpolate( target, scale_factor=1.0/scale_factor, mode='bicubic' )
+	return input, target
+
+def product_loss( products: TensorOrTensors, target: torch.Tensor ) -> torch.Tensor:
+	product: torch.Tensor = products if isinstance(products, torch.Tensor) else products[-1]
+	product = product.float()
+	return l2loss( product, target[:,:,:product.shape[2],:product.shape[3]] )
+
+def run_training_steps( model: nn.Module, precision: MixedPrecision, input: torch.Tensor, target: torch.Tensor, nsteps: int ) -> Tuple[float,List[float]]:
+	optimizer = torch.optim.Adam( model.parameters(), lr=cfg().task.get('lr',1e-4) )
+	losses, elapsed = [], 0.0
+	model.train()
+	for istep in range(nsteps+1):
+		if precision.device.type == 'cuda': torch.cuda.synchronize( precision.device )
+		t0 = time.time()
+		optimizer.zero_grad()
+		with precision.autocast():
+			products: TensorOrTensors = model( input )
+		loss: torch.Tensor = product_loss( products, target )
+		precision.backward( loss )
+		precision.step( optimizer )
+		if precision.device.type == 'cuda': torch.cuda.synchronize( precision.device )
+		if istep > 0: elapsed += time.time() - t0
+		losses.append( loss.item() )
+	return elapsed, losses
+
+def benchmark_model( model_name: str, precision: str = 'auto', ntiles: int = 16, tile_size: int = 64, nsteps: int = 10, seed: int = 4456 ) -> Dict[str,Any]:
+	device: torch.device = get_device()
+	input, target = synthetic_batch( ntiles, tile_size, device, seed )
+	torch.manual_seed( seed )
+	model: nn.Module = get_model( model_name, device )
+	results: Dict[str,Any] = dict( model=model_name, precision=precision )
+	for mode in [ 'fp32', precision ]:
+		elapsed, losses = run_training_steps( copy.deepcopy(model), MixedPrecision( device, mode ), input, target, nsteps )
+		key = 'fp32' if (mode == 'fp32') else 'amp'
+		results[f'{key}_tiles_per_sec'] = ntiles * nsteps / elapsed
+		results[f'{key}_initial_loss'] = losses[0]
+		results[f'{key}_final_loss'] = losses[-1]
+	results['speedup'] = results['amp_tiles_per_sec'] / results['fp32_tiles_per_sec']
+	results['initial_loss_rdiff'] = abs( results['amp_initial_loss'] - results['fp32_initial_loss'] ) / results['fp32_initial_loss']
+	results['final_loss_rdiff'] = abs( results['amp_final_loss'] - results['fp32_final_loss'] ) / results['fp32_final_loss']
+	return results
+
+def precision_benchmark( models: Optional[List[str]] = None, precision: str = 'auto', **kwargs ) -> pd.DataFrame:
+	records: List[Dict[str,Any]] = []
+	for model_name in (model_names() if models is None else models):
+		try:
+			records.append( benchmark_model( model_name, precision, **kwargs ) )
+			r = records[-1]
+			lgm().log( f" *** precision_benchmark[{model_name}]: fp32={r['fp32_tiles_per_sec']:.1f} tiles/sec, {precision}={r['amp_tiles_per_sec']:.1f} tiles/sec ({r['speedup']:.2f}x), "
+			           f"loss rdiff: initial={r['initial_loss_rdiff']:.2e} final={r['final_loss_rdiff']:.2e}", display=True )
+		except Exception as err:
+			lgm().log( f" *** precision_benchmark[{model_name}]: failed: {err}", display=True )
+	return pd.DataFrame.from_records( records )
+
+def time_inference( engine: InferenceEngine, input: torch.Tensor, nreps: int ) -> Tuple[List[float],TensorOrTensors]:
+	latencies, outputs = [], None
+	with torch.inference_mode():
+		for irep in range(nreps+1):
+			if input.device.type == 'cuda': torch.cuda.synchronize( input.device )
+			t0 = time.time()
+			outputs = engine( input )
+			if input.device.type == 'cuda': torch.cuda.synchronize( input.device )
+			if irep > 0: latencies.append( time.time() - t0 )
+	return latencies, outputs
+
+def benchmark_inference( model_name: str, backends: Sequence[str] = ('torchscript','compile'), ntiles: int = 16, tile_size: int = 64, nreps: int = 10, seed: int = 4456 ) -> Dict[str,Any]:
+	device: torch.device = get_device()
+	input, target = synthetic_batch( ntiles, tile_size, device, seed )
+	torch.manual_seed( seed )
+	model: nn.Module = get_model( model_name, device ).eval()
+	results: Dict[str,Any] = dict( model=model_name, ntiles=ntiles )
+	reference: Optional[torch.Tensor] = None
+	for backend in ['eager'] + list(backends):
+		t0 = time.time()
+		engine = InferenceEngine( model, model_name, tuple(input.shape), backend )
+		results[f'{backend}_build_sec'] = time.time() - t0
+		latencies, outputs = time_inference( engine, input, nreps )
+		product: torch.Tensor = outputs if isinstance(outputs, torch.Tensor) else outputs[-1]
+		if reference is None: reference = product
+		results[f'{backend}_latency_ms'] = float( np.median(latencies) ) * 1000
+		results[f'{backend}_tiles_per_sec'] = ntiles / float( np.median(latencies) )
+		results[f'{backend}_max_abs_diff'] = float( (product.float() - reference.float()).abs().max() )
+		if backend != 'eager':
+			results[f'{backend}_speedup'] = results['eager_latency_ms'] / results[f'{backend}_latency_ms']
+	return results
+
+def inference_benchmark( models: Optional[List[str]] = None, backends: Sequence[str] = ('torchscript','compile'), **kwargs ) -> pd.DataFrame:
+	records: List[Dict[str,Any]] = []
+	for model_name in (model_names() if models is None else models):
+		try:
+			records.append( benchmark_inference( model_name, backends, **kwargs ) )
+			r = records[-1]
+			speedups = ', '.join( [ f"{backend}={r[f'{backend}_latency_ms']:.1f} ms ({r[f'{backend}_speedup']:.2f}x)" for backend in backends ] )
+			lgm().log( f" *** inference_benchmark[{model_name}]: eager={r['eager_latency_ms']:.1f} ms, {speedups}", display=True )
+		except Exception as err:
+			lgm().log( f" *** inference_benchmark[{model_name}]: failed: {err}", display=True )
+	return pd.DataFrame.from_records( records )
+
+def activation_memory( model: nn.Module, input: torch.Tensor, target: torch.Tensor ) -> Tuple[float,float]:
+	# Returns (bytes of activations saved for backward by one training step, peak device memory or nan on cpu).
+	param_storages = set( p.untyped_storage().data_ptr() for p in model.parameters() )
+	storages: Dict[int,int] = {}
+	def pack( t: torch.Tensor ) -> torch.Tensor:
+		storage = t.untyped_storage()
+		if storage.data_ptr() not in param_storages: storages[storage.data_ptr()] = storage.nbytes()
+		return t
+	model.train()
+	model.zero_grad()
+	if input.device.type == 'cuda': torch.cuda.reset_peak_memory_stats( input.device )
+	with torch.autograd.graph.saved_tensors_hooks( pack, lambda t: t ):
+		loss: torch.Tensor = product_loss( model( input ), target )
+	loss.backward()
+	peak: float = torch.cuda.max_memory_allocated( input.device ) if (input.device.type == 'cuda') else float('nan')
+	return float( sum( storages.values() ) ), peak
+
+def benchmark_checkpointing( model_name: str, segments: Sequence[int] = (0,2,4), ntiles: int = 16, tile_size: int = 64, nsteps: int = 5, seed: int = 4456 ) -> List[Dict[str,Any]]:
+	device: torch.device = get_device()
+	input, target = synthetic_batch( ntiles, tile_size, device, seed )
+	torch.manual_seed( seed )
+	model: nn.Module = get_model( model_name, device )
+	records: List[Dict[str,Any]] = []
+	for nsegments in segments:
+		smodel: nn.Module = copy.deepcopy( model )
+		smodel.checkpoint_segments = nsegments
+		saved, peak = activation_memory( smodel, input, target )
+		elapsed, losses = run_training_steps( smodel, MixedPrecision( device, 'fp32' ), input, target, nsteps )
+		records.append( dict( model=model_name, tile_size=tile_size, ntiles=ntiles, segments=nsegments, saved_activations_mb=saved/2**20, peak_memory_mb=peak/2**20,
+		                      step_time_ms=1000*elapsed/nsteps, final_loss=losses[-1] ) )
+	for record in records:
+		record['memory_ratio'] = record['saved_activations_mb'] / records[0]['saved_activations_mb']
+		record['time_ratio'] = record['step_time_ms'] / records[0]['step_time_ms']
+		record['final_loss_rdiff'] = abs( record['final_loss'] - records[0]['final_loss'] ) / records[0]['final_loss']
+	return records
+
+def checkpoint_benchmark( models: Sequence[str] = ('rcan','edsr','esrt'), segments: Sequence[int] = (0,2,4), **kwargs ) -> pd.DataFrame:
+	records: List[Dict[str,Any]] = []
+	for model_name in models:
+		try:
+			mrecords: List[Dict[str,Any]] = benchmark_checkpointing( model_name, segments, **kwargs )
+			records.extend( mrecords )
+			for r in mrecords:
+				lgm().log( f" *** checkpoint_benchmark[{model_name}:{r['segments']}]: saved activations={r['saved_activations_mb']:.1f} MB ({r['memory_ratio']:.2f}x), "
+				           f"peak={r['peak_memory_mb']:.1f} MB, step={r['step_time_ms']:.1f} ms ({r['time_ratio']:.2f}x), loss rdiff={r['final_loss_rdiff']:.2e}", display=True )
+		except Exception as err:
+			lgm().log( f" *** checkpoint_benchmark[{model_name}]: failed: {err}", display=True )
+	return pd.DataFrame.from_records( records )
+
+def layout_fallbacks( model: nn.Module, input: torch.Tensor ) -> List[str]:
+	# Names of the leaf modules whose (4D) output is not channels-last for a channels-last input.
+	fallbacks: List[str] = []
+	def check( name: str ) -> Callable:
+		def hook( module: nn.Module, args: Any, output: Any ):
+			if isinstance( output, torch.Tensor ) and (output.dim() == 4) and (output.shape[1] > 1) and not output.is_contiguous( memory_format=torch.channels_last ):
+				fallbacks.append( name )
+		return hook
+	handles = [ module.register_forward_hook( check(name) ) for name, module in model.named_modules() if len( list(module.children()) ) == 0 ]
+	with torch.no_grad(): model( input )
+	for handle in handles: handle.remove()
+	return fallbacks
+
+def benchmark_memory_format( model_name: str, ntiles: int = 16, tile_size: int = 64, nsteps: int = 5, nreps: int = 10, seed: int = 4456 ) -> Dict[str,Any]:
+	device: torch.device = get_device()
+	input, target = synthetic_batch( ntiles, tile_size, device, seed )
+	torch.manual_seed( seed )
+	model: nn.Module = get_model( model_name, device )
+	results: Dict[str,Any] = dict( model=model_name, ntiles=ntiles )
+	reference: Optional[torch.Tensor] = None
+	for mformat, fmt in [ ('nchw',torch.contiguous_format), ('nhwc',torch.channels_last) ]:
+		fmodel: nn.Module = copy.deepcopy( model ).to( memory_format=fmt )
+		finput, ftarget = input.contiguous( memory_format=fmt ), target.contiguous( memory_format=fmt )
+		latencies, outputs = time_inference( InferenceEngine( fmodel.eval(), model_name, tuple(finput.shape), 'eager' ), finput, nreps )
+		product: torch.Tensor = outputs if isinstance(outputs, torch.Tensor) else outputs[-1]
+		if reference is None: reference = product
+		elapsed, losses = run_training_steps( fmodel, MixedPrecision( device, 'fp32' ), finput, ftarget, nsteps )
+		results[f'{mformat}_latency_ms'] = float( np.median(latencies) ) * 1000
+		results[f'{mformat}_step_ms'] = 1000 * elapsed / nsteps
+		results[f'{mformat}_max_abs_diff'] = float( (product.float() - reference.float()).abs().max() )
+	results['inference_speedup'] = results['nchw_latency_ms'] / results['nhwc_latency_ms']
+	results['training_speedup'] = results['nchw_step_ms'] / results['nhwc_step_ms']
+	results['layout_fallbacks'] = ','.join( sorted( set( layout_fallbacks( copy.deepcopy(model).to( memory_format=torch.channels_last ).eval(), input.contiguous( memory_format=torch.channels_last ) ) ) ) )
+	return results
+
+def memory_format_benchmark( models: Optional[List[str]] = None, **kwargs ) -> pd.DataFrame:
+	lgm().log( f" *** memory_format_benchmark: mkldnn available={torch.backends.mkldnn.is_available()}, cudnn benchmark={torch.backends.cudnn.benchmark}", display=True )
+	records: List[Dict[str,Any]] = []
+	for model_name in (model_names() if models is None else models):
+		try:
+			records.append( benchmark_memory_format( model_name, **kwargs ) )
+			r = records[-1]
+			lgm().log( f" *** memory_format_benchmark[{model_name}]: inference nchw={r['nchw_latency_ms']:.1f} ms, nhwc={r['nhwc_latency_ms']:.1f} ms ({r['inference_speedup']:.2f}x), "
+			           f"training step nchw={r['nchw_step_ms']:.1f} ms, nhwc={r['nhwc_step_ms']:.1f} ms ({r['training_speedup']:.2f}x), max diff={r['nhwc_max_abs_diff']:.2e}", display=True )
+		except Exception as err:
+			lgm().log( f" *** memory_format_benchmark[{model_name}]: failed: {err}", display=True )
+	return pd.DataFrame.from_records( records )
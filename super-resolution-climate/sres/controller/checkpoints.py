@@ -1,68 +1,222 @@
-import torch, time, traceback, pickle, shutil
-from typing import Any, Dict, List, Optional
-from sres.base.util.config import cfg
+import torch, time, traceback, pickle, shutil, threading, json
+from typing import Any, Dict, List, Optional, Tuple
+from sres.base.util.config import cfg, bind_config
 from sres.base.util.logging import lgm
 from torch.optim.optimizer import Optimizer
 from torch.nn import Module
+from torch.amp import GradScaler
 from sres.controller.config import TSet, srRes
+from sres.model.util import weights_version
 import os
 
+CheckpointEntry = Dict[str,Any]
+
+def cpu_snapshot( state: Any ) -> Any:
+	if isinstance( state, torch.Tensor ): return state.detach().to( 'cpu', copy=True )
+	if isinstance( state, dict ):         return { k: cpu_snapshot(v) for k, v in state.items() }
+	if isinstance( state, (list,tuple) ): return type(state)( cpu_snapshot(v) for v in state )
+	return state
+
+def atomic_save( state: Any, fpath: str ):
+	tmp_path = f"{fpath}.{os.getpid()}.tmp"
+	torch.save( state, tmp_path )
+	os.replace( tmp_path, fpath )
+
+def vset( tset: TSet ) -> TSet:
+	return TSet.Validation if (tset == TSet.Test) else tset
 
 class CheckpointManager(object):
+	"""
+	Rotating checkpoint store: each save writes a numbered pair of files (model weights, optimizer/scaler state)
+	and appends an entry (epoch, itime, loss) to a per-tset json index.  The index is rewritten atomically after the
+	files are in place, so only complete checkpoints are ever indexed.  Retention keeps the newest 'checkpoint_keep'
+	entries, plus the lowest-loss entry if 'checkpoint_keep_best' is set.
+	"""
 
-	def __init__(self, model: Module, optimizer: Optimizer ):
+	def __init__(self, model: Module, optimizer: Optimizer, scaler: Optional[GradScaler] = None ):
 		self._cpaths: Dict[str,str] = {}
 		self.model = model
 		self.optimizer = optimizer
+		self.scaler = scaler
+		self.async_write: bool = cfg().task.get( 'async_checkpoints', True )
+		self.save_period: int = cfg().task.get( 'checkpoint_period', 1 )
+		self.save_interval: float = cfg().task.get( 'checkpoint_interval', 0.0 )
+		self.keep: int = max( cfg().task.get( 'checkpoint_keep', 3 ), 1 )
+		self.keep_best: bool = cfg().task.get( 'checkpoint_keep_best', True )
+		self._writer: Optional[threading.Thread] = None
+		self._ncalls: Dict[TSet,int] = {}
+		self._last_save: Dict[TSet,float] = {}
+		self._deferred: Dict[TSet,Tuple[int,int,float,float]] = {}
+		self._t0: float = time.time()
+		self._loaded: Optional[Tuple[str,int]] = None
+
+	@property
+	def writing(self) -> bool:
+		return (self._writer is not None) and self._writer.is_alive()
 
-	def save_checkpoint(self, epoch: int, itime: int, tset: TSet, loss: float, interp_loss: float  ) -> str:
+	def wait(self):
+		if self._writer is not None:
+			self._writer.join()
+			self._writer = None
+
+	def save_due(self, tset: TSet ) -> bool:
+		self._ncalls[tset] = self._ncalls.get( tset, 0 ) + 1
+		if (self.save_period > 0) and (self._ncalls[tset] % self.save_period == 0): return True
+		return (self.save_interval > 0) and ( time.time() - self._last_save.get( tset, self._t0 ) >= self.save_interval )
+
+	def save_checkpoint(self, epoch: int, itime: int, tset: TSet, loss: float, interp_loss: float, force: bool = False ) -> Optional[str]:
+		if (tset == TSet.Train) and not force:
+			if not self.save_due( tset ) or self.writing:
+				self._deferred[tset] = ( epoch, itime, loss, interp_loss )
+				lgm().log( f" *** Deferred {tset.name} checkpoint[{epoch}:{itime}], write in flight={self.writing}" )
+				return None
+		self.wait()
+		self._deferred.pop( tset, None )
+		self._last_save[tset] = time.time()
 		t0 = time.time()
-		checkpoint = dict( epoch=epoch, itime=itime, model_state_dict=self.model.state_dict(), optimizer_state_dict=self.optimizer.state_dict(), loss=loss )
-		cpath = self.checkpoint_path(tset)
-		if os.path.isfile(cpath):
-			shutil.copyfile( cpath, self.checkpoint_path(tset,backup=True) )
-		torch.save( checkpoint, cpath )
-		lgm().log(f"\n *** SAVE {tset.name} checkpoint, loss={loss:.5f} ({interp_loss:.5f}), to {cpath}, dt={time.time()-t0:.4f} sec", display=True )
-		return cpath
-
-	def _load_state(self, tset: TSet ) -> Dict[str,Any]:
+		index: List[CheckpointEntry] = self.read_index( tset )
+		seq: int = max( [ e['seq'] for e in index ], default=0 ) + 1
+		entry: CheckpointEntry = dict( seq=seq, epoch=epoch, itime=itime, loss=float(loss), interp_loss=float(interp_loss), time=t0 )
+		model_state = cpu_snapshot( self.model.state_dict() )
+		optimizer_state = dict( optimizer_state_dict=self.optimizer.state_dict() )
+		if (self.scaler is not None) and self.scaler.is_enabled():
+			optimizer_state['scaler_state_dict'] = self.scaler.state_dict()
+		optimizer_state = cpu_snapshot( optimizer_state )
+		cpaths: Dict[str,str] = self.entry_paths( tset, seq )
+		if self.async_write:
+			self._writer = threading.Thread( target=bind_config( self._write ), args=(tset, index, entry, model_state, optimizer_state, cpaths), name="CheckpointWriter" )
+			self._writer.start()
+		else:
+			self._write( tset, index, entry, model_state, optimizer_state, cpaths )
+		return cpaths['model']
+
+	def _write(self, tset: TSet, index: List[CheckpointEntry], entry: CheckpointEntry, model_state: Dict[str,Any], optimizer_state: Dict[str,Any], cpaths: Dict[str,str] ):
+		try:
+			atomic_save( optimizer_state, cpaths['optimizer'] )
+			atomic_save( dict( model_state_dict=model_state, epoch=entry['epoch'], itime=entry['itime'], loss=entry['loss'] ), cpaths['model'] )
+			self.write_index( tset, self.retain( tset, index + [entry] ) )
+			lgm().log(f"\n *** SAVE {tset.name} checkpoint[{entry['seq']}], loss={entry['loss']:.5f} ({entry['interp_loss']:.5f}), to {cpaths['model']}, dt={time.time()-entry['time']:.4f} sec", display=True )
+		except Exception as e:
+			lgm().log(f"Unable to save {tset.name} checkpoint to {cpaths['model']}: {e}", display=True)
+			traceback.print_exc()
+
+	def retain(self, tset: TSet, index: List[CheckpointEntry] ) -> List[CheckpointEntry]:
+		keep_seqs = set( e['seq'] for e in index[-self.keep:] )
+		if self.keep_best and (len(index) > 0):
+			keep_seqs.add( min( index, key=lambda e: e['loss'] )['seq'] )
+		for entry in index:
+			if entry['seq'] not in keep_seqs:
+				self.remove_entry( tset, entry )
+		return [ e for e in index if e['seq'] in keep_seqs ]
+
+	def remove_entry(self, tset: TSet, entry: CheckpointEntry ):
+		for cpath in self.entry_paths( tset, entry['seq'] ).values():
+			if os.path.exists(cpath): os.remove(cpath)
+
+	def flush(self):
+		for tset, ( epoch, itime, loss, interp_loss ) in list( self._deferred.items() ):
+			self.save_checkpoint( epoch, itime, tset, loss, interp_loss, force=True )
+		self.wait()
+
+	def _load_state(self, cpath: str ) -> Dict[str,Any]:
 		# sdevice = f'cuda:{cfg().pipeline.gpu}' if torch.cuda.is_available() else 'cpu'
-		cpath = self.checkpoint_path(tset)
 		checkpoint = torch.load( cpath, map_location='cpu' ) # torch.device(sdevice) )
 		return checkpoint
 
+	def _load_entry(self, tset: TSet, entry: CheckpointEntry, update_model: bool, weights_only: bool ) -> Dict[str,Any]:
+		cpaths: Dict[str,str] = self.entry_paths( tset, entry['seq'] )
+		for part in ( ['model'] if weights_only else ['model','optimizer'] ):
+			if not os.path.isfile( cpaths[part] ): raise Exception( f"Missing {part} file: {cpaths[part]}" )
+		if update_model:
+			if self._loaded != ( cpaths['model'], weights_version(self.model) ):
+				self.model.load_state_dict( self._load_state( cpaths['model'] )['model_state_dict'] )
+				self._loaded = ( cpaths['model'], weights_version(self.model) )
+			if not weights_only:
+				optimizer_state = self._load_state( cpaths['optimizer'] )
+				self.optimizer.load_state_dict( optimizer_state['optimizer_state_dict'] )
+				scaler_state = optimizer_state.get( 'scaler_state_dict', None )
+				if (scaler_state is not None) and (self.scaler is not None) and self.scaler.is_enabled():
+					self.scaler.load_state_dict( scaler_state )
+		lgm().log(f"Loaded model checkpoint[{entry['seq']}] (epoch={entry['epoch']}, itime={entry['itime']}, loss={entry['loss']:.5f}) from {cpaths['model']}", display=True)
+		return dict( epoch=entry['epoch'], itime=entry['itime'], loss=entry['loss'] )
+
+	def _load_legacy(self, tset: TSet, update_model: bool, weights_only: bool ) -> Dict[str,Any]:
+		cppath = self.checkpoint_path( tset )
+		train_state = self._load_state( cppath )
+		lgm().log(f"Loaded model checkpoint from {cppath}", display=True)
+		model_state, optimizer_state, scaler_state = [ train_state.pop(k,None) for k in ['model_state_dict','optimizer_state_dict','scaler_state_dict'] ]
+		if update_model:
+			self.model.load_state_dict( model_state )
+			if not weights_only:
+				self.optimizer.load_state_dict( optimizer_state )
+				if (scaler_state is not None) and (self.scaler is not None) and self.scaler.is_enabled():
+					self.scaler.load_state_dict( scaler_state )
+		return train_state
+
 	def load_checkpoint( self, tset: TSet = TSet.Train, **kwargs ) -> Optional[Dict[str,Any]]:
 		update_model = kwargs.get('update_model', False)
+		weights_only = kwargs.get('weights_only', False)
+		self.wait()
+		for entry in reversed( self.read_index( tset ) ):
+			try:
+				return self._load_entry( tset, entry, update_model, weights_only )
+			except Exception as e:
+				lgm().log(f"Unable to load {tset.name} checkpoint[{entry['seq']}], trying previous entry: {e}", display=True)
 		cppath = self.checkpoint_path( tset )
 		train_state = {}
 		if os.path.exists( cppath ):
 			try:
-				train_state = self._load_state( tset )
-				lgm().log(f"Loaded model checkpoint from {cppath}", display=True)
-				if update_model:
-					self.model.load_state_dict( train_state.pop('model_state_dict') )
-					self.optimizer.load_state_dict( train_state.pop('optimizer_state_dict') )
+				train_state = self._load_legacy( tset, update_model, weights_only )
 			except Exception as e:
 				lgm().log(f"Unable to load model from {cppath}: {e}", display=True)
 				traceback.print_exc()
 				return None
 		else:
-			print( f"No checkpoint file found at '{cppath}': starting from scratch.")
-		print( f" ------ Saving checkpoints to '{cppath}' ------ " )
+			print( f"No checkpoint found for '{self.index_path(tset)}': starting from scratch.")
+		print( f" ------ Saving checkpoints to '{os.path.dirname(cppath)}' ------ " )
 		return train_state
 
 	def clear_checkpoints( self ):
+		self.wait()
+		self._deferred = {}
 		for tset in [ TSet.Train, TSet.Validation ]:
-			cppath = self.checkpoint_path(tset)
-			if os.path.exists(cppath):
-				print( f" >> Clearing state: {cppath}")
-				os.remove(cppath)
+			for entry in self.read_index( tset ):
+				self.remove_entry( tset, entry )
+			for cppath in [ self.index_path(tset), self.checkpoint_path(tset), self.checkpoint_path(tset,backup=True) ]:
+				if os.path.exists(cppath):
+					print( f" >> Clearing state: {cppath}")
+					os.remove(cppath)
+
+	def read_index(self, tset: TSet ) -> List[CheckpointEntry]:
+		ipath = self.index_path( tset )
+		if not os.path.exists( ipath ): return []
+		with open( ipath ) as f:
+			return json.load( f )
+
+	def write_index(self, tset: TSet, index: List[CheckpointEntry] ):
+		ipath = self.index_path( tset )
+		tmp_path = f"{ipath}.{os.getpid()}.tmp"
+		with open( tmp_path, 'w' ) as f:
+			json.dump( index, f, indent=1 )
+		os.replace( tmp_path, ipath )
+
+	@classmethod
+	def checkpoint_dir( cls ) -> str:
+		cdir = f"{cfg().platform.results}/checkpoints"
+		os.makedirs( cdir, 0o777, exist_ok=True )
+		return cdir
+
+	@classmethod
+	def index_path( cls, tset: TSet ) -> str:
+		return f"{cls.checkpoint_dir()}/{cfg().task.training_version}.{vset(tset).value}.index.json"
+
+	@classmethod
+	def entry_paths( cls, tset: TSet, seq: int ) -> Dict[str,str]:
+		stem = f"{cls.checkpoint_dir()}/{cfg().task.training_version}.{vset(tset).value}.{seq:06d}"
+		return dict( model=f"{stem}.model.pt", optimizer=f"{stem}.optim.pt" )
 
 	@classmethod
 	def checkpoint_path( cls, tset: TSet, backup=False ) -> str:
-		vtset: TSet = TSet.Validation if (tset == TSet.Test) else tset
-		cpath = f"{cfg().platform.results}/checkpoints/{cfg().task.training_version}.{vtset.value}"
+		cpath = f"{cls.checkpoint_dir()}/{cfg().task.training_version}.{vset(tset).value}"
 		if backup: cpath = f"{cpath}.backup"
-		os.makedirs(os.path.dirname(cpath), 0o777, exist_ok=True)
 		return cpath + '.pt'
-
@@ -2,19 +2,22 @@ import torch, math
 import xarray, traceback, random
 from datetime import datetime
 from torch import Tensor
-from typing import Any, Dict, List, Tuple, Union, Sequence, Optional
+from typing import Any, Callable, Dict, List, Tuple, Union, Sequence, Optional, Iterator, Iterable
 from sres.base.util.config import ConfigContext, cfg
-from sres.data.tiles import TileIterator
+from sres.data.tiles import TileIterator, TileShuffleBuffer, TileMosaic, TileGrid, OverlapTiler, WindowBlender, image_array, host_losses
+from sres.data.prefetch import TimeslicePrefetcher, timeslice_batch_loader
+from torch.utils.data import DataLoader
 from sres.base.io.loader import batchDomain
 from sres.controller.config import TSet, srRes
 from sres.base.util.config import cdelta, cfg, cval, get_data_coords, dateindex
-from sres.base.gpu import set_device
+from sres.base.gpu import set_device, MixedPrecision
 from sres.base.util.array import array2tensor, downsample, upsample
 from sres.data.batch import BatchDataset
 from sres.base.util.dates import TimeType
 from sres.model.manager import SRModels, ResultsAccumulator
 from sres.base.util.logging import lgm, exception_handled
 from sres.controller.checkpoints import CheckpointManager
+from sres.model.engine import InferenceEngine
 import numpy as np, xarray as xa
 from sres.controller.stats import l2loss
 import torch.nn as nn
@@ -35,11 +38,18 @@ def ttsplit_times( times: List[TimeType]) -> Dict[TSet, List[TimeType]]:
 		start = end
 	return result
 
-def merge_results_tiles( merged: np.ndarray, result: Tensor ) -> np.ndarray:
-	if result is None: return merged
-	npresult: np.ndarray = result.detach().cpu().numpy()
-	if merged is not None: print( f"merge_results_tiles: merged{merged.shape}, npresult{npresult.shape}")
-	return npresult if (merged is None) else np.concatenate((merged,npresult),axis=0)
+def detach_products( products: TensorOrTensors ) -> TensorOrTensors:
+	return products.detach() if isinstance(products, Tensor) else [ product.detach() for product in products ]
+
+def store_results_tiles( results: Optional[np.ndarray], offset: int, nrows: int, result: Tensor ) -> np.ndarray:
+	if results is None:
+		results = np.empty( (nrows,)+tuple(result.shape[1:]), dtype=np.float32 )
+	results[offset:offset+result.shape[0]] = result.float().cpu().numpy()
+	return results
+
+def mean_loss( losses: List[Union[float,Tensor]] ) -> float:
+	if len(losses) == 0: return float('nan')
+	return float( np.array( host_losses(losses), dtype=np.float64 ).mean() )
 
 def smean( data: xarray.DataArray, dims: List[str] = None ) -> str:
 	means: np.ndarray = data.mean(dim=dims).values
@@ -76,6 +86,20 @@ def denorm( t: Tensor, norm_data: Dict[str,np.ndarray] ) -> np.ndarray:
 	# print(f" ~~~~~~~~~~~~~~~~~~~ denorm_data{normed.shape}: keys={list(norm_data.keys())} mean{norm_data['mean'].shape}={normed.mean():.2f} std{norm_data['std'].shape}={normed.std():.2f} ")
 	return normed
 
+def norm_windows( windows: np.ndarray, ntype: str, gstats: Optional[Dict[str,np.ndarray]] = None ) -> Tuple[np.ndarray,Dict[str,np.ndarray]]:
+	# g* norms use the (exact) global stats, l*/t* norms the stats of each window (t* stats are defined per training tile).
+	scale: bool = ntype.endswith('scale')
+	snames: List[str] = ['max','min'] if scale else ['mean','std']
+	if gstats is not None:
+		stats: Dict[str,np.ndarray] = { sn: gstats[sn].reshape(1,-1,1,1) for sn in snames }
+	elif scale:
+		stats: Dict[str,np.ndarray] = dict( max=np.nanmax( windows, axis=(2,3), keepdims=True ), min=np.nanmin( windows, axis=(2,3), keepdims=True ) )
+	else:
+		stats: Dict[str,np.ndarray] = dict( mean=np.nanmean( windows, axis=(2,3), keepdims=True ), std=np.nanstd( windows, axis=(2,3), keepdims=True ) )
+	if scale: normed: np.ndarray = (windows - stats['min']) / (stats['max'] - stats['min'])
+	else:     normed: np.ndarray = (windows - stats['mean']) / stats['std']
+	return np.nan_to_num( normed, nan=0.0 ).astype( np.float32 ), stats
+
 def fmtfl( flist: List[float] ) -> str:
 	svals = ','.join( [ f"{fv:.4f}" for fv in flist ] )
 	return f"[{svals}]"
@@ -107,13 +131,37 @@ def normalize( tensor: Tensor ) -> Tensor:
 def downscale(self, origin: Dict[str,int] ):
 	return { d: v*self.upsample_factor for d,v in origin.items()}
 
+class InterpLossCache(object):
+	"""
+	Interpolation-baseline losses keyed by (pass, time, tile range).  The device losses of newly seen batches are held
+	until sync() is called after the end-of-timeslice (or evaluation) sync, and are then cached as floats, up to max_size entries.
+	"""
+
+	def __init__(self, max_size: int ):
+		self.max_size: int = max_size
+		self.losses: Dict[Tuple,float] = {}
+		self.pending: Dict[Tuple,Tensor] = {}
+
+	def get(self, key: Tuple ) -> Optional[Union[float,Tensor]]:
+		loss: Optional[float] = self.losses.get( key )
+		return self.pending.get( key ) if (loss is None) else loss
+
+	def add(self, key: Tuple, loss: Tensor ):
+		if len(self.losses) + len(self.pending) < self.max_size:
+			self.pending[key] = loss
+
+	def sync(self):
+		if len(self.pending) > 0:
+			self.losses.update( zip( self.pending.keys(), host_losses( list(self.pending.values()) ) ) )
+			self.pending = {}
+
 class ModelTrainer(object):
 
 	model_cfg = ['batch_size', 'num_workers', 'persistent_workers' ]
 
-	def __init__(self, cc: ConfigContext ):
+	def __init__(self, cc: ConfigContext, dataset: Optional[BatchDataset] = None ):
 		super(ModelTrainer, self).__init__()
-		self.model_manager: SRModels = SRModels( set_device() )
+		self.model_manager: SRModels = SRModels( set_device(), dataset )
 		self.context: ConfigContext = cc
 		self.device: torch.device = self.model_manager.device
 		self.results_accum: ResultsAccumulator = ResultsAccumulator(cc)
@@ -124,9 +172,13 @@ class ModelTrainer(object):
 		self.scheduler = None
 		self.model = self.model_manager.get_model( )
 		self.optimizer = torch.optim.Adam(self.model.parameters(), lr=cfg().task.lr, weight_decay=cfg().task.get('weight_decay', 0.0))
-		self.checkpoint_manager = CheckpointManager(self.model, self.optimizer)
+		self.precision = MixedPrecision( self.device, cfg().task.get('precision','fp32') )
+		self.checkpoint_manager = CheckpointManager(self.model, self.optimizer, self.precision.scaler)
 		self.loss_module: nn.Module = None
 		self.layer_losses = []
+		self.batch_logs: List[Tuple] = []
+		self.interp_losses: InterpLossCache = InterpLossCache( cfg().task.get( 'interp_cache_size', 2**20 ) )
+		self.inference_engine: Optional[InferenceEngine] = None
 		self.channel_idxs: torch.LongTensor = None
 		self.target_variables = cfg().task.target_variables
 		self.downscale_factors = cfg().model.downscale_factors
@@ -144,6 +196,7 @@ class ModelTrainer(object):
 		self.validation_loss: float = float('inf')
 		self.upsampled_loss: float = float('inf')
 		self.data_timestamps: Dict[TSet,List[Union[datetime, int]]] = {}
+		self.prefetch_stats: Dict[str,float] = {}
 
 	def to_xa(self, data: np.ndarray, upscaled: bool = False) -> xarray.DataArray:
 		ustep: int = math.prod(cfg().model.downscale_factors)
@@ -161,6 +214,10 @@ class ModelTrainer(object):
 	def get_dataset(self)-> BatchDataset:
 		return self.model_manager.get_dataset()
 
+	def share_data(self, source: "ModelTrainer" ):
+		self.model_manager._dataset = source.get_dataset()
+		self.data_timestamps = source.data_timestamps
+
 	def get_sample_input(self, targets_only: bool = True) -> xa.DataArray:
 		return self.model_manager.get_sample_input(targets_only)
 
@@ -203,6 +260,7 @@ class ModelTrainer(object):
 		return tar
 
 	def single_product_loss(self, prd: torch.Tensor, tar: torch.Tensor) -> torch.Tensor:
+		prd = prd.float()
 		if cfg().model.loss_fn == 'l2':
 			loss = l2loss(prd, self.conform_to_product(prd, tar) )
 		elif cfg().model.loss_fn == "charbonnier":
@@ -219,6 +277,10 @@ class ModelTrainer(object):
 		return targets
 
 	def loss(self, products: TensorOrTensors, target: Tensor ) -> Tuple[float,torch.Tensor]:
+		sloss, mloss = self.loss_tensors( products, target )
+		return sloss.item(), mloss
+
+	def loss_tensors(self, products: TensorOrTensors, target: Tensor ) -> Tuple[torch.Tensor,torch.Tensor]:
 		sloss, mloss, ptype, self.layer_losses = None, None, type(products), []
 		if ptype == torch.Tensor:
 			sloss = self.single_product_loss( products, target)
@@ -230,12 +292,21 @@ class ModelTrainer(object):
 				layer_loss = self.single_product_loss(layer_output, layer_target)
 				#		print( f"Layer-{iL}: Output{list(layer_output.shape)}, Target{list(layer_target.shape)}, loss={layer_loss.item():.5f}")
 				mloss = layer_loss if (mloss is None) else (mloss + layer_loss)
-				self.layer_losses.append( layer_loss.item() )
-		return sloss.item(), mloss
+				self.layer_losses.append( layer_loss.detach() )
+		return sloss.detach(), mloss
 
 	def load_timeslice(self, ctime: TimeType, **kwargs) -> Optional[xarray.DataArray]:
+		prefetcher: Optional[TimeslicePrefetcher] = kwargs.pop( 'prefetcher', None )
+		if prefetcher is not None:
+			kwargs['timeslice'] = prefetcher.next( ctime )
 		return self.get_dataset().load_timeslice( ctime, **kwargs )
 
+	def read_timeslice(self, ctime: TimeType) -> xarray.DataArray:
+		return self.get_dataset().read_timeslice( ctime )
+
+	def read_region(self, ctime: TimeType) -> xarray.DataArray:
+		return self.get_dataset().read_region( ctime )
+
 	@property
 	def batch_domain(self) -> batchDomain:
 		return self.get_dataset().batch_domain
@@ -266,12 +337,40 @@ class ModelTrainer(object):
 		if nepochs == 0: return {}
 		interp_loss = kwargs.get('interp_loss', False)
 		seed = kwargs.get('seed', 4456)
-		lossrec_flush_period = 32
+		prefetch_depth: int = cfg().task.get('prefetch_depth', 0)
+		shuffle_buffer: int = cfg().task.get('shuffle_buffer', 0)
+		micro_batches: int = cfg().task.get('micro_batches', 1)
+		log_interval: int = max( cfg().task.get('loss_log_interval', 50), 1 )
 		torch.manual_seed(seed)
 		torch.cuda.manual_seed(seed)
 		self.scheduler = kwargs.get('scheduler', None)
-		epoch0, itime0, epoch_loss, loss_history, eval_losses, tset, interp_sloss = 1, 0, 0.0,  [], {}, TSet.Train, 0.0
 		train_start = time.time()
+		epoch0, itime0, epoch_loss, nepochs = self.init_training( nepochs, refresh_state )
+		self.init_data_timestamps()
+		batch_loader = self.batch_loader( seed, shuffle_buffer )
+		for epoch in range(epoch0,nepochs):
+			epoch_start = time.time()
+			self.model.train()
+			binput, boutput, btarget, nts = None, None, None, len(self.data_timestamps[TSet.Train])
+			lgm().log(f"  ----------- Epoch {epoch}/{nepochs}  nts={nts} ----------- ", display=True )
+			prefetcher = TimeslicePrefetcher( self.read_timeslice, self.data_timestamps[TSet.Train][itime0:nts], prefetch_depth ) if (prefetch_depth > 0) and (batch_loader is None) else None
+			shuffler = TileShuffleBuffer( shuffle_buffer, cfg().task.batch_size, seed+epoch ) if (shuffle_buffer > 0) else None
+			for itime, ctime, ntiles, tile_iter, tile_batches in self.timeslice_batches( itime0, batch_loader, prefetcher, shuffler ):
+				for ctile, batch_data in tile_batches:
+					binput, boutput, btarget = self.fit_batch( epoch, nepochs, itime, ctime, ctile, batch_data, tile_iter, micro_batches, interp_loss, (shuffler is None), log_interval )
+				timeslice_loss: Optional[float] = self.record_timeslice( epoch, itime, nts, tile_iter, binput, boutput, btarget )
+				if timeslice_loss is not None: epoch_loss = timeslice_loss
+
+			if prefetcher is not None:
+				prefetcher.close()
+				self.prefetch_stats = prefetcher.stats()
+			self.end_epoch( epoch, epoch_start, epoch_loss )
+			itime0 = 0
+
+		return self.end_training( nepochs, train_start, epoch_loss )
+
+	def init_training(self, nepochs: int, refresh_state: bool ) -> Tuple[int,int,float,int]:
+		epoch0, itime0, epoch_loss = 1, 0, 0.0
 		if refresh_state:
 			self.checkpoint_manager.clear_checkpoints()
 			if self.results_accum is not None:
@@ -285,61 +384,148 @@ class ModelTrainer(object):
 			itime0 = self.train_state.get( 'itime', 0 )
 			epoch_loss = self.train_state.get('loss', float('inf'))
 			nepochs += epoch0
-
-		self.init_data_timestamps()
-		for epoch in range(epoch0,nepochs):
-			epoch_start = time.time()
-			self.model.train()
-			binput, boutput, btarget, nts = None, None, None, len(self.data_timestamps[TSet.Train])
-			lgm().log(f"  ----------- Epoch {epoch}/{nepochs}  nts={nts} ----------- ", display=True )
-			for itime in range (itime0,nts):
-				ctime  = self.data_timestamps[TSet.Train][itime]
-				timeslice: xa.DataArray = self.load_timeslice(ctime)
-				lgm().log(f"TRAIN TIME({ctime}): timeslice={None if timeslice is None else timeslice.shape}")
-				tile_iter = TileIterator.get_iterator( ntiles=timeslice.sizes['tiles'], randomize=True )
-				for ctile in iter(tile_iter):
-					batch_data: Optional[xa.DataArray] = self.get_srbatch(ctile,ctime)
-					lgm().log( f"TRAIN TILE({ctile}): batch={None if batch_data is None else batch_data.shape}" )
-					if batch_data is None: break
-					self.optimizer.zero_grad()
-					binput, boutput, btarget = self.apply_network( batch_data )
-					lgm().log(f"  TRAIN->apply_network: inp{ts(binput)} target{ts(btarget)} prd{ts(boutput)}", display=True )
-					[sloss, mloss] = self.loss(boutput,btarget)
-					tile_iter.register_loss( 'model', sloss )
-					if interp_loss:
-						binterp = upsample(binput)
-						[interp_sloss, interp_multilevel_mloss] = self.loss(btarget, binterp)
-						tile_iter.register_loss('interpolated', interp_sloss)
-					stile = list(ctile.values())
-					xyf = batch_data.attrs.get('xyflip',0)
-					lgm().log(f" ** <{self.model_manager.model_name}> TRAIN E({epoch:3}/{nepochs}) TIME[{itime:3}:{ctime:4}] TILES[{stile[0]:4}:{stile[1]:4}][F{xyf}]-> Loss= {sloss*1000:6.2f} ({interp_sloss*1000:6.2f}): {(sloss/interp_sloss)*100:.2f}%", display=True)
-					mloss.backward()
-					self.optimizer.step()
-
-
-				if binput is not None:   self.input[tset] = binput.detach().cpu().numpy()
-				if btarget is not None:  self.target[tset] = btarget.detach().cpu().numpy()
-				if boutput is not None:  self.product[tset] = boutput.detach().cpu().numpy()
-				[epoch_loss, interp_loss] = [ tile_iter.accumulate_loss(ltype) for ltype in ['model', 'interpolated']]
-				self.checkpoint_manager.save_checkpoint(epoch, itime, TSet.Train, epoch_loss, interp_loss )
-				self.results_accum.record_losses( TSet.Train, epoch-1+itime/nts, epoch_loss, interp_loss, flush=((itime+1) % lossrec_flush_period == 0) )
-
-			if self.scheduler is not None:
-				self.scheduler.step()
-
-			epoch_time = (time.time() - epoch_start)/60.0
-			lgm().log(f'Epoch Execution time: {epoch_time:.1f} min, train-loss: {epoch_loss:.4f}', display=True)
-			self.record_eval( epoch, {TSet.Train: epoch_loss}, TSet.Validation )
-			save_memory_snapshot()
-			itime0 = 0
-
+		return epoch0, itime0, epoch_loss, nepochs
+
+	def batch_loader(self, seed: int, shuffle_buffer: int ) -> Optional[DataLoader]:
+		# Opt-in (task.loader_workers > 0): tile batches are built in forked DataLoader workers, which replaces the timeslice prefetcher (prefetch_depth is ignored).
+		loader_workers: int = cfg().task.get( 'loader_workers', 0 )
+		if loader_workers == 0: return None
+		self.checkpoint_manager.wait()
+		return timeslice_batch_loader( self.get_dataset(), self.data_timestamps[TSet.Train], seed, (shuffle_buffer == 0), num_workers=loader_workers, persistent_workers=cfg().task.get( 'persistent_workers', False ) )
+
+	def timeslice_batches(self, itime0: int, batch_loader: Optional[DataLoader], prefetcher: Optional[TimeslicePrefetcher], shuffler: Optional[TileShuffleBuffer] ) -> Iterator[Tuple[int,TimeType,int,TileIterator,Iterator[Tuple[Dict[str,int],xa.DataArray]]]]:
+		nts: int = len(self.data_timestamps[TSet.Train])
+		if batch_loader is not None:
+			batch_loader.sampler.start = itime0
+			self.checkpoint_manager.wait()
+			timeslice_batches = iter( batch_loader )
+		for itime in range (itime0,nts):
+			ctime  = self.data_timestamps[TSet.Train][itime]
+			if batch_loader is None:
+				ntiles: int = self.load_timeslice(ctime, prefetcher=prefetcher).sizes['tiles']
+				tile_iter = TileIterator.get_iterator( ntiles=ntiles, randomize=(shuffler is None) )
+				tile_batches: Iterable[Tuple[Dict[str,int],xa.DataArray]] = self.tile_batches( tile_iter, ctime )
+			else:
+				btime, ntiles, tile_batches = next( timeslice_batches )
+				assert btime == ctime, f"DataLoader timeslice {btime} does not match training time {ctime}"
+				tile_iter = TileIterator.get_iterator( ntiles=ntiles )
+			lgm().log(f"TRAIN TIME({ctime}): ntiles={ntiles}")
+			yield itime, ctime, ntiles, tile_iter, self.training_batches( tile_batches, shuffler, flush=(itime == nts-1) )
+
+	def fit_batch(self, epoch: int, nepochs: int, itime: int, ctime: TimeType, ctile: Dict[str,int], batch_data: xa.DataArray, tile_iter: TileIterator,
+	              micro_batches: int, interp_loss: bool, cache_interp: bool, log_interval: int ) -> Tuple[Tensor,TensorOrTensors,Tensor]:
+		binput, boutput, btarget, sloss = self.train_step( batch_data, micro_batches )
+		lgm().log(f"  TRAIN->apply_network: inp{ts(binput)} target{ts(btarget)} prd{ts(boutput)}", display=True )
+		tile_iter.register_loss( 'model', sloss )
+		if interp_loss:
+			interp_sloss = self.interp_batch_loss( ctime, ctile, binput, btarget, cache=cache_interp )
+			tile_iter.register_loss('interpolated', interp_sloss)
+		ibatch: int = len(tile_iter.batch_losses('model')) - 1
+		if ibatch % log_interval == 0:
+			self.batch_logs.append( ( ibatch, epoch, nepochs, itime, ctime, list(ctile.values()), batch_data.attrs.get('xyflip',0) ) )
+		return binput, boutput, btarget
+
+	def log_batch_losses(self, model_losses: List[float], interp_losses: List[float] ):
+		# The batch losses selected by fit_batch are logged once they have been synced, at the end of the timeslice.
+		for ibatch, epoch, nepochs, itime, ctime, stile, xyf in self.batch_logs:
+			sloss: float = model_losses[ibatch]
+			interp_sloss: float = interp_losses[ibatch] if (ibatch < len(interp_losses)) else 0.0
+			ratio: str = f"{(sloss/interp_sloss)*100:.2f}%" if (interp_sloss != 0.0) else "--"
+			lgm().log(f" ** <{self.model_manager.model_name}> TRAIN E({epoch:3}/{nepochs}) TIME[{itime:3}:{ctime:4}] TILES[{stile[0]:4}:{stile[1]:4}][F{xyf}]-> Loss= {sloss*1000:6.2f} ({interp_sloss*1000:6.2f}): {ratio}", display=True)
+		self.batch_logs = []
+
+	def record_timeslice(self, epoch: int, itime: int, nts: int, tile_iter: TileIterator, binput: Optional[Tensor], boutput: Optional[TensorOrTensors], btarget: Optional[Tensor] ) -> Optional[float]:
+		lossrec_flush_period, tset = 32, TSet.Train
+		if len(tile_iter.batch_losses('model')) == 0: return None
+		if binput is not None:   self.input[tset] = binput.detach().cpu().numpy()
+		if btarget is not None:  self.target[tset] = btarget.detach().cpu().numpy()
+		if boutput is not None:  self.product[tset] = boutput.detach().float().cpu().numpy()
+		self.log_batch_losses( *[ tile_iter.sync_losses(ltype) for ltype in ['model', 'interpolated'] ] )
+		[epoch_loss, interp_loss] = [ tile_iter.accumulate_loss(ltype) for ltype in ['model', 'interpolated']]
+		self.interp_losses.sync()
+		self.checkpoint_manager.save_checkpoint(epoch, itime, TSet.Train, epoch_loss, interp_loss )
+		self.results_accum.record_losses( TSet.Train, epoch-1+itime/nts, epoch_loss, interp_loss, flush=((itime+1) % lossrec_flush_period == 0) )
+		return epoch_loss
+
+	def end_epoch(self, epoch: int, epoch_start: float, epoch_loss: float ):
+		self.checkpoint_manager.flush()
+		if self.scheduler is not None:
+			self.scheduler.step()
+		epoch_time = (time.time() - epoch_start)/60.0
+		lgm().log(f'Epoch Execution time: {epoch_time:.1f} min, train-loss: {epoch_loss:.4f}', display=True)
+		self.record_eval( epoch, {TSet.Train: epoch_loss}, TSet.Validation )
+		save_memory_snapshot()
+
+	def end_training(self, nepochs: int, train_start: float, epoch_loss: float ) -> Dict[str, float]:
 		train_time = time.time() - train_start
 		ntotal_params = sum(p.numel() for p in self.model.parameters() if p.requires_grad)
 		self.record_eval( nepochs, {},  TSet.Test )
 		print(f'\n -------> Training model with {ntotal_params} wts took {train_time/60:.2f} ({train_time/(60*nepochs):.2f} per epoch) min.')
-		self.current_losses = dict( prediction=epoch_loss, **eval_losses )
+		self.current_losses = dict( prediction=epoch_loss )
 		return self.current_losses
 
+	def interp_batch_loss(self, ctime: TimeType, ctile: Dict[str,int], binput: Tensor, btarget: Tensor, cache: bool = True ) -> Union[float,Tensor]:
+		key: Tuple = ('train',ctime) + tuple(ctile.values())
+		interp_sloss: Optional[Union[float,Tensor]] = self.interp_losses.get( key ) if cache else None
+		if interp_sloss is None:
+			with torch.no_grad():
+				[interp_sloss, interp_multilevel_mloss] = self.loss_tensors( btarget, upsample(binput) )
+			if cache: self.interp_losses.add( key, interp_sloss )
+		return interp_sloss
+
+	def interp_eval_loss(self, ctime: TimeType, ctile: Dict[str,int], binterp: Tensor, btarget: Tensor ) -> Union[float,Tensor]:
+		key: Tuple = ('eval',ctime) + tuple(ctile.values())
+		interp_sloss: Optional[Union[float,Tensor]] = self.interp_losses.get( key )
+		if interp_sloss is None:
+			interp_sloss = self.single_product_loss( binterp, btarget )
+			self.interp_losses.add( key, interp_sloss )
+		return interp_sloss
+
+	def train_step(self, batch_data: xa.DataArray, micro_batches: int = 1 ) -> Tuple[Tensor,TensorOrTensors,Tensor,Tensor]:
+		self.optimizer.zero_grad()
+		ntiles: int = batch_data.sizes['tiles']
+		if micro_batches <= 1:
+			with self.precision.autocast():
+				binput, boutput, btarget = self.apply_network( batch_data )
+			[sloss, mloss] = self.loss_tensors( boutput, btarget )
+			self.precision.backward( mloss )
+			self.precision.step( self.optimizer )
+			return binput, boutput, btarget, sloss
+		results, sloss, layer_losses = [], None, []
+		for tidxs in np.array_split( np.arange(ntiles), min(micro_batches,ntiles) ):
+			weight: float = tidxs.size / ntiles
+			with self.precision.autocast():
+				minput, moutput, mtarget = self.apply_network( batch_data.isel( tiles=slice(tidxs[0],tidxs[-1]+1) ) )
+			[msloss, mloss] = self.loss_tensors( moutput, mtarget )
+			self.precision.backward( mloss * weight )
+			sloss = msloss.double() * weight if (sloss is None) else sloss + msloss.double() * weight
+			layer_losses.append( [ lloss.double() * weight for lloss in self.layer_losses ] )
+			results.append( [ minput.detach(), detach_products(moutput), mtarget.detach() ] )
+		self.precision.step( self.optimizer )
+		self.layer_losses = [ sum(llosses) for llosses in zip(*layer_losses) ]
+		binput, btarget = torch.cat( [r[0] for r in results] ), torch.cat( [r[2] for r in results] )
+		boutputs: List[TensorOrTensors] = [ r[1] for r in results ]
+		boutput: TensorOrTensors = torch.cat(boutputs) if isinstance(boutputs[0], Tensor) else [ torch.cat(level_outputs) for level_outputs in zip(*boutputs) ]
+		return binput, boutput, btarget, sloss
+
+	def tile_batches(self, tile_iter: TileIterator, ctime: TimeType ) -> Iterator[Tuple[Dict[str,int],xa.DataArray]]:
+		for ctile in iter(tile_iter):
+			batch_data: Optional[xa.DataArray] = self.get_srbatch(ctile,ctime)
+			lgm().log( f"TRAIN TILE({ctile}): batch={None if batch_data is None else batch_data.shape}" )
+			if batch_data is None: break
+			yield ctile, batch_data
+
+	def training_batches(self, tile_batches: Iterable[Tuple[Dict[str,int],xa.DataArray]], shuffler: Optional[TileShuffleBuffer], flush: bool = False ) -> Iterator[Tuple[Dict[str,int],xa.DataArray]]:
+		for ctile, batch_data in tile_batches:
+			if shuffler is None:
+				yield ctile, batch_data
+			else:
+				for shuffled_batch in shuffler.add( batch_data ):
+					yield dict( start=shuffler.nbatches-1, end=shuffler.nbatches ), shuffled_batch
+		if flush and (shuffler is not None):
+			for shuffled_batch in shuffler.flush():
+				yield dict( start=shuffler.nbatches-1, end=shuffler.nbatches ), shuffled_batch
+
 	def record_eval(self, epoch: int, losses: Dict[TSet,float], tset: TSet, **kwargs ):
 		if cfg().task.ttsplit.get( tset.value, 0.0 ) > 0.0:
 			eval_results, eval_losses = self.evaluate( tset, update_model=False, **kwargs )
@@ -371,6 +557,7 @@ class ModelTrainer(object):
 		torch.manual_seed(seed)
 		torch.cuda.manual_seed(seed)
 		self.time_index = itime
+		kwargs.setdefault( 'weights_only', True )
 		self.train_state = self.checkpoint_manager.load_checkpoint( TSet.Validation, **kwargs )
 		if self.train_state is None:
 			print( "Error loading checkpoint file, skipping evaluation.")
@@ -379,77 +566,117 @@ class ModelTrainer(object):
 		proc_start = time.time()
 		lgm().log(f" ##### process_image({tset.value}): time_index={self.time_index} ##### ")
 		self.init_data_timestamps()
-		batch_model_losses, batch_interp_losses, interp_sloss, ibatch, batches = [], [], 0.0, 0, []
 		ctime = self.data_timestamps[TSet.Train][itime]
+		halo: int = kwargs.pop( 'halo', cfg().task.get( 'inference_halo', 0 ) )
+		if halo > 0:
+			return self.process_image_overlap( tset, itime, ctime, halo, **kwargs )
 		timeslice: xa.DataArray = self.load_timeslice(ctime)
 		vnames, nvars, cvar = self.target_variables, len(self.target_variables), kwargs.get('var',None)
 		output_vars = [ cvar ] if cvar is not None else vnames
 		print( f"Loaded timeslice{timeslice.dims}{timeslice.shape}, mean={np.nanmean(timeslice.values)}:.3f")
-		tile_iter = TileIterator.get_iterator( ntiles=timeslice.sizes['tiles'] )
-		for itile, ctile in enumerate(iter(tile_iter)):
-			lgm().log(f"     -----------------    evaluate[{tset.name}]: ctime[{itime}]={ctime}, time_index={self.time_index}, ctile[{itile}]={ctile}", display=True)
-			batch_data: Optional[xa.DataArray] = self.get_srbatch(ctile, ctime, shuffle=False)
-			if batch_data is None: break
-			# print( f" --> batch_data{list(batch_data.shape)} mean={batch_data.values.mean()}")
+		mosaics: Dict[str,TileMosaic] = self.image_mosaics( timeslice.coords['tiles'].values, timeslice.attrs['grid_shape'], kwargs.get('mosaic_dir',None) )
+		log_interval: int = max( cfg().task.get('loss_log_interval', 50), 1 )
+		compiled: bool = kwargs.get( 'compiled', False )
+		model_loss_sum, interp_loss_sum, ibatch = 0.0, 0.0, 0
+		tile_iter = TileIterator.get_iterator( ntiles=timeslice.sizes['tiles'], batch_size=cfg().task.get( 'eval_batch_size', cfg().task.batch_size ) )
+		training: bool = self.model.training
+		self.model.eval()
+		with torch.inference_mode():
+			for itile, ctile in enumerate(iter(tile_iter)):
+				lgm().log(f"     -----------------    evaluate[{tset.name}]: ctime[{itime}]={ctime}, time_index={self.time_index}, ctile[{itile}]={ctile}", display=True)
+				batch_data: Optional[xa.DataArray] = self.get_srbatch(ctile, ctime, shuffle=False)
+				if batch_data is None: break
+				with self.precision.autocast():
+					binput, boutput, btarget = self.apply_network( batch_data, compiled=compiled )
+				if binput is not None:
+					boutput = boutput if isinstance(boutput, Tensor) else boutput[-1]
+					binterp = upsample(binput)
+					lgm().log(f"  ->apply_network: inp{ts(binput)} target{ts(btarget)} prd{ts(boutput)} interp{ts(binterp)}")
+					model_sloss, interp_sloss = self.single_product_loss(boutput, btarget), self.interp_eval_loss(ctime, ctile, binterp, btarget)
+					model_loss_sum, interp_loss_sum = model_loss_sum + model_sloss, interp_loss_sum + interp_sloss
+					if ibatch % log_interval == 0:
+						xyf = batch_data.attrs.get('xyflip', 0)
+						sloss, interp_sloss = model_sloss.item(), float(interp_sloss)
+						lgm().log(f" **  ** <{self.model_manager.model_name}:{tset.name}> BATCH[{ibatch:3}]{batch_data.shape} TIME[{itime:3}:{ctime:4}] TILES{list(ctile.values())}[F{xyf}]-> Loss= {sloss*1000:5.1f} ({interp_sloss*1000:5.1f}): {(sloss/interp_sloss)*100:.2f}%", display=True )
+					ibatch = ibatch + 1
+					for image_type, result in dict( input=binput, target=btarget, interpolated=binterp, model=boutput ).items():
+						mosaics[image_type].add( denorm( result.float(), batch_data.attrs ) )
+		self.model.train( training )
+		for mosaic in mosaics.values(): mosaic.flush()
 
-			binput, boutput, btarget = self.apply_network( batch_data )
-			if binput is not None:
-				binterp = upsample(binput)
-				lgm().log(f"  ->apply_network: inp{ts(binput)} target{ts(btarget)} prd{ts(boutput)} interp{ts(binterp)}", display=True )
-				[model_sloss, model_multilevel_loss] = self.loss(boutput, btarget)
-				batch_model_losses.append( model_sloss )
-				[interp_sloss, interp_multilevel_mloss] = self.loss(binterp,btarget)
-				batch_interp_losses.append( interp_sloss )
-				xyf = batch_data.attrs.get('xyflip', 0)
-				sloss = batch_model_losses[-1]
-				lgm().log(f" **  ** <{self.model_manager.model_name}:{tset.name}> BATCH[{ibatch:3}]{batch_data.shape} TIME[{itime:3}:{ctime:4}] TILES{list(ctile.values())}[F{xyf}]-> Loss= {sloss*1000:5.1f} ({interp_sloss*1000:5.1f}): {(sloss/interp_sloss)*100:.2f}%", display=True )
-				ibatch = ibatch + 1
-				batches.append( dict(input=denorm(binput,batch_data.attrs), target=denorm(btarget,batch_data.attrs), interpolated=denorm(binterp,batch_data.attrs), model=denorm(boutput,batch_data.attrs)) )
+		proc_time = time.time() - proc_start
+		model_loss: float = float(model_loss_sum)/ibatch if (ibatch > 0) else float('nan')
+		interp_loss: float = float(interp_loss_sum)/ibatch if (ibatch > 0) else float('nan')
+		self.interp_losses.sync()
+		ntotal_params: int = sum(p.numel() for p in self.model.parameters() if p.requires_grad)
+		lgm().log(f' -------> Exec {tset.value} model with {ntotal_params} wts on {tset.value} tset took {proc_time:.2f} sec, model loss = {model_loss:.4f}')
+		images, losses = {}, {}
+		for ivar, vname in enumerate(output_vars):
+			images[vname] = { image_type: mosaic.image(ivar) for image_type, mosaic in mosaics.items() }
+			losses[vname] = dict( model=model_loss, interpolated=interp_loss )
+		return images, losses
 
+	def process_image_overlap(self, tset: TSet, itime: int, ctime: TimeType, halo: int, **kwargs) -> Tuple[Dict[str,Dict[str,xa.DataArray]], Dict[str,Dict[str,float]]]:
+		proc_start = time.time()
+		vnames, cvar = self.target_variables, kwargs.get('var',None)
+		output_vars = [ cvar ] if cvar is not None else vnames
+		region: xa.DataArray = self.read_region(ctime)
+		tiler = OverlapTiler( region.shape[1:], TileGrid().get_full_tile_size(), halo*self.scale_factor )
+		scene: np.ndarray = tiler.pad( region.values )
+		ntype: str = cfg().task.norm
+		gstats: Optional[Dict[str,np.ndarray]] = self.get_dataset().norm_arrays( 'global', region.coords['channels'].values.tolist() ) if (ntype in ['gnorm','gscale']) else None
+		rows_per_batch: int = max( cfg().task.get( 'eval_batch_size', cfg().task.batch_size ) // tiler.nwindows['x'], 1 )
+		lgm().log(f" ##### process_image_overlap({tset.value}): time_index={itime}, region{list(region.shape)}, halo={halo}, windows{list(tiler.nwindows.values())}, rows/batch={rows_per_batch} ##### ", display=True)
+		blenders: Dict[str,WindowBlender] = {}
+		compiled: bool = kwargs.get( 'compiled', False )
+		model_loss_sum, interp_loss_sum, nloss = 0.0, 0.0, 0
+		training: bool = self.model.training
+		self.model.eval()
+		with torch.inference_mode():
+			for ibatch, rows in enumerate( tiler.row_bands( rows_per_batch ) ):
+				windows: np.ndarray = tiler.windows( scene, rows )
+				valid: np.ndarray = np.isfinite( windows ).any( axis=(2,3) ).all( axis=1 )
+				if not valid.any(): continue
+				ndata, stats = norm_windows( windows[valid], ntype, gstats )
+				batch_data = xa.DataArray( ndata, dims=["tiles", "channels", "y", "x"], coords=dict( channels=region.coords['channels'].values ), attrs=stats )
+				with self.precision.autocast():
+					binput, boutput, btarget = self.apply_network( batch_data, compiled=compiled )
+				boutput = boutput if isinstance(boutput, Tensor) else boutput[-1]
+				binterp = upsample(binput)
+				complete: Tensor = torch.from_numpy( np.isfinite( windows[valid] ).all( axis=(1,2,3) ) ).to( btarget.device )
+				if complete.any():
+					model_loss_sum = model_loss_sum + self.single_product_loss( boutput[complete], btarget[complete] )
+					interp_loss_sum = interp_loss_sum + self.single_product_loss( binterp[complete], btarget[complete] )
+					nloss += 1
+				for image_type, result in dict( input=binput, interpolated=binterp, model=boutput ).items():
+					denormed: np.ndarray = denorm( result.float(), stats )
+					if image_type not in blenders:
+						blenders[image_type] = WindowBlender( tiler, denormed.shape[1], denormed.shape[-1]/tiler.tile_size['x'] )
+					outputs: np.ndarray = np.zeros( (windows.shape[0],)+denormed.shape[1:], dtype=np.float32 )
+					outputs[valid] = denormed
+					blenders[image_type].add( rows, outputs, valid )
+				lgm().log(f" **  ** <{self.model_manager.model_name}:{tset.name}> BATCH[{ibatch:3}] TIME[{itime:3}:{ctime:4}] ROWS[{rows.start}:{rows.stop}] windows={int(valid.sum())}/{windows.shape[0]}")
+		self.model.train( training )
+
+		tindx: np.ndarray = np.isin( region.coords['channels'], self.target_variables ).nonzero()[0]
+		mask: np.ndarray = np.isfinite( scene ).all( axis=0 )
+		lr_mask: np.ndarray = mask.reshape( mask.shape[0]//self.scale_factor, self.scale_factor, mask.shape[1]//self.scale_factor, self.scale_factor ).all( axis=(1,3) )
+		results: Dict[str,np.ndarray] = dict( target=region.values[tindx] )
+		for image_type, blender in blenders.items():
+			rmask: np.ndarray = lr_mask if (image_type == 'input') else mask
+			results[image_type] = np.where( rmask[ :blender.shape['y'], :blender.shape['x'] ], blender.result(), np.nan )
+		model_loss: float = float(model_loss_sum)/nloss if (nloss > 0) else float('nan')
+		interp_loss: float = float(interp_loss_sum)/nloss if (nloss > 0) else float('nan')
+		lgm().log(f' -------> Overlap inference (halo={halo}) on {tset.value} tset took {time.time()-proc_start:.2f} sec, model loss = {model_loss:.4f} ({interp_loss:.4f})', display=True)
 		images, losses = {}, {}
 		for ivar, vname in enumerate(output_vars):
-			images[vname] = self.assemble_images( batches, ivar, timeslice.coords['tiles'].values, timeslice.attrs['grid_shape'] )
-			proc_time = time.time() - proc_start
-			lgm().log(f" --- batch_model_losses = {batch_model_losses}")
-			lgm().log(f" --- batch_interp_losses = {batch_interp_losses}")
-			model_loss: float = np.array(batch_model_losses).mean()
-			ntotal_params: int = sum(p.numel() for p in self.model.parameters() if p.requires_grad)
-			lgm().log(f' -------> Exec {tset.value} model with {ntotal_params} wts on {tset.value} tset took {proc_time:.2f} sec, model loss = {model_loss:.4f}')
-			losses[vname] = dict( model=model_loss, interpolated=np.array(batch_interp_losses).mean() )
+			images[vname] = { image_type: image_array( results[image_type][ivar] ) for image_type in [ 'input', 'target', 'interpolated', 'model' ] if image_type in results }
+			losses[vname] = dict( model=model_loss, interpolated=interp_loss )
 		return images, losses
 
-	def assemble_images(self, batches: List[Dict[str,np.ndarray]], ivar: int, tile_ids: np.ndarray, grid_shape: Dict[str, int] ) -> Dict[str,xa.DataArray]:
-		assembled_images: Dict[str,xa.DataArray] = {}
-		nb: int =  len(batches)
-		itypes: List[str] = list(batches[0].keys())
-		print(f"Assembling {nb} batches with tile_idxs{tile_ids.shape}, grid_shape{grid_shape}, itypes={itypes}")
-
-		for ii, image_type in enumerate(itypes):
-			bsize, tidx0, tidx1 = None, 0, 0
-			block_grid: List[List[np.ndarray]] = None
-			for ib in range(nb):
-				vbatch: np.ndarray = batches[ib][image_type]
-				batch: np.ndarray = vbatch[:,ivar,:,:]
-				tile_shape = list(batch.shape[-2:])
-				bsize = batch.shape[0]
-				if block_grid is None:
-					empty_tile = np.full(tile_shape, np.nan)
-					block_grid = [[empty_tile]*grid_shape['x'] for i in range(grid_shape['y'])]
-				tidx1 = tidx0 + bsize
-				# print(f" ** Processing batch[{ii}][{ib}]: shape={batch.shape}, size={bsize}, tids=[{tidx0},{tidx1}]")
-				for bidx, tidx in enumerate(range(tidx0, tidx1)):
-					tid = int(tile_ids[tidx])
-					tc = dict( y=tid//grid_shape['x'], x=tid%grid_shape['x'] )
-					block: np.ndarray = batch[bidx].squeeze()
-					# print( f" ---> batch[{ib}][{bidx}] tidx={tidx} tid={tid} tc=[{tc['y']},{tc['x']}], block{list(block.shape)}")
-					block_grid[ tc['y'] ][ tc['x'] ] = block
-				tidx0 = tidx1
-			image_data = np.block( block_grid )
-			dims, bnds = ['y', 'x'], [0.0,100.0]
-			coords = { cn: np.arange( bnds[0],bnds[1],(bnds[1]-bnds[0])/image_data.shape[ic]) for ic,cn in enumerate(dims) }
-			assembled_images[image_type] = xa.DataArray(  image_data, dims=dims, coords=coords )
-
-		return assembled_images
+	def image_mosaics(self, tile_ids: np.ndarray, grid_shape: Dict[str, int], mosaic_dir: Optional[str] = None, itypes: Optional[List[str]] = None ) -> Dict[str,TileMosaic]:
+		itypes = ['input', 'target', 'interpolated', 'model'] if (itypes is None) else itypes
+		return { image_type: TileMosaic( tile_ids, grid_shape, None if (mosaic_dir is None) else f"{mosaic_dir}/{image_type}.npy" ) for image_type in itypes }
 
 	def evaluate(self, tset: TSet, **kwargs) -> Tuple[Dict[str,xa.DataArray],Dict[str,float]]:
 		seed = kwargs.get('seed', 333)
@@ -460,6 +687,7 @@ class ModelTrainer(object):
 		self.tile_index = kwargs.get('tile_index', self.tile_index)
 		update_checkpoint = kwargs.get('update_checkpoint', True)
 		if update_checkpoint or (self.train_state is None):
+			kwargs.setdefault( 'weights_only', True )
 			self.train_state = self.checkpoint_manager.load_checkpoint( TSet.Validation, **kwargs )
 			if self.train_state is None:
 				print( "Error loading checkpoint file, skipping evaluation.")
@@ -470,47 +698,56 @@ class ModelTrainer(object):
 		proc_start = time.time()
 		lgm().log(f" ##### evaluate({tset.value}): time_index={self.time_index}, tile_index={self.tile_index}, nts={len(self.data_timestamps[tset])} ##### ",display=True)
 
-		batch_model_losses, batch_interp_losses, interp_sloss = [], [], 0.0
-		binput, boutput, btarget, binterp, ibatch = None, None, None, None, 0
-		for itime, ctime in enumerate(self.data_timestamps[tset]):
-			if (self.time_index < 0) or (itime == self.time_index):
-				self.clear_results(tset)
-				timeslice: xa.DataArray = self.load_timeslice(ctime)
-				tile_iter = TileIterator.get_iterator( ntiles=timeslice.sizes['tiles'] )
-				lgm().log(f" --> tile_iter: ntiles={timeslice.sizes['tiles']} from timeslice{timeslice.dims}{list(timeslice.shape)}")
-				for itile, ctile in enumerate(iter(tile_iter)):
-					if self.tile_in_batch(itile, ctile):
-						lgm().log(f"     -----------------    evaluate[{tset.name}]: ctime[{itime}]={ctime}, time_index={self.time_index}, ctile[{itile}]={ctile}", display=True)
-						batch_data: Optional[xa.DataArray] = self.get_srbatch(ctile, ctime)
-						if batch_data is None: break
-						binput, boutput, btarget = self.apply_network( batch_data )
-						binterp = upsample(binput)
-						lgm().log(f"  ->apply_network: inp{ts(binput)} target{ts(btarget)} prd{ts(boutput)} interp{ts(binterp)}")
-						[model_sloss, model_multilevel_loss] = self.loss(boutput, btarget)
-						batch_model_losses.append( model_sloss )
-						[interp_sloss, interp_multilevel_mloss] = self.loss(binterp,btarget)
-						batch_interp_losses.append( interp_sloss )
-						self.merge_results( tset, itime,  binput, btarget, boutput, binterp)
-						xyf = batch_data.attrs.get('xyflip', 0)
-						sloss = batch_model_losses[-1]
-						lgm().log(f" **  ** <{self.model_manager.model_name}:{tset.name}> BATCH[{ibatch:3}] TIME[{itime:3}:{ctime:4}] TILES{list(ctile.values())}[F{xyf}]-> Loss= {sloss*1000:5.1f} ({interp_sloss*1000:5.1f}): {(sloss/interp_sloss)*100:.2f}%", display=True )
-						ibatch = ibatch + 1
-						if self.tile_index >= 0: break
-				if self.time_index >= 0: break
+		eval_batch_size: int = cfg().task.get( 'eval_batch_size', cfg().task.batch_size )
+		log_interval: int = max( cfg().task.get('loss_log_interval', 50), 1 )
+		compiled: bool = kwargs.get( 'compiled', False )
+		batch_model_losses, batch_interp_losses, ibatch = [], [], 0
+		training: bool = self.model.training
+		self.model.eval()
+		with torch.inference_mode():
+			for itime, ctime in enumerate(self.data_timestamps[tset]):
+				if (self.time_index < 0) or (itime == self.time_index):
+					self.clear_results(tset)
+					timeslice: xa.DataArray = self.load_timeslice(ctime)
+					ntiles, nrows = timeslice.sizes['tiles'], 0
+					tile_iter = TileIterator.get_iterator( ntiles=ntiles, batch_size=eval_batch_size )
+					lgm().log(f" --> tile_iter: ntiles={ntiles}, eval_batch_size={eval_batch_size} from timeslice{timeslice.dims}{list(timeslice.shape)}")
+					for itile, ctile in enumerate(iter(tile_iter)):
+						if self.tile_in_batch(itile, ctile):
+							lgm().log(f"     -----------------    evaluate[{tset.name}]: ctime[{itime}]={ctime}, time_index={self.time_index}, ctile[{itile}]={ctile}", display=True)
+							batch_data: Optional[xa.DataArray] = self.get_srbatch(ctile, ctime)
+							if batch_data is None: break
+							with self.precision.autocast():
+								binput, boutput, btarget = self.apply_network( batch_data, compiled=compiled )
+							boutput = boutput if isinstance(boutput, Tensor) else boutput[-1]
+							binterp = upsample(binput)
+							lgm().log(f"  ->apply_network: inp{ts(binput)} target{ts(btarget)} prd{ts(boutput)} interp{ts(binterp)}")
+							batch_model_losses.append( self.single_product_loss(boutput, btarget) )
+							batch_interp_losses.append( self.interp_eval_loss(ctime, ctile, binterp, btarget) )
+							nrows = self.store_results( tset, nrows, ntiles, binput, btarget, boutput, binterp )
+							if ibatch % log_interval == 0:
+								xyf = batch_data.attrs.get('xyflip', 0)
+								sloss, interp_sloss = batch_model_losses[-1].item(), float(batch_interp_losses[-1])
+								lgm().log(f" **  ** <{self.model_manager.model_name}:{tset.name}> BATCH[{ibatch:3}] TIME[{itime:3}:{ctime:4}] TILES{list(ctile.values())}[F{xyf}]-> Loss= {sloss*1000:5.1f} ({interp_sloss*1000:5.1f}): {(sloss/interp_sloss)*100:.2f}%", display=True )
+							ibatch = ibatch + 1
+							if self.tile_index >= 0: break
+					self.trim_results( tset, nrows )
+					if self.time_index >= 0: break
+		self.model.train( training )
 
 		proc_time = time.time() - proc_start
-		lgm().log(f" --- batch_model_losses = {batch_model_losses}")
-		lgm().log(f" --- batch_interp_losses = {batch_interp_losses}")
-		model_loss: float = np.array(batch_model_losses).mean()
+		model_loss: float = mean_loss( batch_model_losses )
+		interp_loss: float = mean_loss( batch_interp_losses )
+		self.interp_losses.sync()
+		lgm().log(f" --- {tset.name} losses: model={model_loss:.5f}, interp={interp_loss:.5f}, nbatches={ibatch}")
 		ntotal_params: int = sum(p.numel() for p in self.model.parameters() if p.requires_grad)
 		if tset == TSet.Validation:
 			if (model_loss < self.validation_loss) or (self.validation_loss == 0.0):
 				if update_checkpoint and (self.validation_loss > 0.0):
-					interp_loss: float = np.array(batch_interp_losses).mean()
 					self.checkpoint_manager.save_checkpoint( epoch, 0, TSet.Validation, model_loss, interp_loss )
 				self.validation_loss = model_loss
 		lgm().log(f' -------> Exec {tset.value} model with {ntotal_params} wts on {tset.value} tset took {proc_time:.2f} sec, model loss = {model_loss:.4f}')
-		losses = dict( model=model_loss, interpolated=np.array(batch_interp_losses).mean() )
+		losses = dict( model=model_loss, interpolated=interp_loss )
 		results = dict( input=self.get_ml_input(tset), target=self.get_ml_target(tset), model=self.get_ml_product(tset), interpolated=self.get_ml_interp(tset) )
 		return  results, losses
 
@@ -520,14 +757,27 @@ class ModelTrainer(object):
 		self.product[tset] = None
 		self.interp[tset]  = None
 
-	def merge_results(self, tset: TSet, itime: int,  input: Tensor, target: Tensor, output: Tensor, interp: Tensor):
-		self.input[tset]   = merge_results_tiles( self.input.get(tset),   input  )
-		self.target[tset]  = merge_results_tiles( self.target.get(tset),  target )
-		self.product[tset] = merge_results_tiles( self.product.get(tset), output )
-		self.interp[tset]  = merge_results_tiles( self.interp.get(tset),  interp )
+	def store_results(self, tset: TSet, offset: int, nrows: int, input: Tensor, target: Tensor, output: Tensor, interp: Tensor) -> int:
+		self.input[tset]   = store_results_tiles( self.input.get(tset),   offset, nrows, input  )
+		self.target[tset]  = store_results_tiles( self.target.get(tset),  offset, nrows, target )
+		self.product[tset] = store_results_tiles( self.product.get(tset), offset, nrows, output )
+		self.interp[tset]  = store_results_tiles( self.interp.get(tset),  offset, nrows, interp )
+		return offset + input.shape[0]
+
+	def trim_results(self, tset: TSet, nrows: int):
+		for results in [ self.input, self.target, self.product, self.interp ]:
+			if results.get(tset) is not None:
+				results[tset] = results[tset][:nrows]
+
+	def inference_model(self, input_tensor: Tensor ) -> Callable[[Tensor],TensorOrTensors]:
+		backend: str = cfg().task.get( 'inference_backend', 'eager' )
+		if backend == 'eager': return self.model
+		if (self.inference_engine is None) or not self.inference_engine.matches( self.model, input_tensor.shape, backend ):
+			self.inference_engine = InferenceEngine( self.model, self.model_manager.model_name, input_tensor.shape, backend )
+		return self.inference_engine
 
 	@exception_handled
-	def apply_network(self, target_data: xa.DataArray ) -> Tuple[Tensor,TensorOrTensors,Tensor]:
+	def apply_network(self, target_data: xa.DataArray, compiled: bool = False ) -> Tuple[Tensor,TensorOrTensors,Tensor]:
 		icdim = list(target_data.dims).index('channels')
 		input_tensor: Tensor = array2tensor( target_data )
 		dsample = cfg().task.get('data_downsample',1.0)
@@ -536,9 +786,10 @@ class ModelTrainer(object):
 		target_channels: List[str] = cfg().task.target_variables
 		output_tensor: Tensor = input_tensor
 		if target_data.shape[icdim] > len(target_channels):
-			tindx: Tensor = array2tensor( np.in1d(target_data.coords['channels'], target_channels).nonzero()[0] )
+			tindx: Tensor = torch.from_numpy( np.in1d(target_data.coords['channels'], target_channels).nonzero()[0] ).to( input_tensor.device )
 			output_tensor = torch.index_select(input_tensor, icdim, tindx)
 		input_tensor = downsample( input_tensor )
-		result_tensor: TensorOrTensors = self.model( input_tensor )
+		model: Callable[[Tensor],TensorOrTensors] = self.inference_model( input_tensor ) if compiled else self.model
+		result_tensor: TensorOrTensors = model( input_tensor )
 		return input_tensor, result_tensor, output_tensor
 
@@ -0,0 +1,147 @@
+import torch, time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TypeVar
+from omegaconf import DictConfig, OmegaConf
+from sres.base.util.config import ConfigContext, cfg
+from sres.base.util.logging import lgm
+from sres.controller.config import TSet
+from sres.controller.dual_trainer import ModelTrainer
+from sres.data.prefetch import TimeslicePrefetcher
+from sres.data.tiles import TileIterator, TileShuffleBuffer
+
+T = TypeVar('T')
+
+# Configuration keys that determine the training batches.
+DATA_KEYS: Dict[str,List[str]] = dict(
+	task=[ 'name', 'dataset', 'batch_size', 'ttsplit', 'roi', 'origin', 'tile_grid', 'tile_size', 'batch_domain', 'norm', 'conform_to_grid', 'xyflip',
+	       'data_downsample', 'upsample_mode', 'downsample_mode', 'shuffle_buffer', 'input_variables', 'target_variables', 'forcing_variables' ],
+	dataset=[ 'dataset_root', 'dataset_files', 'template', 'roi', 'nx' ] )
+
+def data_config( config: DictConfig ) -> Dict[str,Any]:
+	# Compared unresolved: the stock dataset configs interpolate mandatory ('???') values, e.g. into dataset_files.
+	dconfig: Dict[str,Any] = {}
+	for section, keys in DATA_KEYS.items():
+		values: Dict[str,Any] = OmegaConf.to_container( config[section], resolve=False )
+		dconfig[section] = { key: values.get( key ) for key in keys }
+	dconfig['downscale_factors'] = list( config.model.downscale_factors )
+	return dconfig
+
+class SweepMember(object):
+	"""
+	A model of a training sweep: its ModelTrainer (model, optimizer, CheckpointManager, ResultsAccumulator) together with
+	the configuration it was built under, which is reactivated whenever the member is trained or evaluated.
+	"""
+
+	def __init__(self, cc: ConfigContext, lead: Optional["SweepMember"] = None ):
+		# Members after the first (lead) share its BatchDataset instead of building their own.
+		self.trainer: ModelTrainer = ModelTrainer( cc, None if (lead is None) else lead.trainer.get_dataset() )
+		self.cfg: DictConfig = ConfigContext.cfg
+		self.configuration: Dict[str,Any] = dict( ConfigContext.configuration )
+		self.epoch0, self.itime0, self.nepochs, self.epoch_loss = 1, 0, 0, 0.0
+		self.tile_iter: Optional[TileIterator] = None
+		self.results: Tuple = ( None, None, None )
+
+	@property
+	def model_name(self) -> str:
+		return self.trainer.model_name
+
+	@contextmanager
+	def active(self) -> Iterator[ModelTrainer]:
+		cfg0, configuration0 = ConfigContext.cfg, ConfigContext.configuration
+		ConfigContext.cfg, ConfigContext.configuration = self.cfg, self.configuration
+		try:
+			yield self.trainer
+		finally:
+			ConfigContext.cfg, ConfigContext.configuration = cfg0, configuration0
+
+	def training(self, epoch: int, itime: Optional[int] = None ) -> bool:
+		started: bool = (epoch >= self.epoch0) if (itime is None) else ( (epoch, itime) >= (self.epoch0, self.itime0) )
+		return started and ( epoch < self.nepochs )
+
+	def iterate(self, iterator: Iterator[T] ) -> Iterator[T]:
+		while True:
+			with self.active():
+				try:
+					item: T = next( iterator )
+				except StopIteration:
+					return
+			yield item
+
+class SweepTrainer(object):
+	"""
+	Trains several models from a single data pass: timeslices and tile batches are read, normalized (and shuffled) once
+	by the data pipeline of the first (lead) member, and each batch is fed to every member in turn.  The members must
+	share the data configuration (the DATA_KEYS of task and dataset, and downscale_factors); models resuming from a checkpoint skip the
+	timeslices they have already been trained on.
+	"""
+
+	def __init__(self, members: List[SweepMember] ):
+		self.members: List[SweepMember] = members
+		self.lead: SweepMember = members[0]
+		lead_config: Dict[str,Any] = data_config( self.lead.cfg )
+		for member in members[1:]:
+			mconfig: Dict[str,Any] = data_config( member.cfg )
+			for section, value in lead_config.items():
+				if mconfig[section] != value:
+					raise Exception( f"SweepTrainer: '{section}' configuration of model {member.model_name} differs from {self.lead.model_name}" )
+
+	def train(self, nepochs: int, refresh_state: bool, **kwargs) -> Dict[str,Dict[str,float]]:
+		if nepochs == 0: return {}
+		interp_loss = kwargs.get('interp_loss', False)
+		seed = kwargs.get('seed', 4456)
+		with self.lead.active() as lead:
+			prefetch_depth: int = cfg().task.get('prefetch_depth', 0)
+			shuffle_buffer: int = cfg().task.get('shuffle_buffer', 0)
+			log_interval: int = max( cfg().task.get('loss_log_interval', 50), 1 )
+		torch.manual_seed(seed)
+		torch.cuda.manual_seed(seed)
+		train_start = time.time()
+		for member in self.members:
+			with member.active() as trainer:
+				member.epoch0, member.itime0, member.epoch_loss, member.nepochs = trainer.init_training( nepochs, refresh_state )
+		with self.lead.active() as lead:
+			lead.init_data_timestamps()
+			batch_loader = lead.batch_loader( seed, shuffle_buffer )
+		for member in self.members[1:]:
+			member.trainer.share_data( lead )
+		epoch0, itime0 = min( (member.epoch0, member.itime0) for member in self.members )
+		nts: int = len(lead.data_timestamps[TSet.Train])
+		for epoch in range( epoch0, max( member.nepochs for member in self.members ) ):
+			epoch_start = time.time()
+			members: List[SweepMember] = [ member for member in self.members if member.training(epoch) ]
+			lgm().log(f"  ----------- Sweep Epoch {epoch}: models={[member.model_name for member in members]}, nts={nts} ----------- ", display=True )
+			for member in members:
+				member.trainer.model.train()
+				member.results = ( None, None, None )
+			with self.lead.active():
+				prefetcher = TimeslicePrefetcher( lead.read_timeslice, lead.data_timestamps[TSet.Train][itime0:nts], prefetch_depth ) if (prefetch_depth > 0) and (batch_loader is None) else None
+				shuffler = TileShuffleBuffer( shuffle_buffer, cfg().task.batch_size, seed+epoch ) if (shuffle_buffer > 0) else None
+			if batch_loader is not None:
+				for member in self.members: member.trainer.checkpoint_manager.wait()
+			for itime, ctime, ntiles, tile_iter, tile_batches in self.lead.iterate( lead.timeslice_batches( itime0, batch_loader, prefetcher, shuffler ) ):
+				tmembers: List[SweepMember] = [ member for member in members if member.training( epoch, itime ) ]
+				for member in tmembers:
+					with member.active():
+						member.tile_iter = TileIterator.get_iterator( ntiles=ntiles )
+				for ctile, batch_data in self.lead.iterate( tile_batches ):
+					for member in tmembers:
+						with member.active() as trainer:
+							member.results = trainer.fit_batch( epoch, member.nepochs, itime, ctime, ctile, batch_data, member.tile_iter, cfg().task.get('micro_batches', 1), interp_loss, (shuffler is None), log_interval )
+				for member in tmembers:
+					with member.active() as trainer:
+						timeslice_loss: Optional[float] = trainer.record_timeslice( epoch, itime, nts, member.tile_iter, *member.results )
+						if timeslice_loss is not None: member.epoch_loss = timeslice_loss
+
+			if prefetcher is not None:
+				prefetcher.close()
+				lead.prefetch_stats = prefetcher.stats()
+			for member in members:
+				with member.active() as trainer:
+					trainer.end_epoch( epoch, epoch_start, member.epoch_loss )
+			itime0 = 0
+
+		losses: Dict[str,Dict[str,float]] = {}
+		for member in self.members:
+			with member.active() as trainer:
+				losses[member.model_name] = trainer.end_training( member.nepochs, train_start, member.epoch_loss )
+		return losses
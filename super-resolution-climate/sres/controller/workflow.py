@@ -2,6 +2,7 @@ import time
 import xarray as xa
 from sres.base.util.config import ConfigContext, cfg, config
 from sres.controller.dual_trainer import ModelTrainer
+from sres.controller.sweep import SweepMember, SweepTrainer
 from sres.base.util.logging import lgm, exception_handled, log_timing
 from sres.data.inference import save_inference_results, load_inference_results
 from sres.base.gpu import save_memory_snapshot
@@ -27,6 +28,8 @@ class WorkflowController(object):
 
 
 	def train(self, models: List[str], **kwargs):
+		if kwargs.pop( 'single_pass', False ) and (len(models) > 1):
+			return self.train_sweep( models, **kwargs )
 		for model in models:
 			with ConfigContext(self.cname, model=model, **kwargs) as cc:
 				try:
@@ -40,6 +43,25 @@ class WorkflowController(object):
 
 				lgm().log(f"Completed training model: {model}")
 
+	def train_sweep(self, models: List[str], **kwargs) -> Dict[str,Dict[str,float]]:
+		members: List[SweepMember] = []
+		try:
+			for model in models:
+				with ConfigContext(self.cname, model=model, **kwargs) as cc:
+					self.config = cc
+					args: argparse.Namespace = self.get_args()
+					members.append( SweepMember( cc, members[0] if (len(members) > 0) else None ) )
+			losses = SweepTrainer( members ).train( args.nepochs, args.refresh, seed=self.seed, interp_loss=self.interp_loss )
+			lgm().log(f"Completed training models: {models}")
+			return losses
+		except Exception as e:
+			lgm().exception( "Exception while training models: %s" % str(e) )
+			if len(members) > 0:
+				with members[-1].active(): save_memory_snapshot()
+			raise
+		finally:
+			if len(members) > 0: self.trainer = members[-1].trainer
+
 	def get_args(self) -> argparse.Namespace:
 		argparser = argparse.ArgumentParser(description=f'Execute workflow {self.cname}')
 		argparser.add_argument('-r', '--refresh', action='store_true', help="Refresh workflow by deleting existing checkpoints and learning stats")
@@ -48,6 +70,7 @@ class WorkflowController(object):
 
 	def inference(self, timestep: int, data_structure: ResultStructure,  **kwargs)-> Tuple[Dict[str,Dict[str,xa.DataArray]], Dict[str,Dict[str,float]] ]:
 			varnames = self.trainer.target_variables
+			kwargs.setdefault( 'compiled', cfg().task.get( 'inference_compiled', False ) )
 			if   data_structure == ResultStructure.Image:
 				image_results, eval_results = self.trainer.process_image(TSet.Validation, timestep, interp_loss=True, update_model=True, **kwargs)
 			elif data_structure == ResultStructure.Tiles:
@@ -14,6 +14,7 @@ from sres.base.io.loader import batches_date_range, nbatches, batchDomain
 from sres.controller.config import TSet, srRes
 from sres.base.source.batch import SRBatch
 from sres.base.util.config import cfg
+from sres.base.util.array import array2tensor
 import pandas as pd
 
 TimedeltaLike = Any  # Something convertible to pd.Timedelta.
@@ -144,6 +145,18 @@ class BatchDataset(object):
     def load_timeslice(self, ctime: TimeType, **kwargs) -> Optional[xa.DataArray]:
         return self.srbatch.load_timeslice( ctime, **kwargs )
 
+    def read_timeslice(self, ctime: TimeType) -> xa.DataArray:
+        return self.srbatch.read_timeslice( ctime )
+
+    def read_region(self, ctime: TimeType) -> xa.DataArray:
+        return self.srbatch.read_region( ctime )
+
+    def prepare_norms(self):
+        self.srbatch.prepare_norms()
+
+    def norm_arrays(self, scope: str, channels: List[str] ) -> Dict[str,np.ndarray]:
+        return self.srbatch.norm_arrays( scope, channels )
+
     def get_current_batch_array(self) -> xa.DataArray:
         return self.srbatch.current_batch
 
@@ -244,5 +257,4 @@ class BatchDataset(object):
         return device
 
     def array2tensor(self, darray: xa.DataArray) -> Tensor:
-        array_data: np.ndarray = np.ravel(darray.values).reshape(darray.shape)
-        return torch.tensor(array_data, device=self.get_device(), requires_grad=True)
\ No newline at end of file
+        return array2tensor( darray, device=self.get_device() )
\ No newline at end of file
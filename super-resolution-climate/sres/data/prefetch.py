@@ -0,0 +1,120 @@
+import threading, time, random, torch, numpy as np, xarray as xa
+from queue import Queue, Empty, Full
+from torch.utils.data import Dataset, DataLoader, Sampler
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from sres.base.util.dates import TimeType
+from sres.base.util.logging import lgm
+from sres.base.util.config import bind_config
+from sres.data.batch import BatchDataset
+from sres.data.tiles import TileIterator
+
+TileBatches = List[Tuple[Dict[str,int],xa.DataArray]]
+
+def seed_worker( worker_id: int ):
+    wseed: int = torch.initial_seed() % 2**32
+    random.seed( wseed )
+    np.random.seed( wseed )
+
+def unbatched( item: Any ) -> Any:
+    return item
+
+class TimeslicePrefetcher(object):
+    """
+    Loads (and tiles) the timeslices of an ordered list of times on a worker thread, keeping up to
+    'depth' timeslices queued ahead of the consumer.  Time spent by the consumer waiting on the queue
+    is recorded as stall time.
+    """
+
+    def __init__(self, loader: Callable[[TimeType], xa.DataArray], ctimes: List[TimeType], depth: int = 1 ):
+        self.loader = loader
+        self.ctimes: List[TimeType] = list(ctimes)
+        self.depth: int = max( depth, 1 )
+        self.queue: Queue = Queue( maxsize=self.depth )
+        self.stall_times: List[float] = []
+        self.load_times: List[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread( target=bind_config( self._run ), name="TimeslicePrefetcher", daemon=True )
+        self._thread.start()
+
+    def _run(self):
+        for ctime in self.ctimes:
+            if self._stop.is_set(): return
+            t0 = time.time()
+            try:
+                item: Tuple[TimeType,Optional[xa.DataArray],Optional[Exception]] = ( ctime, self.loader(ctime), None )
+            except Exception as err:
+                item = ( ctime, None, err )
+            self.load_times.append( time.time() - t0 )
+            while not self._stop.is_set():
+                try:
+                    self.queue.put( item, timeout=0.5 )
+                    break
+                except Full:
+                    continue
+
+    def next(self, ctime: TimeType) -> xa.DataArray:
+        t0 = time.time()
+        qtime, timeslice, err = self.queue.get()
+        self.stall_times.append( time.time() - t0 )
+        if err is not None: raise err
+        assert qtime == ctime, f"Prefetched timeslice {qtime} does not match requested time {ctime}"
+        return timeslice
+
+    def stats(self) -> Dict[str,float]:
+        stalls = np.array( self.stall_times ) if len(self.stall_times) > 0 else np.zeros(1)
+        loads = np.array( self.load_times ) if len(self.load_times) > 0 else np.zeros(1)
+        return dict( nloads=len(self.stall_times), stall_total=float(stalls.sum()), stall_mean=float(stalls.mean()), stall_max=float(stalls.max()), load_mean=float(loads.mean()) )
+
+    def close(self):
+        self._stop.set()
+        while True:
+            try:    self.queue.get_nowait()
+            except Empty: break
+        self._thread.join()
+        st = self.stats()
+        lgm().log( f" *** Prefetch[depth={self.depth}]: {st['nloads']} timeslices, stall time total={st['stall_total']:.2f} mean={st['stall_mean']:.3f} max={st['stall_max']:.3f} sec, load time mean={st['load_mean']:.3f} sec", display=True )
+
+class TimesliceBatches(Dataset):
+    """
+    Map-style dataset over the training timeslices: item i is the list of (ctile, batch) tile batches of
+    timeslice ctimes[i], loaded, normalized and flipped (task.xyflip) by a DataLoader worker.
+    """
+
+    def __init__(self, dataset: BatchDataset, ctimes: List[TimeType], randomize: bool ):
+        self.dataset: BatchDataset = dataset
+        self.ctimes: List[TimeType] = list(ctimes)
+        self.randomize: bool = randomize
+
+    def __len__(self) -> int:
+        return len(self.ctimes)
+
+    def __getitem__(self, index: int ) -> Tuple[TimeType,int,TileBatches]:
+        ctime: TimeType = self.ctimes[index]
+        ntiles: int = self.dataset.load_timeslice( ctime ).sizes['tiles']
+        tile_iter: TileIterator = TileIterator.get_iterator( ntiles=ntiles, randomize=self.randomize )
+        batches: TileBatches = []
+        for ctile in iter(tile_iter):
+            batch_data: Optional[xa.DataArray] = self.dataset.get_batch_array( ctile, ctime )
+            if batch_data is None: break
+            batches.append( (ctile, batch_data) )
+        return ctime, ntiles, batches
+
+class TimesliceSampler(Sampler):
+
+    def __init__(self, ntimes: int ):
+        self.ntimes: int = ntimes
+        self.start: int = 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter( range(self.start, self.ntimes) )
+
+    def __len__(self) -> int:
+        return self.ntimes - self.start
+
+def timeslice_batch_loader( dataset: BatchDataset, ctimes: List[TimeType], seed: int, randomize: bool, **kwargs ) -> DataLoader:
+    num_workers: int = kwargs.get( 'num_workers', 0 )
+    persistent: bool = bool( kwargs.get( 'persistent_workers', False ) )
+    lgm().log( f" *** timeslice_batch_loader (replaces the timeslice prefetcher): {len(ctimes)} timeslices, num_workers={num_workers}, persistent={persistent}, seed={seed}", display=True )
+    dataset.prepare_norms()
+    return DataLoader( TimesliceBatches( dataset, ctimes, randomize ), batch_size=None, sampler=TimesliceSampler( len(ctimes) ), num_workers=num_workers,
+                       collate_fn=unbatched, worker_init_fn=seed_worker, generator=torch.Generator().manual_seed(seed), multiprocessing_context=( 'fork' if num_workers > 0 else None ), persistent_workers=persistent )
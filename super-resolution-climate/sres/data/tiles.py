@@ -1,10 +1,19 @@
-import math, random, numpy as np
-from typing import Dict, Tuple, List, Optional
+import math, random, os, torch, numpy as np, xarray as xa
+from typing import Dict, Tuple, List, Optional, Iterator, Union
 from sres.base.io.loader import batchDomain
 from sres.controller.config import TSet
 from sres.base.util.config import cfg
 from sres.base.util.logging import lgm, log_timing
 
+def host_losses( losses: List[Union[float,torch.Tensor]] ) -> List[float]:
+    # Converts a list of (device) loss tensors and floats to floats, with a single host sync.
+    tidxs: List[int] = [ i for i, loss in enumerate(losses) if isinstance( loss, torch.Tensor ) ]
+    if len(tidxs) == 0: return list(losses)
+    values: List[float] = torch.stack( [ losses[i].detach().float() for i in tidxs ] ).cpu().tolist()
+    result: List[float] = list(losses)
+    for i, value in zip( tidxs, values ): result[i] = value
+    return result
+
 class TileIterator(object):
 
     def __init__(self, **kwargs ):
@@ -19,11 +28,15 @@ class TileIterator(object):
     def clear_batch_losses(self, ltype):
         self._batch_losses[ltype] = []
 
-    def register_loss(self, ltype: str, loss: float ):
+    def register_loss(self, ltype: str, loss: Union[float,torch.Tensor] ):
         self.batch_losses(ltype).append( loss )
 
+    def sync_losses(self, ltype: str) -> List[float]:
+        self._batch_losses[ltype] = host_losses( self.batch_losses(ltype) )
+        return self._batch_losses[ltype]
+
     def accumulate_loss(self, ltype: str):
-        accum_loss = np.array(self.batch_losses(ltype)).mean()
+        accum_loss = np.array( self.sync_losses(ltype), dtype=np.float64 ).mean()
         self.clear_batch_losses(ltype)
         return accum_loss
 
@@ -49,7 +62,7 @@ class TileBatchIterator(TileIterator):
 
     def __init__(self, **kwargs ):
         super(TileBatchIterator, self).__init__(**kwargs)
-        self.batch_size: int = cfg().task.batch_size
+        self.batch_size: int = kwargs.get( 'batch_size', cfg().task.batch_size )
         self.ntiles: int = kwargs.get('ntiles',0)
         assert self.ntiles > 0, "Must provide ntiles for TileBatchIterator"
         self.batch_start_idxs: List[int] = list(range(0,self.ntiles,self.batch_size))
@@ -97,6 +110,180 @@ class TileGridIterator(TileIterator):
         self.next_index = self.index + 1
         return result
 
+class TileShuffleBuffer(object):
+    """
+    Streaming tile sampler: tile batches (in their sequential load order) are added to a fixed-capacity
+    buffer, and batches of randomly selected tiles are drawn out whenever the buffer is full, so that
+    training batches mix tiles from many timeslices while memory stays bounded by the buffer capacity.
+    """
+
+    def __init__(self, capacity: int, batch_size: int, seed: int = 0 ):
+        self.batch_size: int = batch_size
+        self.capacity: int = max( capacity, batch_size )
+        self.rng = np.random.default_rng( seed )
+        self.size: int = 0
+        self.nbatches: int = 0
+        self.data: Optional[np.ndarray] = None
+        self.tile_ids: Optional[np.ndarray] = None
+        self.stats: Dict[str,np.ndarray] = {}
+        self.dims: Tuple[str,...] = None
+        self.coords: Dict[str,np.ndarray] = {}
+
+    def allocate(self, batch: xa.DataArray ):
+        ntiles = batch.shape[0]
+        self.dims = batch.dims
+        self.coords = { cn: batch.coords[cn].values for cn in batch.dims[1:] if cn in batch.coords }
+        self.data = np.empty( (self.capacity,) + batch.shape[1:], dtype=batch.dtype )
+        self.tile_ids = np.empty( self.capacity, dtype=np.int64 )
+        self.stats = { sn: np.empty( (self.capacity,) + sv.shape[1:], dtype=sv.dtype ) for sn, sv in batch.attrs.items() if isinstance(sv, np.ndarray) and (sv.ndim > 0) and (sv.shape[0] == ntiles) }
+        lgm().log( f" *** TileShuffleBuffer: capacity={self.capacity} tiles, data{list(self.data.shape)}, stats={list(self.stats.keys())}" )
+
+    def add(self, batch: xa.DataArray ) -> Iterator[xa.DataArray]:
+        if self.data is None: self.allocate( batch )
+        bdata: np.ndarray = batch.values
+        tids: np.ndarray = batch.coords['tiles'].values
+        i0 = 0
+        while i0 < bdata.shape[0]:
+            n = min( self.capacity - self.size, bdata.shape[0] - i0 )
+            self.data[self.size:self.size+n] = bdata[i0:i0+n]
+            self.tile_ids[self.size:self.size+n] = tids[i0:i0+n]
+            for sn, sv in self.stats.items():
+                sv[self.size:self.size+n] = batch.attrs[sn][i0:i0+n]
+            self.size, i0 = self.size + n, i0 + n
+            if self.size == self.capacity:
+                yield self.draw( self.batch_size )
+
+    def flush(self) -> Iterator[xa.DataArray]:
+        while self.size > 0:
+            yield self.draw( min( self.batch_size, self.size ) )
+
+    def draw(self, n: int ) -> xa.DataArray:
+        idx: np.ndarray = self.rng.choice( self.size, n, replace=False )
+        data, tile_ids, stats = self.data[idx], self.tile_ids[idx], { sn: sv[idx] for sn, sv in self.stats.items() }
+        nkeep = self.size - n
+        holes: np.ndarray = idx[ idx < nkeep ]
+        tail: np.ndarray = np.setdiff1d( np.arange( nkeep, self.size ), idx )
+        self.data[holes] = self.data[tail]
+        self.tile_ids[holes] = self.tile_ids[tail]
+        for sv in self.stats.values(): sv[holes] = sv[tail]
+        self.size = nkeep
+        self.nbatches += 1
+        return xa.DataArray( data, dims=self.dims, coords=dict( tiles=tile_ids, **self.coords ), attrs=stats )
+
+def image_array( image_data: np.ndarray ) -> xa.DataArray:
+    dims, bnds = ['y', 'x'], [0.0,100.0]
+    coords = { cn: np.arange( bnds[0],bnds[1],(bnds[1]-bnds[0])/image_data.shape[ic]) for ic,cn in enumerate(dims) }
+    return xa.DataArray( image_data, dims=dims, coords=coords )
+
+def taper( size: int, ramp: int ) -> np.ndarray:
+    weights: np.ndarray = np.ones( size, dtype=np.float32 )
+    if ramp > 0:
+        rise: np.ndarray = 0.5 - 0.5*np.cos( np.pi * (np.arange(ramp) + 0.5) / ramp )
+        weights[:ramp], weights[size-ramp:] = rise, rise[::-1]
+    return weights
+
+class TileMosaic(object):
+    """
+    Preallocated (channels, ny*ty, nx*tx) image assembled from tile batches: the tiles of each batch are
+    scattered into place by their grid index (from tile_ids) in one vectorized assignment, for all channels
+    at once.  If 'path' is given the mosaic is an on-disk (.npy) memmap.  Grid cells without tiles are NaN.
+    """
+
+    def __init__(self, tile_ids: np.ndarray, grid_shape: Dict[str,int], path: Optional[str] = None ):
+        self.tile_ids: np.ndarray = np.asarray( tile_ids, dtype=np.int64 )
+        self.grid_shape: Dict[str,int] = grid_shape
+        self.path: Optional[str] = path
+        self.data: Optional[np.ndarray] = None
+        self.blocks: Optional[np.ndarray] = None
+        self.ntiles: int = 0
+
+    def allocate(self, batch: np.ndarray ):
+        nc, ty, tx = batch.shape[1:]
+        ny, nx = self.grid_shape['y'], self.grid_shape['x']
+        if self.path is None:
+            self.data = np.full( (nc, ny*ty, nx*tx), np.nan, dtype=batch.dtype )
+        else:
+            os.makedirs( os.path.dirname(os.path.abspath(self.path)), exist_ok=True )
+            self.data = np.lib.format.open_memmap( self.path, mode='w+', dtype=batch.dtype, shape=(nc, ny*ty, nx*tx) )
+            self.data[...] = np.nan
+        self.blocks = self.data.reshape( nc, ny, ty, nx, tx )
+
+    def add(self, batch: np.ndarray, tidx0: Optional[int] = None ):
+        if self.data is None: self.allocate( batch )
+        tidx0 = self.ntiles if (tidx0 is None) else tidx0
+        tids: np.ndarray = self.tile_ids[ tidx0: tidx0+batch.shape[0] ]
+        self.blocks[ :, tids//self.grid_shape['x'], :, tids%self.grid_shape['x'], : ] = batch
+        self.ntiles = tidx0 + batch.shape[0]
+
+    def image(self, ivar: int ) -> xa.DataArray:
+        return image_array( self.data[ivar] )
+
+    def flush(self):
+        if isinstance( self.data, np.memmap ): self.data.flush()
+
+class OverlapTiler(object):
+    """
+    Overlapping-window tiling of a (channels, y, x) scene: windows of the (high-res) tile size step by tile - 2*halo
+    over the scene, NaN-padded to a whole number of steps.  Windows are extracted a band of window rows at a time
+    as a strided view of the padded scene.
+    """
+
+    def __init__(self, shape: Tuple[int,int], tile_size: Dict[str,int], halo: int ):
+        self.shape: Dict[str,int] = dict( y=shape[0], x=shape[1] )
+        self.tile_size: Dict[str,int] = tile_size
+        self.halo: int = halo
+        assert all( 4*halo <= tile_size[d] for d in ['y','x'] ), f"Inference halo ({halo}) must not exceed a quarter of the tile size {tile_size}"
+        self.stride: Dict[str,int] = { d: tile_size[d] - 2*halo for d in ['y','x'] }
+        self.nwindows: Dict[str,int] = { d: math.ceil( max( self.shape[d]-tile_size[d], 0 ) / self.stride[d] ) + 1 for d in ['y','x'] }
+        self.padded_shape: Dict[str,int] = { d: (self.nwindows[d]-1)*self.stride[d] + tile_size[d] for d in ['y','x'] }
+
+    def pad(self, scene: np.ndarray ) -> np.ndarray:
+        padding = [ (0,0) ]*(scene.ndim-2) + [ (0, self.padded_shape[d]-self.shape[d]) for d in ['y','x'] ]
+        return np.pad( scene, padding, constant_values=np.nan )
+
+    def row_bands(self, nrows: int ) -> Iterator[range]:
+        for r0 in range( 0, self.nwindows['y'], nrows ):
+            yield range( r0, min( r0+nrows, self.nwindows['y'] ) )
+
+    def windows(self, padded_scene: np.ndarray, rows: range ) -> np.ndarray:
+        (ty, tx), (sy, sx) = [ ( dshape['y'], dshape['x'] ) for dshape in [ self.tile_size, self.stride ] ]
+        band: np.ndarray = padded_scene[ :, rows.start*sy: (rows.stop-1)*sy + ty ]
+        view: np.ndarray = np.lib.stride_tricks.sliding_window_view( band, (ty,tx), axis=(1,2) )[ :, ::sy, ::sx ]
+        return np.ascontiguousarray( view.transpose(1,2,0,3,4) ).reshape( -1, band.shape[0], ty, tx )
+
+class WindowBlender(object):
+    """
+    Blends the outputs of an OverlapTiler's windows (at 'scale' times the tiler resolution) into a scene image: each
+    window is weighted by a separable cosine taper over the overlap, the weighted outputs and the weights are summed
+    into scene buffers (torch fold over each band of window rows), and the result is their ratio.  Scene pixels with
+    no valid window are NaN.
+    """
+
+    def __init__(self, tiler: OverlapTiler, nchannels: int, scale: float = 1.0 ):
+        self.nwindows: Dict[str,int] = tiler.nwindows
+        self.tile_size: Dict[str,int] = { d: round( tiler.tile_size[d]*scale ) for d in ['y','x'] }
+        self.stride: Dict[str,int] = { d: round( tiler.stride[d]*scale ) for d in ['y','x'] }
+        self.shape: Dict[str,int] = { d: round( tiler.shape[d]*scale ) for d in ['y','x'] }
+        padded_shape: Tuple[int,int] = tuple( (self.nwindows[d]-1)*self.stride[d] + self.tile_size[d] for d in ['y','x'] )
+        ramp: int = round( 2*tiler.halo*scale )
+        self.window: torch.Tensor = torch.from_numpy( np.outer( taper( self.tile_size['y'], ramp ), taper( self.tile_size['x'], ramp ) ) )
+        self.sums: np.ndarray = np.zeros( (nchannels,)+padded_shape, dtype=np.float32 )
+        self.weights: np.ndarray = np.zeros( padded_shape, dtype=np.float32 )
+
+    def add(self, rows: range, outputs: np.ndarray, valid: np.ndarray ):
+        (nw, nc), (ty, tx) = outputs.shape[:2], outputs.shape[2:]
+        weights: torch.Tensor = self.window.expand( nw, ty, tx ) * torch.from_numpy( valid.astype(np.float32) ).view( nw, 1, 1 )
+        values: torch.Tensor = torch.from_numpy( outputs ) * weights.unsqueeze(1)
+        y0, band_size = rows.start*self.stride['y'], ( (len(rows)-1)*self.stride['y'] + ty, self.weights.shape[1] )
+        fargs = dict( output_size=band_size, kernel_size=(ty,tx), stride=(self.stride['y'],self.stride['x']) )
+        self.sums[ :, y0:y0+band_size[0] ] += torch.nn.functional.fold( values.permute(1,2,3,0).reshape( 1, nc*ty*tx, nw ), **fargs )[0].numpy()
+        self.weights[ y0:y0+band_size[0] ] += torch.nn.functional.fold( weights.permute(1,2,0).reshape( 1, ty*tx, nw ), **fargs )[0,0].numpy()
+
+    def result(self) -> np.ndarray:
+        with np.errstate( invalid='ignore', divide='ignore' ):
+            blended: np.ndarray = self.sums / self.weights
+        return blended[ :, :self.shape['y'], :self.shape['x'] ]
+
 class TileGrid(object):
 
     def __init__(self):
@@ -1,5 +1,6 @@
 import torch, math
 import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
 from .cnn import default_conv
 from sres.base.util.config import cfg
 from typing import Any, Dict, List, Tuple, Type, Optional, Union, Sequence, Mapping
@@ -16,7 +17,8 @@ common_parms = dict(
 	bias=True,
 	batch_norm=False,
 	res_scale=1.0,
-	ups_mode='bicubic'
+	ups_mode='bicubic',
+	checkpoint_segments=0
 )
 
 def init_parms( mparms: Dict[str, Any], custom_parms: Dict[str, Any]) -> Dict[str, Any]:
@@ -36,6 +38,27 @@ class FModule(nn.Module):
 		self.act: nn.Module = nn.ReLU(True)
 		self.wn = lambda x: torch.nn.utils.weight_norm(x)
 
+	@property
+	def checkpointing(self) -> bool:
+		return (self.checkpoint_segments > 0) and self.training and torch.is_grad_enabled()
+
+	def body_forward(self, x: torch.Tensor) -> torch.Tensor:
+		# Activation checkpointing (model.checkpoint_segments > 0): only the inputs of each of the body segments are kept
+		# for backward, activations within a segment are recomputed.
+		# (checkpoint_sequential is not used since it runs its last segment without checkpointing.)
+		if self.checkpointing:
+			nsegments: int = min( self.checkpoint_segments, len(self.body) )
+			bounds: List[int] = [ round( iS*len(self.body)/nsegments ) for iS in range(nsegments+1) ]
+			for s0, s1 in zip( bounds[:-1], bounds[1:] ):
+				x = checkpoint( self.body[s0:s1], x, use_reentrant=False )
+			return x
+		return self.body(x)
+
+	def checkpointed(self, module: nn.Module, x: torch.Tensor) -> torch.Tensor:
+		if self.checkpointing:
+			return checkpoint( module, x, use_reentrant=False )
+		return module(x)
+
 	def __setattr__(self, key: str, value: Any) -> None:
 		if ('parms' in self.__dict__.keys()) and (key in self.parms.keys()):
 			self.parms[key] = value
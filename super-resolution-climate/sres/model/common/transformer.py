@@ -1,5 +1,6 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from sres.model.common.tools import extract_image_patches
 import math
 
@@ -74,8 +75,10 @@ class Mlp(nn.Module):
 		return x
 
 class EffAttention(nn.Module):
-	def __init__(self, dim, num_heads=8, qkv_bias=False, qk_scale=None, attn_drop=0., proj_drop=0.):
+	def __init__(self, dim, num_heads=8, qkv_bias=False, qk_scale=None, attn_drop=0., proj_drop=0., backend='chunked'):
 		super().__init__()
+		assert backend in ['chunked', 'sdpa'], f"Unknown attention backend: {backend}"
+		self.backend = backend
 		self.num_heads = num_heads
 		head_dim = dim // num_heads
 		# NOTE scale factor was wrong in my original version, can set manually to be compat with prev weights
@@ -94,6 +97,26 @@ class EffAttention(nn.Module):
 
 	def forward(self, x):
 		x = self.reduce(x)
+		x = self.attention(x)
+		x = self.proj(x)
+		# x = self.proj_drop(x)
+		return x
+
+	def sdpa_attention(self, q, k, v):
+		# Same block-diagonal attention as the chunked path (each quarter of the sequence attends within itself),
+		# with the chunks folded into the batch dimension of a single scaled_dot_product_attention call.
+		B, H, N, D = q.shape
+		chunk = math.ceil(N // 4)
+		dropout_p = self.attn_drop.p if self.training else 0.
+		if N % chunk == 0:
+			qc, kc, vc = [ t.reshape(B, H * (N // chunk), chunk, D) for t in (q, k, v) ]
+			x = F.scaled_dot_product_attention(qc, kc, vc, dropout_p=dropout_p, scale=self.scale)
+			return x.reshape(B, H, N, D).transpose(1, 2)
+		output = [ F.scaled_dot_product_attention(qc, kc, vc, dropout_p=dropout_p, scale=self.scale).transpose(1, 2)
+		           for qc, kc, vc in zip(*[ torch.split(t, chunk, dim=-2) for t in (q, k, v) ]) ]
+		return torch.cat(output, dim=1)
+
+	def attention(self, x):
 		B, N, C = x.shape
 		# pdb.set_trace()
 		qkv = self.qkv(x).reshape(B, N, 3, self.num_heads, C // self.num_heads).permute(2, 0, 3, 1, 4)
@@ -102,6 +125,8 @@ class EffAttention(nn.Module):
 		# v = x.reshape(B, N, 1, self.num_heads, C // self.num_heads).permute(2, 0, 3, 1, 4)
 		# qkv: 3*16*8*37*96
 		q, k, v = qkv[0], qkv[1], qkv[2]  # make torchscript happy (cannot use tensor as tuple)
+		if self.backend == 'sdpa':
+			return self.sdpa_attention(q, k, v).reshape(B, N, C)
 		# pdb.set_trace()
 
 		q_all = torch.split(q, math.ceil(N // 4), dim=-2)
@@ -123,18 +148,17 @@ class EffAttention(nn.Module):
 		x = torch.cat(output, dim=1)
 		x = x.reshape(B, N, C)
 		# pdb.set_trace()
-		x = self.proj(x)
-		# x = self.proj_drop(x)
 		return x
 
 ## Base block
 class MLABlock(nn.Module):
 	def __init__(
 		self, n_feat=64, dim=768, num_heads=8, mlp_ratio=4., qkv_bias=False, qk_scale=None, drop=0., attn_drop=0.,
-		drop_path=0., act_layer=nn.ReLU, norm_layer=nn.LayerNorm):
+		drop_path=0., act_layer=nn.ReLU, norm_layer=nn.LayerNorm, attention='chunked', fused_patches=False):
 		super(MLABlock, self).__init__()
 		self.dim = dim
-		self.atten = EffAttention(self.dim, num_heads=8, qkv_bias=False, qk_scale=None, attn_drop=0., proj_drop=0.)
+		self.fused_patches = fused_patches
+		self.atten = EffAttention(self.dim, num_heads=8, qkv_bias=False, qk_scale=None, attn_drop=0., proj_drop=0., backend=attention)
 		self.norm1 = nn.LayerNorm(self.dim)
 		# self.posi = PositionEmbeddingLearned(n_feat)
 		self.mlp = Mlp(in_features=dim, hidden_features=dim // 4, act_layer=act_layer, drop=drop)
@@ -155,4 +179,46 @@ class MLABlock(nn.Module):
 
 		x = x + self.atten(self.norm1(x))
 		x = x + self.mlp(self.norm2(x))  # self.drop_path(self.mlp(self.norm2(x)))
-		return x
\ No newline at end of file
+		return x
+
+	def forward_folded(self, x):
+		"""
+		Equivalent to reverse_patches(self(x).permute(0, 2, 1), (H, W), (3, 3), 1, 1), without materializing the
+		(B, H*W, 9*C) tensor of 3x3 patches: linear maps of patches (layer-norm statistics, reduce, and the patch terms of
+		the residual and mlp inputs) are evaluated as 3x3 convolutions of x, and folds of patch-space outputs as transposed
+		convolutions.  Requires the patch dimension to be 9*C and no mlp dropout.
+		"""
+		B, C, H, W = x.shape
+		D = self.dim
+		assert D == 9 * C, f"forward_folded: dim ({D}) must be 9 x channels ({C})"
+		R, P, bP = self.atten.reduce.weight, self.atten.proj.weight, self.atten.proj.bias
+		F1, bF1, F2, bF2 = self.mlp.fc1.weight, self.mlp.fc1.bias, self.mlp.fc2.weight, self.mlp.fc2.bias
+		g1, b1, g2, b2 = self.norm1.weight, self.norm1.bias, self.norm2.weight, self.norm2.bias
+
+		def pconv(z, weight):  # (B, N, out) = patches(z) @ weight.T
+			return F.conv2d(z, weight.reshape(weight.shape[0], C, 3, 3), padding=1).flatten(2).transpose(1, 2)
+
+		def pfold(t, weight):  # fold( t @ weight.T ), weight: (9*C, in)
+			return F.conv_transpose2d(t.transpose(1, 2).reshape(B, -1, H, W), weight.t().reshape(-1, C, 3, 3), padding=1)
+
+		box = x.new_ones(1, 1, 3, 3)
+		s1 = F.conv2d(x.sum(1, keepdim=True), box, padding=1).flatten(1)
+		s2 = F.conv2d((x * x).sum(1, keepdim=True), box, padding=1).flatten(1)
+		mu1 = s1 / D
+		rs1 = torch.rsqrt(s2 / D - mu1 * mu1 + self.norm1.eps).unsqueeze(-1)
+		r = rs1 * (pconv(x, R * g1) - mu1.unsqueeze(-1) * (R @ g1)) + R @ b1
+		if self.atten.reduce.bias is not None: r = r + self.atten.reduce.bias
+		t = self.atten.attention(r)
+
+		sum_v = s1 + t @ P.sum(0) + bP.sum()
+		a2 = ((t @ (P.t() @ P)) * t).sum(-1) + 2 * (t @ (P.t() @ bP)) + bP @ bP
+		sum_v2 = s2 + 2 * ((pconv(x, P.t()) * t).sum(-1) + pconv(x, bP.unsqueeze(0)).squeeze(-1)) + a2
+		mu2 = sum_v / D
+		rs2 = torch.rsqrt(sum_v2 / D - mu2 * mu2 + self.norm2.eps).unsqueeze(-1)
+		F1g = F1 * g2
+		F1g_v = pconv(x, F1g) + t @ (F1g @ P).t() + F1g @ bP
+		h = self.mlp.act(rs2 * (F1g_v - mu2.unsqueeze(-1) * (F1 @ g2)) + F1 @ b2 + bF1)
+
+		count = F.conv2d(x.new_ones(1, 1, H, W), box, padding=1)
+		bias = F.conv_transpose2d(x.new_ones(1, 1, H, W), (bP + bF2).reshape(1, C, 3, 3), padding=1)
+		return x * count + pfold(t, P) + pfold(h, F2) + bias
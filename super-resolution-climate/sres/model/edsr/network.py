@@ -26,7 +26,7 @@ class EDSR(FModule):
 
     def forward(self, x):
         x = self.head(x)
-        res = self.body(x)
+        res = self.body_forward(x)
         res += x
         x = self.tail(res)
         return x
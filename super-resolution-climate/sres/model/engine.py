@@ -0,0 +1,89 @@
+import torch, os, time
+import torch.nn as nn, numpy as np
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, Sequence
+from sres.base.util.config import cfg
+from sres.base.util.logging import lgm
+from sres.base.gpu import to_memory_format
+from sres.model.util import weights_version
+
+TensorOrTensors = Union[torch.Tensor, Sequence[torch.Tensor]]
+BACKENDS = [ 'eager', 'torchscript', 'compile', 'onnx' ]
+
+def engine_dir() -> str:
+	edir = f"{cfg().platform.results}/engines"
+	os.makedirs( edir, 0o777, exist_ok=True )
+	return edir
+
+class InferenceEngine(object):
+	"""
+	Inference wrapper for an SR network specialized to a fixed input shape (batch, channels, y, x).  Backends:
+	'torchscript' traces, freezes and optimizes the model for inference (and saves the artifact under platform.results),
+	'compile' uses torch.compile, 'onnx' exports to ONNX and runs under onnxruntime on the CPU, 'eager' calls the model.
+	Batches smaller than the compiled batch size are zero-padded.
+	"""
+
+	def __init__(self, model: nn.Module, model_name: str, input_shape: Tuple[int,...], backend: str = 'torchscript' ):
+		if backend not in BACKENDS: raise Exception( f"Unknown inference backend '{backend}', must be one of {BACKENDS}")
+		self.model: nn.Module = model
+		self.model_name: str = model_name
+		self.input_shape: Tuple[int,...] = tuple(input_shape)
+		self.backend: str = backend
+		self.device: torch.device = next( model.parameters() ).device
+		self.version: int = weights_version( model )
+		self.noutputs: int = 1
+		self.engine: Callable = self.build()
+
+	def matches(self, model: nn.Module, input_shape: Tuple[int,...], backend: str ) -> bool:
+		shape_match: bool = (tuple(input_shape[1:]) == self.input_shape[1:]) and (input_shape[0] <= self.input_shape[0])
+		return (model is self.model) and shape_match and (backend == self.backend) and (weights_version(model) == self.version)
+
+	def artifact_path(self, ext: str ) -> str:
+		shape: str = 'x'.join( str(s) for s in self.input_shape )
+		return f"{engine_dir()}/{cfg().task.training_version}.{self.model_name}.{shape}.{ext}"
+
+	def example_input(self) -> torch.Tensor:
+		return to_memory_format( torch.randn( *self.input_shape, generator=torch.Generator().manual_seed(0) ).to( self.device ) )
+
+	def build(self) -> Callable:
+		t0 = time.time()
+		self.model.eval()
+		if self.backend == 'eager':
+			engine = self.model
+		elif self.backend == 'torchscript':
+			with torch.no_grad():
+				traced = torch.jit.trace( self.model, self.example_input(), check_trace=False, strict=False )
+				engine = torch.jit.optimize_for_inference( torch.jit.freeze( traced ) )
+			torch.jit.save( engine, self.artifact_path('pt') )
+		elif self.backend == 'compile':
+			engine = torch.compile( self.model, dynamic=False )
+			with torch.no_grad(): engine( self.example_input() )
+		else:
+			engine = self.build_onnx()
+		lgm().log( f" *** InferenceEngine[{self.model_name}:{self.backend}]: built for input{list(self.input_shape)} in {time.time()-t0:.2f} sec", display=True )
+		return engine
+
+	def build_onnx(self) -> Callable:
+		import onnxruntime
+		opath: str = self.artifact_path('onnx')
+		example: torch.Tensor = self.example_input()
+		with torch.no_grad():
+			outputs: TensorOrTensors = self.model( example )
+		self.noutputs = 1 if isinstance( outputs, torch.Tensor ) else len( outputs )
+		output_names: List[str] = [ f"output{i}" for i in range(self.noutputs) ]
+		torch.onnx.export( self.model, (example,), opath, input_names=['input'], output_names=output_names, dynamo=False )
+		options = onnxruntime.SessionOptions()
+		options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+		session = onnxruntime.InferenceSession( opath, options, providers=['CPUExecutionProvider'] )
+		def run_session( input: torch.Tensor ) -> TensorOrTensors:
+			results: List[np.ndarray] = session.run( output_names, dict( input=input.detach().cpu().numpy() ) )
+			tensors: List[torch.Tensor] = [ torch.from_numpy(result).to( input.device ) for result in results ]
+			return tensors[0] if (self.noutputs == 1) else tensors
+		return run_session
+
+	def __call__(self, input: torch.Tensor ) -> TensorOrTensors:
+		nbatch: int = input.shape[0]
+		if (self.backend != 'eager') and (nbatch < self.input_shape[0]):
+			padding: torch.Tensor = input.new_zeros( (self.input_shape[0]-nbatch,) + tuple(input.shape[1:]) )
+			outputs: TensorOrTensors = self.engine( torch.cat( [input, padding] ) )
+			return outputs[:nbatch] if isinstance( outputs, torch.Tensor ) else [ output[:nbatch] for output in outputs ]
+		return self.engine( input )
@@ -12,11 +12,11 @@ def get_model( **config ) -> nn.Module:
 class ESRT(FModule):
 
 	def __init__(self, **kwargs):
-		super(ESRT, self).__init__({}, **kwargs)
+		super(ESRT, self).__init__( dict( attention='chunked', fused_patches=False ), **kwargs)
 		modules_head = [ self.conv(self.nchannels_in, self.nfeatures, self.kernel_size, self.bias) ]
 		modules_body = nn.ModuleList()
 		for i in range(self.nlayers):
-			modules_body.append( Un(n_feats=self.nfeatures, wn=self.wn) )
+			modules_body.append( Un(n_feats=self.nfeatures, wn=self.wn, attention=self.attention, fused_patches=self.fused_patches) )
 
 		modules_tail = [
 			blocks.Upsampler(self.conv, self.scale, self.nfeatures, act=False),
@@ -33,7 +33,7 @@ class ESRT(FModule):
 	def forward(self, x1, x2=None, test=False):
 		x1 = self.head(x1)
 		res2 = x1
-		body_out = [ self.body[i](x1) for i in range(self.nlayers) ]
+		body_out = [ self.checkpointed(self.body[i], x1) for i in range(self.nlayers) ]
 		res1 = torch.cat(body_out, 1)
 		res1 = self.reduce(res1)
 		x1 = self.tail(res1)
@@ -153,7 +153,7 @@ class Updownblock(nn.Module):
 		return self.alise(self.att(self.alise2(torch.cat([x4, high1], dim=1)))) + x
 
 class Un(nn.Module):
-	def __init__(self, n_feats, wn):
+	def __init__(self, n_feats, wn, attention='chunked', fused_patches=False):
 		super(Un, self).__init__()
 		self.encoder1 = Updownblock(n_feats)
 		self.encoder2 = Updownblock(n_feats)
@@ -161,7 +161,7 @@ class Un(nn.Module):
 		self.reduce = blocks.default_conv(3 * n_feats, n_feats, 3)
 		self.weight2 = blocks.Scale(1)
 		self.weight1 = blocks.Scale(1)
-		self.attention = MLABlock(n_feat=n_feats, dim=288)
+		self.attention = MLABlock(n_feat=n_feats, dim=288, attention=attention, fused_patches=fused_patches)
 		self.alise = blocks.default_conv(n_feats, n_feats, 3)
 
 	def forward(self, x):
@@ -171,9 +171,12 @@ class Un(nn.Module):
 		x3 = self.encoder3(x2)
 		out = x3
 		b, c, h, w = x3.shape
-		out = self.attention(self.reduce(torch.cat([x1, x2, x3], dim=1)))
-		out = out.permute(0, 2, 1)
-		out = reverse_patches(out, (h, w), (3, 3), 1, 1)
+		if self.attention.fused_patches:
+			out = self.attention.forward_folded(self.reduce(torch.cat([x1, x2, x3], dim=1)))
+		else:
+			out = self.attention(self.reduce(torch.cat([x1, x2, x3], dim=1)))
+			out = out.permute(0, 2, 1)
+			out = reverse_patches(out, (h, w), (3, 3), 1, 1)
 		out = self.alise(out)
 
 		return self.weight1(x) + self.weight2(out)
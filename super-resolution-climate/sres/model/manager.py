@@ -12,6 +12,7 @@ import importlib, pandas as pd
 from datetime import datetime
 from sres.controller.config import TSet, srRes
 from sres.base.util.array import xa_downsample
+from sres.base.gpu import memory_format
 from sres.data.batch import BatchDataset
 from collections.abc import Iterable
 
@@ -41,13 +42,13 @@ def get_temporal_features( time: np.ndarray = None ) -> Optional[np.ndarray]:
 
 class SRModels:
 
-	def __init__(self,  device: torch.device):
+	def __init__(self,  device: torch.device, dataset: Optional[BatchDataset] = None ):
 		self.model_name = cfg().model.name
 		self.device = device
 		self._sample_input = None
 		self._sample_target = None
 		self.target_variables = cfg().task.target_variables
-		self._dataset: BatchDataset = None
+		self._dataset: Optional[BatchDataset] = dataset
 		self.cids: List[int] = self.get_channel_idxs( self.target_variables )
 		self.model_config = dict( nchannels_in = len(cfg().task.input_variables), nchannels_out = len(cfg().task.target_variables), device = device )
 		if cfg().model.get('use_temporal_features', False ):
@@ -93,7 +94,7 @@ class SRModels:
 	def get_model(self) -> nn.Module:
 		importpath = f"sres.model.{self.model_name}.network"
 		model_package = importlib.import_module(importpath)
-		return model_package.get_model( **self.model_config ).to(self.device)
+		return model_package.get_model( **self.model_config ).to(self.device, memory_format=memory_format())
 
 def rrkey( tset: TSet, **kwargs ) -> str:
 	epoch = kwargs.get('epoch', -1)
@@ -1,3 +1,4 @@
+import torch.nn as nn
 from typing import Any, Dict, List, Tuple, Type, Optional, Union, TypeAlias, Callable, Mapping
 Size2: TypeAlias = Union[int,Tuple[int,int]]
 
@@ -9,4 +10,8 @@ def highest_powerof2(n: int) -> int:
 			res = i
 			break
 
-	return res
\ No newline at end of file
+	return res
+
+def weights_version( model: nn.Module ) -> int:
+	# Changes whenever any parameter of the model is updated in place (optimizer step, load_state_dict).
+	return sum( p._version for p in model.parameters() )
@@ -0,0 +1,12 @@
+import pytest
+from omegaconf import OmegaConf
+from sres.base.util.config import ConfigContext
+
+@pytest.fixture
+def activate( tmp_path ):
+	# Activates a minimal global configuration (results and cache under tmp_path) with the given task settings.
+	def activate_config( **task ):
+		ConfigContext.cfg = OmegaConf.create( dict( platform=dict( results=str(tmp_path/"results"), cache=str(tmp_path/"cache") ), task=dict( name="test", dataset="test", training_version="test", **task ), model=dict( name="test" ), dataset={} ) )
+		return ConfigContext.cfg
+	yield activate_config
+	ConfigContext.cfg = None
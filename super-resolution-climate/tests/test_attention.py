@@ -0,0 +1,26 @@
+import torch, pytest
+from sres.model.common.transformer import EffAttention, MLABlock
+from sres.model.common.tools import reverse_patches
+
+@pytest.mark.parametrize( "ntokens", [ 36, 30 ] )
+def test_sdpa_attention( ntokens ):
+	torch.manual_seed( 0 )
+	chunked = EffAttention( 64, backend='chunked' ).double()
+	sdpa = EffAttention( 64, backend='sdpa' ).double()
+	sdpa.load_state_dict( chunked.state_dict() )
+	x = torch.randn( 2, ntokens, 64, dtype=torch.float64, requires_grad=True )
+	y, ys = chunked( x ), sdpa( x )
+	torch.testing.assert_close( ys, y )
+	g, gs = [ torch.autograd.grad( out.square().sum(), x )[0] for out in (y, ys) ]
+	torch.testing.assert_close( gs, g )
+
+@pytest.mark.parametrize( "shape", [ (6,6), (5,6) ] )
+@pytest.mark.parametrize( "attention", [ 'chunked', 'sdpa' ] )
+def test_forward_folded( shape, attention ):
+	torch.manual_seed( 0 )
+	block = MLABlock( n_feat=32, dim=288, attention=attention ).double()
+	for p in block.parameters():
+		torch.nn.init.normal_( p, std=0.1 )
+	x = torch.randn( 2, 32, *shape, dtype=torch.float64 )
+	reference = reverse_patches( block(x).permute(0,2,1), shape, (3,3), 1, 1 )
+	torch.testing.assert_close( block.forward_folded(x), reference )
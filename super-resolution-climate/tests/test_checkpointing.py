@@ -0,0 +1,23 @@
+import copy, torch, pytest
+from sres.model.edsr.network import EDSR
+
+@pytest.mark.parametrize( "segments", [ 1, 2, 8 ] )
+def test_checkpointed_gradients( activate, segments ):
+	activate()
+	torch.manual_seed( 0 )
+	model = EDSR( nfeatures=8, nlayers=4, downscale_factors=[2] ).double()
+	checkpointed = copy.deepcopy( model )
+	checkpointed.checkpoint_segments = segments
+	assert checkpointed.checkpointing and not model.checkpointing
+	nforward = []
+	checkpointed.body[0].register_forward_pre_hook( lambda module, args: nforward.append(1) )
+	x = torch.randn( 2, 1, 6, 6, dtype=torch.float64 )
+	y, yc = model( x ), checkpointed( x )
+	torch.testing.assert_close( yc, y )
+	y.square().sum().backward()
+	yc.square().sum().backward()
+	assert len(nforward) == 2, "The first body segment should be recomputed in backward"
+	for (name, p), pc in zip( model.named_parameters(), checkpointed.parameters() ):
+		torch.testing.assert_close( pc.grad, p.grad, msg=name )
+	checkpointed.eval()
+	assert not checkpointed.checkpointing
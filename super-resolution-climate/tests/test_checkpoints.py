@@ -0,0 +1,68 @@
+import torch, os
+from typing import List
+from sres.controller.checkpoints import CheckpointManager
+from sres.controller.config import TSet
+
+def checkpoint_manager() -> CheckpointManager:
+	model = torch.nn.Linear( 3, 2 )
+	optimizer = torch.optim.Adam( model.parameters(), lr=0.1 )
+	model( torch.ones(1,3) ).sum().backward()
+	optimizer.step()
+	return CheckpointManager( model, optimizer )
+
+def weights( manager: CheckpointManager ) -> List[torch.Tensor]:
+	return [ p.detach().clone() for p in manager.model.parameters() ]
+
+def test_async_save( activate ):
+	activate( async_checkpoints=True )
+	manager = checkpoint_manager()
+	saved, step = weights( manager ), manager.optimizer.state_dict()['state'][0]['step'].item()
+	manager.save_checkpoint( 2, 5, TSet.Validation, 0.25, 0.5 )
+	with torch.no_grad():
+		for p in manager.model.parameters(): p.zero_()
+	manager.optimizer.state[ next(manager.model.parameters()) ]['step'].fill_( 100.0 )
+	train_state = manager.load_checkpoint( TSet.Validation, update_model=True )
+	assert train_state == dict( epoch=2, itime=5, loss=0.25 )
+	for p, sp in zip( manager.model.parameters(), saved ):
+		torch.testing.assert_close( p.detach(), sp )
+	assert manager.optimizer.state_dict()['state'][0]['step'].item() == step
+
+def test_deferred_save( activate ):
+	activate( async_checkpoints=True, checkpoint_period=3 )
+	manager = checkpoint_manager()
+	assert manager.save_checkpoint( 0, 1, TSet.Train, 0.3, 0.5 ) is None
+	assert manager.save_checkpoint( 0, 2, TSet.Train, 0.2, 0.5 ) is None
+	assert manager.read_index( TSet.Train ) == []
+	manager.flush()
+	assert [ (e['itime'],e['loss']) for e in manager.read_index( TSet.Train ) ] == [ (2,0.2) ]
+	assert manager.save_checkpoint( 0, 3, TSet.Train, 0.1, 0.5 ) is not None
+	manager.wait()
+	assert [ e['itime'] for e in manager.read_index( TSet.Train ) ] == [ 2, 3 ]
+
+def test_rotation( activate ):
+	for keep_best, retained in [ (True,[2,4,5]), (False,[4,5]) ]:
+		activate( async_checkpoints=False, checkpoint_keep=2, checkpoint_keep_best=keep_best )
+		manager = checkpoint_manager()
+		manager.clear_checkpoints()
+		for itime, loss in enumerate( [ 0.5, 0.1, 0.4, 0.3, 0.2 ] ):
+			manager.save_checkpoint( 0, itime, TSet.Validation, loss, 0.5 )
+		assert [ e['seq'] for e in manager.read_index( TSet.Validation ) ] == retained
+		for seq in range( 1, 6 ):
+			assert all( os.path.exists(cpath) == (seq in retained) for cpath in manager.entry_paths( TSet.Validation, seq ).values() )
+
+def test_load_fallback( activate ):
+	activate( async_checkpoints=False )
+	manager = checkpoint_manager()
+	manager.save_checkpoint( 1, 0, TSet.Validation, 0.2, 0.5 )
+	manager.save_checkpoint( 2, 0, TSet.Validation, 0.1, 0.5 )
+	os.remove( manager.entry_paths( TSet.Validation, 2 )['model'] )
+	assert manager.load_checkpoint( TSet.Validation, update_model=True )['epoch'] == 1
+
+def test_legacy_load( activate ):
+	activate()
+	manager, source = checkpoint_manager(), checkpoint_manager()
+	torch.save( dict( model_state_dict=source.model.state_dict(), optimizer_state_dict=source.optimizer.state_dict(), epoch=3, itime=7, loss=0.4 ), manager.checkpoint_path( TSet.Train ) )
+	assert manager.load_checkpoint( TSet.Train, update_model=True ) == dict( epoch=3, itime=7, loss=0.4 )
+	for p, sp in zip( manager.model.parameters(), source.model.parameters() ):
+		torch.testing.assert_close( p, sp )
+	torch.testing.assert_close( manager.optimizer.state_dict()['state'][0]['exp_avg'], source.optimizer.state_dict()['state'][0]['exp_avg'] )
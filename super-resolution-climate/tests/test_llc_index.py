@@ -0,0 +1,30 @@
+import numpy as np, pytest
+from sres.base.source.swot.util import mds2d, llc_roi_index
+
+nx = 4
+
+def reference_roi( field: np.ndarray, roi ) -> np.ndarray:
+	# Full-grid read as done before the roi index: mds2d, east | transposed & flipped west, then the roi subset.
+	east, west = mds2d( field, nx )
+	image: np.ndarray = np.c_[ east, west.T[::-1, :] ]
+	if roi is None: return image
+	y0, x0 = roi.get('y0',0), roi.get('x0',0)
+	return image[ y0:y0+roi.get('ys',image.shape[0]), x0:x0+roi.get('xs',image.shape[1]) ]
+
+@pytest.mark.parametrize( "roi", [ None, dict( y0=3, ys=5 ), dict( x0=2, xs=9, y0=1, ys=10 ), dict( x0=7, xs=20 ) ] )
+def test_llc_roi_index( tmp_path, roi ):
+	rng = np.random.default_rng( 0 )
+	template: np.ndarray = np.where( rng.random( 13*nx*nx ) < 0.3, 0.0, 1.0 ).astype( '>f4' )
+	template_path = str( tmp_path / "template.data" )
+	template.tofile( template_path )
+	mask: np.ndarray = ( template != 0 )
+	packed: np.ndarray = rng.random( int(mask.sum()) ).astype( np.float32 )
+	field: np.ndarray = np.full( template.size, np.nan, dtype=np.float32 )
+	field[mask] = packed
+
+	offsets, positions, roi_shape = llc_roi_index( template_path, roi, nx, chunk_size=7 )
+	image: np.ndarray = np.full( roi_shape, np.nan, dtype=np.float32 )
+	image.flat[positions] = packed[offsets]
+
+	assert np.all( np.diff( offsets ) > 0 )
+	np.testing.assert_array_equal( image, reference_roi( field, roi ) )
@@ -0,0 +1,36 @@
+import numpy as np, xarray as xa, pytest
+from typing import Dict, Optional
+from sres.data.prefetch import timeslice_batch_loader
+
+class StubDataset(object):
+	# Stands in for a BatchDataset: each tile batch is tagged with its time and start tile.
+
+	def __init__(self, ntiles: int ):
+		self.ntiles: int = ntiles
+		self.prepared: bool = False
+
+	def prepare_norms(self):
+		self.prepared = True
+
+	def load_timeslice(self, ctime: int ) -> xa.DataArray:
+		return xa.DataArray( np.zeros( (self.ntiles,1) ), dims=['tiles','channels'] )
+
+	def get_batch_array(self, ctile: Dict[str,int], ctime: int ) -> Optional[xa.DataArray]:
+		if ctile['start'] >= self.ntiles: return None
+		return xa.DataArray( np.full( (min(ctile['end'],self.ntiles)-ctile['start'],1), ctime*100.0 + ctile['start'] ), dims=['tiles','channels'] )
+
+@pytest.mark.parametrize( "num_workers", [ 0, 2 ] )
+def test_timeslice_batch_loader( activate, num_workers ):
+	activate( batch_size=4 )
+	dataset = StubDataset( 10 )
+	loader = timeslice_batch_loader( dataset, [5,6,7,8], seed=0, randomize=True, num_workers=num_workers )
+	assert dataset.prepared
+	loader.sampler.start = 1
+	timeslices = list( loader )
+	assert [ ctime for ctime, ntiles, batches in timeslices ] == [6,7,8]
+	for ctime, ntiles, batches in timeslices:
+		assert ntiles == 10
+		assert sorted( ctile['start'] for ctile, batch in batches ) == [0,4,8]
+		for ctile, batch in batches:
+			assert batch.sizes['tiles'] == min(ctile['end'],10) - ctile['start']
+			assert np.all( batch.values == ctime*100.0 + ctile['start'] )
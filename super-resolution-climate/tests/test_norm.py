@@ -0,0 +1,44 @@
+import numpy as np, xarray as xa, pytest
+pytest.importorskip( "nvidia.dali" )
+from sres.base.source.swot.raw import SWOTRawDataLoader, STATS
+
+channels, ntiles, tile_range = ['a','b'], 10, (3,7)
+
+def norm_loader( rng: np.random.Generator ) -> SWOTRawDataLoader:
+	loader = SWOTRawDataLoader.__new__( SWOTRawDataLoader )
+	stats = {}
+	for channel in channels:
+		mean, var, vmin = rng.normal( size=ntiles ), rng.uniform( 0.5, 2.0, ntiles ), rng.normal( -3.0, 0.1, ntiles )
+		stats[channel] = xa.DataArray( np.stack( [ mean, var, vmin + rng.uniform( 4.0, 6.0, ntiles ), vmin ], axis=-1 ), dims=['tiles','stat'], coords=dict( tiles=np.arange(ntiles), stat=STATS ) )
+	loader._norm_stats, loader._norm_arrays = xa.Dataset( stats ), {}
+	return loader
+
+def reference_norm( loader: SWOTRawDataLoader, batch: np.ndarray, ntype: str ) -> np.ndarray:
+	# Per tile and channel, as in the original (looped) implementation.
+	result = np.empty_like( batch )
+	for ic, channel in enumerate(channels):
+		tstats: xa.DataArray = loader.norm_stats.data_vars[channel]
+		for it in range( batch.shape[0] ):
+			x, tstat = batch[it,ic], tstats.isel( tiles=tile_range[0]+it )
+			if   ntype == 'lnorm':  result[it,ic] = (x - np.nanmean(x)) / np.nanstd(x)
+			elif ntype == 'lscale': result[it,ic] = (x - np.nanmin(x)) / (np.nanmax(x) - np.nanmin(x))
+			elif ntype == 'gnorm':  result[it,ic] = (x - tstats.sel(stat='mean').mean().item()) / np.sqrt( tstats.sel(stat='var').mean().item() )
+			elif ntype == 'gscale': result[it,ic] = (x - tstats.sel(stat='min').min().item()) / (tstats.sel(stat='max').max().item() - tstats.sel(stat='min').min().item())
+			elif ntype == 'tnorm':  result[it,ic] = (x - tstat.sel(stat='mean').item()) / np.sqrt( tstat.sel(stat='var').item() )
+			elif ntype == 'tscale': result[it,ic] = (x - tstat.sel(stat='min').item()) / (tstat.sel(stat='max').item() - tstat.sel(stat='min').item())
+	return result
+
+@pytest.mark.parametrize( "ntype", [ 'lnorm', 'lscale', 'gnorm', 'gscale', 'tnorm', 'tscale' ] )
+def test_norm( activate, ntype ):
+	activate( norm=ntype )
+	rng = np.random.default_rng( 1 )
+	loader = norm_loader( rng )
+	batch: np.ndarray = rng.normal( 2.0, 1.5, ( tile_range[1]-tile_range[0], len(channels), 6, 6 ) ).astype( np.float32 )
+	batch[0,1,2,3] = np.nan
+	batch_data = xa.DataArray( batch, dims=['tiles','channels','y','x'], coords=dict( channels=channels ) )
+	result: xa.DataArray = loader.norm( batch_data, tile_range )
+	np.testing.assert_allclose( result.values, reference_norm( loader, batch, ntype ), rtol=1e-5, atol=1e-5 )
+	if ntype[0] in 'lt':
+		snames = ['std','mean'] if ntype.endswith('norm') else ['max','min']
+		scale = result.attrs[snames[0]] - (0.0 if ntype.endswith('norm') else result.attrs[snames[1]])
+		np.testing.assert_allclose( result.values * scale + result.attrs[snames[1]], batch, rtol=1e-5, atol=1e-5 )
@@ -0,0 +1,32 @@
+import torch, pytest
+from sres.base.gpu import MixedPrecision, autocast_dtype
+
+cpu = torch.device('cpu')
+
+def test_autocast_dtype():
+	assert autocast_dtype( cpu, 'fp32' ) is None
+	for precision in [ 'bf16', 'fp16', 'auto' ]:
+		assert autocast_dtype( cpu, precision ) == torch.bfloat16
+	with pytest.raises( Exception, match="Unknown precision mode" ):
+		autocast_dtype( cpu, 'fp8' )
+
+@pytest.mark.parametrize( "precision, dtype", [ ('fp32',torch.float32), ('bf16',torch.bfloat16) ] )
+def test_mixed_precision( activate, precision, dtype ):
+	activate()
+	mp = MixedPrecision( cpu, precision )
+	assert mp.enabled == (precision != 'fp32')
+	assert not mp.scaler.is_enabled()
+	model, reference = torch.nn.Linear( 4, 2 ), torch.nn.Linear( 4, 2 )
+	reference.load_state_dict( model.state_dict() )
+	optimizer, roptimizer = torch.optim.SGD( model.parameters(), lr=0.1 ), torch.optim.SGD( reference.parameters(), lr=0.1 )
+	x = torch.randn( 3, 4 )
+	with mp.autocast():
+		y = model( x )
+	assert y.dtype == dtype
+	mp.backward( y.float().square().mean() )
+	mp.step( optimizer )
+	reference( x ).square().mean().backward()
+	roptimizer.step()
+	tol: float = 0.0 if (precision == 'fp32') else 2e-2
+	for p, rp in zip( model.parameters(), reference.parameters() ):
+		torch.testing.assert_close( p, rp, rtol=tol, atol=tol )
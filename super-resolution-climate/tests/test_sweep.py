@@ -0,0 +1,42 @@
+import types, threading, pytest
+from sres.base.util.config import ConfigContext, cfg
+from sres.controller.sweep import SweepTrainer, data_config
+from sres.data.prefetch import TimeslicePrefetcher
+
+configuration = dict( platform='platform-deploy', task='SST-tiles-48', dataset='swot_20-20e', pipeline='sres' )
+
+def member( model: str, **overrides ) -> types.SimpleNamespace:
+	# Stands in for a SweepMember: SweepTrainer only checks the member configurations at construction.
+	with ConfigContext( 'sres', model=model, **configuration, **overrides ):
+		return types.SimpleNamespace( cfg=ConfigContext.cfg, model_name=model )
+
+def test_data_config():
+	dconfig = data_config( member('rcan-10-20-64').cfg )
+	assert dconfig['task']['batch_size'] == 36
+	assert dconfig['dataset']['dataset_files'] == "raw/${dataset.varname}/${dataset.varname}.000${dataset.index}.shrunk"
+	assert dconfig['downscale_factors'] == [2,2]
+
+def test_sweep_members():
+	lead = member('rcan-10-20-64')
+	sweep = SweepTrainer( [ lead, member( 'rcan-10-20-64', **{ 'task.lr': 1e-3, 'model.nblocks': 4 } ) ] )
+	assert sweep.lead is lead
+	with pytest.raises( Exception, match="'task' configuration" ):
+		SweepTrainer( [ lead, member( 'rcan-10-20-64', **{ 'task.batch_size': 18 } ) ] )
+	with pytest.raises( Exception, match="'downscale_factors' configuration" ):
+		SweepTrainer( [ lead, member( 'rcan-10-20-64', **{ 'model.downscale_factors': [4] } ) ] )
+
+def test_prefetcher_config():
+	# The prefetch thread keeps reading the configuration it was started under while the sweep swaps the global one.
+	lead, other = member('rcan-10-20-64'), member( 'rcan-10-20-64', **{ 'task.batch_size': 18 } )
+	release = threading.Event()
+	def loader( ctime: int ) -> int:
+		release.wait()
+		return cfg().task.batch_size
+	ConfigContext.cfg = lead.cfg
+	prefetcher = TimeslicePrefetcher( loader, [0,1], 1 )
+	ConfigContext.cfg = other.cfg
+	release.set()
+	assert [ prefetcher.next(0), prefetcher.next(1) ] == [ 36, 36 ]
+	prefetcher.close()
+	ConfigContext.cfg = None
+	assert cfg() is None
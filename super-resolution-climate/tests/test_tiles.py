@@ -0,0 +1,65 @@
+import torch, numpy as np, pytest
+from typing import Dict, Optional
+from sres.data.tiles import TileMosaic, OverlapTiler, WindowBlender
+from sres.controller.dual_trainer import norm_windows, denorm
+
+grid_shape = dict( y=3, x=4 )
+tile_ids = np.array( [0,2,3,5,6,7,9,11] )
+
+def reference_mosaic( tiles: np.ndarray ) -> np.ndarray:
+	# Assembles the image cell by cell: tile k goes to grid cell tile_ids[k], missing cells are NaN.
+	nc, ty, tx = tiles.shape[1:]
+	grid = [ [ np.full( (nc,ty,tx), np.nan, dtype=tiles.dtype ) for ix in range(grid_shape['x']) ] for iy in range(grid_shape['y']) ]
+	for tile, tid in zip( tiles, tile_ids ):
+		grid[ tid // grid_shape['x'] ][ tid % grid_shape['x'] ] = tile
+	return np.block( grid )
+
+@pytest.mark.parametrize( "on_disk", [ False, True ] )
+def test_tile_mosaic( tmp_path, on_disk ):
+	tiles = np.random.default_rng(1).random( (len(tile_ids),2,5,6) ).astype( np.float32 )
+	mosaic = TileMosaic( tile_ids, grid_shape, path=str(tmp_path/"mosaic.npy") if on_disk else None )
+	mosaic.add( tiles[:3] )
+	mosaic.add( tiles[5:], tidx0=5 )
+	mosaic.add( tiles[3:5], tidx0=3 )
+	mosaic.flush()
+	reference = reference_mosaic( tiles )
+	assert mosaic.data.shape == (2,15,24)
+	np.testing.assert_array_equal( mosaic.data, reference )
+	np.testing.assert_array_equal( mosaic.image(1).values, reference[1] )
+	if on_disk:
+		np.testing.assert_array_equal( np.load( tmp_path/"mosaic.npy" ), reference )
+
+def blend( scene: np.ndarray, halo: int, ntype: str, gstats: Optional[Dict[str,np.ndarray]] = None, pool: int = 1 ) -> np.ndarray:
+	# Runs the overlap inference pipeline with an identity (or average-pooling) model in place of the network.
+	tiler = OverlapTiler( scene.shape[1:], dict( y=16, x=16 ), halo )
+	padded: np.ndarray = tiler.pad( scene )
+	blender = WindowBlender( tiler, scene.shape[0], 1.0/pool )
+	for rows in tiler.row_bands( 2 ):
+		windows: np.ndarray = tiler.windows( padded, rows )
+		assert windows.shape == ( len(rows)*tiler.nwindows['x'], scene.shape[0], 16, 16 )
+		valid: np.ndarray = np.isfinite( windows ).any( axis=(2,3) ).all( axis=1 )
+		ndata, stats = norm_windows( windows[valid], ntype, gstats )
+		result: torch.Tensor = torch.nn.functional.avg_pool2d( torch.from_numpy(ndata), pool )
+		outputs: np.ndarray = np.zeros( (windows.shape[0],scene.shape[0])+result.shape[2:], dtype=np.float32 )
+		outputs[valid] = denorm( result, stats )
+		blender.add( rows, outputs, valid )
+	return blender.result()
+
+@pytest.mark.parametrize( "halo", [ 0, 4 ] )
+@pytest.mark.parametrize( "ntype", [ 'lnorm', 'lscale', 'gnorm', 'gscale' ] )
+def test_overlap_blend( halo, ntype ):
+	scene = np.random.default_rng(2).normal( 1.0, 2.0, (2,48,96) ).astype( np.float32 )
+	scene[:,:,64:] = np.nan
+	scene[:,5,7] = np.nan
+	gstats = dict( mean=np.nanmean( scene, axis=(1,2) ), std=np.nanstd( scene, axis=(1,2) ), max=np.nanmax( scene, axis=(1,2) ), min=np.nanmin( scene, axis=(1,2) ) ) if ntype[0] == 'g' else None
+	result: np.ndarray = blend( scene, halo, ntype, gstats )
+	assert result.shape == scene.shape
+	finite: np.ndarray = np.isfinite( scene )
+	np.testing.assert_allclose( result[finite], scene[finite], rtol=1e-4, atol=1e-4 )
+	assert np.isnan( result[:,:,80:] ).all()
+
+def test_overlap_blend_scaled():
+	scene = np.random.default_rng(3).normal( 1.0, 2.0, (2,48,72) ).astype( np.float32 )
+	result: np.ndarray = blend( scene, 4, 'gnorm', dict( mean=scene.mean( axis=(1,2) ), std=scene.std( axis=(1,2) ) ), pool=4 )
+	reference: np.ndarray = torch.nn.functional.avg_pool2d( torch.from_numpy(scene), 4 ).numpy()
+	np.testing.assert_allclose( result, reference, rtol=1e-4, atol=1e-4 )
@@ -0,0 +1,32 @@
+import copy, types, torch, numpy as np, xarray as xa, pytest
+from sres.base.gpu import MixedPrecision
+from sres.controller.dual_trainer import ModelTrainer
+
+def stub_trainer( model: torch.nn.Module ) -> types.SimpleNamespace:
+	# Provides the ModelTrainer state used by train_step: a per-tile conv model with an l2 loss.
+	trainer = types.SimpleNamespace( model=model, optimizer=torch.optim.SGD( model.parameters(), lr=0.1 ), precision=MixedPrecision( torch.device('cpu') ), layer_losses=[] )
+	def apply_network( batch_data: xa.DataArray ):
+		binput = torch.from_numpy( batch_data.values )
+		return binput, trainer.model( binput ), 2.0 * binput
+	def loss_tensors( products: torch.Tensor, target: torch.Tensor ):
+		loss = torch.nn.functional.mse_loss( products, target )
+		trainer.layer_losses = [ loss.detach() ]
+		return loss.detach(), loss
+	trainer.apply_network, trainer.loss_tensors = apply_network, loss_tensors
+	return trainer
+
+@pytest.mark.parametrize( "micro_batches", [ 3, 7 ] )
+def test_micro_batches( activate, micro_batches ):
+	activate()
+	torch.manual_seed( 0 )
+	model = torch.nn.Conv2d( 2, 2, 3, padding=1 )
+	full, accum = stub_trainer( model ), stub_trainer( copy.deepcopy(model) )
+	batch_data = xa.DataArray( np.random.default_rng(0).normal( size=(7,2,8,8) ).astype(np.float32), dims=['tiles','channels','y','x'] )
+	binput, boutput, btarget, sloss = ModelTrainer.train_step( full, batch_data )
+	ainput, aoutput, atarget, asloss = ModelTrainer.train_step( accum, batch_data, micro_batches )
+	torch.testing.assert_close( asloss.float(), sloss, rtol=1e-5, atol=1e-6 )
+	torch.testing.assert_close( aoutput, boutput.detach() )
+	torch.testing.assert_close( atarget, btarget )
+	torch.testing.assert_close( accum.layer_losses[0].float(), sloss, rtol=1e-5, atol=1e-6 )
+	for p, ap in zip( full.model.parameters(), accum.model.parameters() ):
+		torch.testing.assert_close( ap, p, rtol=1e-5, atol=1e-6 )